@@ -0,0 +1,154 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+# 可以直接封装进 MPEG-TS 的音频编码
+TS_AUDIO_CODECS = {'aac', 'ac3', 'dts', 'mp2', 'mp3'}
+# 音频编码名（ffprobe 输出）对应的 FFmpeg 编码器，未列出的与编码名相同
+AUDIO_ENCODERS = {'mp3': 'libmp3lame', 'dts': 'dca', 'opus': 'libopus', 'vorbis': 'libvorbis'}
+# 需要 -strict -2 才能使用的实验性编码器
+EXPERIMENTAL_ENCODERS = {'dca'}
+# 高端音轨（TrueHD、DTS-HD MA、Auro-3D 等）统一转为多声道 AAC
+HIGH_END_TARGET = {'codec': 'aac', 'bitrate': '1920k', 'channels': '6', 'sample_rate': '48000'}
+# 有尾巴时成品经过 TS 拼接，TS 不支持的音频转为 AAC
+TS_FALLBACK_BITRATE = '192k'
+AUDIO_FILE = "audio.mka"
+
+
+def encoder_args(codec):
+    """按音频编码名选择编码器参数。"""
+    encoder = AUDIO_ENCODERS.get(codec, codec)
+    args = ['-c:a', encoder]
+    if encoder in EXPERIMENTAL_ENCODERS:
+        args += ['-strict', '-2']
+    return args
+
+
+def _bps(bitrate):
+    if not bitrate:
+        return 0
+    return int(float(bitrate[:-1]) * 1000) if bitrate.endswith('k') else int(bitrate)
+
+
+@dataclass
+class AudioPlan:
+    """一个任务中成品的音频：直接复制源音轨，或转为 codec；codec 为空表示没有音频。"""
+    codec: str = ''
+    copy: bool = True
+    bitrate: str = ''
+    channels: str = ''
+    sample_rate: str = ''
+    reason: str = ''
+
+    @property
+    def key(self):
+        """写入阶段清单的标识，音频方案变化时重新烧录。"""
+        if not self.codec:
+            return 'none'
+        if self.copy:
+            return f"copy:{self.codec}"
+        return f"{self.codec}:{self.bitrate}:{self.channels}:{self.sample_rate}"
+
+    @property
+    def bitrate_bps(self):
+        """转码时的目标码率（bit/s），复制源音轨时为 0，由调用方按源音轨估算。"""
+        return 0 if self.copy else _bps(self.bitrate)
+
+    def encode_args(self):
+        if not self.codec:
+            return ['-an']
+        if self.copy:
+            return ['-c:a', 'copy']
+        args = encoder_args(self.codec) + ['-b:a', self.bitrate]
+        if self.channels:
+            args += ['-ac', self.channels]
+        if self.sample_rate:
+            args += ['-ar', self.sample_rate]
+        return args
+
+    def output_params(self, params):
+        """根据源视频参数（get_video_params 的结果）推算成品的音频参数。"""
+        params = dict(params)
+        if not self.codec:
+            params['has_audio'] = False
+        elif not self.copy:
+            params['a_codec'] = self.codec
+            params['a_bitrate'] = self.bitrate
+            if self.channels:
+                params['channels'] = self.channels
+            if self.sample_rate:
+                params['sample_rate'] = self.sample_rate
+        return params
+
+
+def plan_audio(audio, high_end_audio, need_ts):
+    """
+    每个任务只决定一次成品音频。audio 为源音轨（probe.StreamInfo，可为 None）；
+    need_ts 为 True 表示成品要经过 TS 拼接尾巴，此时音频必须是 TS 支持的编码。
+    """
+    if audio is None:
+        return AudioPlan(reason="源视频没有音频")
+    if high_end_audio:
+        return AudioPlan(copy=False, reason=f"检测到高端音频格式 {audio.codec_name}，转为 AAC (1920k)",
+                         **HIGH_END_TARGET)
+    if need_ts and audio.codec_name not in TS_AUDIO_CODECS:
+        return AudioPlan(codec='aac', copy=False, bitrate=TS_FALLBACK_BITRATE,
+                         reason=f"音频编码 {audio.codec_name} 不支持 MPEG-TS，转为 AAC ({TS_FALLBACK_BITRATE})")
+    return AudioPlan(codec=audio.codec_name, reason=f"直接复制 {audio.codec_name} 音轨")
+
+
+def audio_encode_command(input_file, plan, output_file):
+    return [
+        'ffmpeg', '-hide_banner', '-y', '-i', input_file,
+        '-map', '0:a:0', '-vn', '-sn', '-dn',
+        *plan.encode_args(),
+        output_file
+    ]
+
+
+class AudioTrack:
+    """
+    需要转码时在独立的 FFmpeg 进程中编码音频，与视频编码同时进行，之后只做流复制混流；
+    复制源音轨时不启动额外进程，混流时直接从源文件复制。
+    """
+
+    def __init__(self, processor, input_file, plan, folder):
+        self.processor = processor
+        self.input_file = input_file
+        self.plan = plan
+        self.separate = bool(plan.codec) and not plan.copy
+        self.path = os.path.join(folder, AUDIO_FILE)
+        self._pool = None
+        self._future = None
+
+    def __enter__(self):
+        if self.separate:
+            self.processor.log(f"音频: {self.plan.reason}，与视频同时编码")
+            self._pool = ThreadPoolExecutor(max_workers=1)
+            self._future = self._pool.submit(
+                self.processor.run_command, audio_encode_command(self.input_file, self.plan, self.path)
+            )
+        return self
+
+    def mux_input(self):
+        """等待音频编码完成，返回混流命令中音频输入的参数。"""
+        if not self.plan.codec:
+            return []
+        if self.separate:
+            self._future.result()
+            return ['-i', self.path]
+        return ['-i', self.input_file]
+
+    def mux_map(self, input_index=1):
+        """混流命令中音频的映射参数，input_index 为 mux_input 在命令中的输入序号。"""
+        if not self.plan.codec:
+            return ['-an']
+        return ['-map', f'{input_index}:a:0', '-c:a', 'copy']
+
+    def __exit__(self, *exc):
+        if self._pool:
+            # 视频失败时也要等音频进程结束，才能删除它的输出
+            self._pool.shutdown(wait=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,280 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import parallel
+import quality
+from engine import BURN_MODES, VideoProcessor
+from quality import choose_encode_settings
+
+
+AUDIO_CODEC_ARGS = {
+    'aac': ['-c:a', 'aac', '-b:a', '128k'],
+    'ac3': ['-c:a', 'ac3', '-b:a', '192k'],
+    'flac': ['-c:a', 'flac'],
+    'opus': ['-c:a', 'libopus', '-b:a', '128k'],
+}
+FRAME_RATE = 24
+
+
+def run_ffmpeg(args):
+    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', *args], check=True)
+
+
+def generate_source(path, size, duration, audio_codec):
+    """testsrc2 画面 + sine 音频，参数固定，每次生成的内容相同。"""
+    run_ffmpeg([
+        '-f', 'lavfi', '-i', f"testsrc2=size={size}:rate={FRAME_RATE}:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        '-map', '0:v', '-map', '1:a',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23', '-pix_fmt', 'yuv420p',
+        '-g', str(FRAME_RATE * 2),
+        '-ac', '2', *AUDIO_CODEC_ARGS[audio_codec],
+        path
+    ])
+
+
+def generate_tail(path, size, duration=3):
+    run_ffmpeg([
+        '-f', 'lavfi', '-i', f"testsrc=size={size}:rate={FRAME_RATE}:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=880:sample_rate=44100:duration={duration}",
+        '-map', '0:v', '-map', '1:a',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '96k',
+        path
+    ])
+
+
+def _ass_time(seconds):
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}.00"
+
+
+def _srt_time(seconds):
+    return f"{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02},000"
+
+
+def generate_subtitles(path, duration, fmt):
+    """每 4 秒一条、显示 3 秒的字幕，正文含逗号，覆盖字幕解析的边界情况。"""
+    starts = range(0, max(int(duration) - 3, 1), 4)
+    if fmt == 'ass':
+        lines = [
+            '[Script Info]', 'ScriptType: v4.00+', 'PlayResX: 1920', 'PlayResY: 1080', '',
+            '[V4+ Styles]',
+            'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, '
+            'Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, '
+            'Shadow, Alignment, MarginL, MarginR, MarginV, Encoding',
+            'Style: Default,Arial,60,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,20,20,40,1',
+            '',
+            '[Events]',
+            'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text',
+        ]
+        lines += [
+            f"Dialogue: 0,{_ass_time(s)},{_ass_time(s + 3)},Default,,0,0,0,,第 {n} 条字幕, with, commas"
+            for n, s in enumerate(starts, 1)
+        ]
+    else:
+        lines = []
+        for n, s in enumerate(starts, 1):
+            lines += [str(n), f"{_srt_time(s)} --> {_srt_time(s + 3)}", f"第 {n} 条字幕, with, commas", '']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def prepare_media(workdir, size, duration, audio_codec, sub_format):
+    """生成（或复用已生成的）测试素材，返回 (视频, 字幕, 尾巴) 路径。"""
+    media_dir = os.path.join(workdir, 'media')
+    os.makedirs(media_dir, exist_ok=True)
+    video = os.path.join(media_dir, f"src_{size}_{duration}s_{audio_codec}.mkv")
+    subtitle = os.path.join(media_dir, f"src_{duration}s.{sub_format}")
+    tail = os.path.join(media_dir, f"tail_{size}.mp4")
+    if not os.path.exists(video):
+        generate_source(video, size, duration, audio_codec)
+    if not os.path.exists(subtitle):
+        generate_subtitles(subtitle, duration, sub_format)
+    if not os.path.exists(tail):
+        generate_tail(tail, size)
+    return video, subtitle, tail
+
+
+def timed(results, key, func):
+    started = time.perf_counter()
+    value = func()
+    results[key] = round(time.perf_counter() - started, 3)
+    return value
+
+
+def select_quality(results, prefix, processor, video, mode):
+    if mode == 'quality':
+        processor.quality_settings = timed(results, f"{prefix}/quality_search",
+                                           lambda: choose_encode_settings(processor, video))
+
+
+def bench_standard(results, prefix, folder, video, subtitle, tail, mode, split_minutes, workers):
+    """逐阶段计时：字幕调整、烧录、分割、拼接尾巴。"""
+    processor = VideoProcessor()
+    burned = os.path.join(folder, 'burned.mp4')
+    select_quality(results, prefix, processor, video, mode)
+    processor.audio_plan = processor.audio_plan_for(video, need_ts=bool(tail))
+    adjusted = timed(results, f"{prefix}/subtitle", lambda: processor.adjust_subtitle_timestamps(subtitle, folder, 0.5))
+    if workers > 1:
+        from parallel import burn_subtitles_parallel
+        timed(results, f"{prefix}/burn", lambda: burn_subtitles_parallel(
+            processor, video, adjusted, burned, mode, workers))
+    else:
+        timed(results, f"{prefix}/burn", lambda: processor.burn_subtitles(video, adjusted, burned, mode))
+    if not os.path.exists(burned):
+        raise RuntimeError(f"烧录失败: {prefix}")
+    segments = timed(results, f"{prefix}/split", lambda: processor.split_video(burned, folder, split_minutes))
+    timed(results, f"{prefix}/tail", lambda: processor.concat_tail(
+        segments, tail, folder, processor.get_video_params(burned), mode, main_info=processor.probe(burned)))
+
+
+def bench_single_pass(results, prefix, folder, video, subtitle, tail, mode, split_minutes):
+    processor = VideoProcessor()
+    select_quality(results, prefix, processor, video, mode)
+    processor.audio_plan = processor.audio_plan_for(video, need_ts=bool(tail))
+    adjusted = timed(results, f"{prefix}/subtitle", lambda: processor.adjust_subtitle_timestamps(subtitle, folder, 0.5))
+    timed(results, f"{prefix}/single_pass", lambda: processor.burn_split_single_pass(
+        video, adjusted, folder, split_minutes, tail, mode))
+
+
+def run_suite(args):
+    results = {}
+    log_path = os.path.join(args.workdir, 'bench_ffmpeg.log')
+    os.makedirs(args.workdir, exist_ok=True)
+    # 合成素材上的烧录速度和试编码结果写入工作目录，不混入用户主目录中真实任务的记录
+    parallel.STATS_FILE = os.path.join(args.workdir, 'bench_stats.json')
+    quality.QUALITY_CACHE_FILE = os.path.join(args.workdir, 'bench_quality.json')
+    for size in args.resolutions:
+        for duration in args.durations:
+            for audio_codec in args.audio:
+                for sub_format in args.subtitles:
+                    video, subtitle, tail = prepare_media(args.workdir, size, duration, audio_codec, sub_format)
+                    for mode in args.modes:
+                        for split_minutes in args.splits:
+                            for variant in args.variants:
+                                prefix = f"{size}/{duration}s/{audio_codec}/{sub_format}/{mode}/split{split_minutes}/{variant}"
+                                folder = tempfile.mkdtemp(dir=args.workdir)
+                                print(f"运行: {prefix}", file=sys.stderr, flush=True)
+                                try:
+                                    # ffmpeg 与处理日志写入文件，避免干扰计时和结果输出
+                                    with open(log_path, 'a', encoding='utf-8') as log, \
+                                            contextlib.redirect_stdout(log):
+                                        if variant == 'single_pass':
+                                            bench_single_pass(results, prefix, folder, video, subtitle, tail,
+                                                              mode, split_minutes)
+                                        elif variant.startswith('parallel'):
+                                            workers = int(variant[len('parallel'):] or os.cpu_count() or 2)
+                                            bench_standard(results, prefix, folder, video, subtitle, tail,
+                                                           mode, split_minutes, workers)
+                                        else:
+                                            bench_standard(results, prefix, folder, video, subtitle, tail,
+                                                           mode, split_minutes, 1)
+                                finally:
+                                    shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """返回 (比较明细, 是否存在退化)。只比较两边都有的项目。"""
+    rows = []
+    regressed = False
+    for key in sorted(results):
+        if key not in baseline.get('results', {}):
+            continue
+        old, new = baseline['results'][key], results[key]
+        ratio = new / old if old else 1.0
+        # 极短的阶段受计时抖动影响大，低于 0.05 秒不判退化
+        is_regression = ratio > 1 + threshold and new - old > 0.05
+        regressed = regressed or is_regression
+        rows.append({'key': key, 'baseline': old, 'current': new, 'ratio': round(ratio, 3),
+                     'regression': is_regression})
+    return rows, regressed
+
+
+def ffmpeg_version():
+    try:
+        output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+        return output.split('\n')[0]
+    except OSError:
+        return 'unknown'
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="在合成素材上对各处理阶段计时")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'videoprocessor-bench'),
+                        help="素材与临时文件目录，生成的素材会复用")
+    parser.add_argument('--resolutions', default='640x360,1280x720', help="逗号分隔的分辨率")
+    parser.add_argument('--durations', default='150', help="逗号分隔的时长（秒）")
+    parser.add_argument('--audio', default='aac,flac', help=f"逗号分隔的音频编码: {','.join(AUDIO_CODEC_ARGS)}")
+    parser.add_argument('--subtitles', default='ass,srt', help="逗号分隔的字幕格式")
+    # size 模式需要每段大小上限，不在默认范围内
+    parser.add_argument('--modes', default=','.join(m for m in BURN_MODES if m != 'size'), help="逗号分隔的烧录模式")
+    parser.add_argument('--splits', default='0,1', help="逗号分隔的分割长度（分钟）")
+    parser.add_argument('--variants', default='standard,single_pass',
+                        help="逗号分隔的流程: standard, single_pass, parallelN（N 个进程）")
+    parser.add_argument('--output', help="结果 JSON 输出路径，默认输出到标准输出")
+    parser.add_argument('--baseline', help="与之比较的基线 JSON")
+    parser.add_argument('--threshold', type=float, default=0.15, help="耗时超过基线的比例阈值，默认 0.15")
+    parser.add_argument('--save-baseline', help="把本次结果另存为基线")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.resolutions = args.resolutions.split(',')
+    args.durations = [int(d) for d in args.durations.split(',')]
+    args.audio = args.audio.split(',')
+    args.subtitles = args.subtitles.split(',')
+    args.modes = args.modes.split(',')
+    args.splits = [int(s) for s in args.splits.split(',')]
+    args.variants = args.variants.split(',')
+    unknown = set(args.audio) - set(AUDIO_CODEC_ARGS)
+    if unknown:
+        raise SystemExit(f"不支持的音频编码: {', '.join(sorted(unknown))}")
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version(),
+        'results': run_suite(args),
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressed = compare(report['results'], baseline, args.threshold)
+        report['comparison'] = {'baseline': args.baseline, 'threshold': args.threshold, 'rows': rows,
+                                'regressed': regressed}
+        for row in rows:
+            flag = '退化' if row['regression'] else ''
+            print(f"{row['key']}: {row['baseline']:.3f}s -> {row['current']:.3f}s ({row['ratio']:.2f}x) {flag}",
+                  file=sys.stderr)
+        if regressed:
+            exit_code = 1
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
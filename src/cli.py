@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+from engine import BURN_MODES, VideoProcessor
+from governor import ResourceGovernor, parse_cpu_list
+from jobqueue import DEFAULT_LEASE_SECONDS, DEFAULT_QUEUE_DB, JobQueue, run_worker
+from library import LibraryScanner
+from metrics import REPORT_NAME, MetricsRecorder
+from planner import format_plan, plan_job
+from progress import format_eta
+from scratch import ScratchManager
+from supervisor import DEFAULT_STALL_SECONDS, JobCancelled, ProcessSupervisor
+from quality import DEFAULT_TARGETS
+from tail_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, TailCache
+
+
+DEFAULT_CONFIG = os.path.join(os.path.expanduser("~"), ".videoprocessor.json")
+DEFAULT_SETTINGS = {
+    "mode": "balanced",
+    "split": 6,
+    "delay": 0.0,
+    "tail": None,
+    "single_pass": False,
+    "workers": 1,
+    "smart_render": False,
+    "concat_workers": None,
+    "tail_cache": DEFAULT_CACHE_DIR,
+    "tail_cache_mb": DEFAULT_MAX_BYTES // 1024 ** 2,
+    "probe_cache": None,
+    "resume": False,
+    "max_part_mb": None,
+    "quality_metric": "ssim",
+    "quality_target": None,
+    "cores": None,
+    "cpu_set": None,
+    "pin": False,
+    "numa": False,
+    "nice": None,
+    "log_file": None,
+    "scratch": None,
+    "stage_timeouts": {},
+    "stall_timeout": DEFAULT_STALL_SECONDS,
+    "metrics": False,
+    "metrics_textfile": None,
+    "cprofile": None,
+}
+
+
+def load_profile(config_path, profile):
+    """
+    读取配置文件中的某个配置方案，配置文件格式:
+    {"default": {"mode": "balanced", "split": 6}, "upload": {"mode": "fast", "split": 9, "delay": 0.5}}
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    if not config_path or not os.path.isfile(config_path):
+        if profile != "default":
+            raise SystemExit(f"配置文件不存在: {config_path}")
+        return settings
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        profiles = json.load(f)
+    if profile not in profiles:
+        if profile != "default":
+            raise SystemExit(f"配置文件中没有配置方案: {profile}")
+        return settings
+
+    unknown = set(profiles[profile]) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise SystemExit(f"配置方案 {profile} 包含未知字段: {', '.join(sorted(unknown))}")
+    settings.update(profiles[profile])
+    return settings
+
+
+class ConsoleProgress:
+    """把进度事件节流后输出到标准错误，阶段结束时总会输出一次。"""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.last_time = 0.0
+
+    def __call__(self, event):
+        now = time.monotonic()
+        if event.stage_percent < 100 and now - self.last_time < self.interval:
+            return
+        self.last_time = now
+        print(f"[进度] {event.describe()}", file=sys.stderr, flush=True)
+
+
+def install_interrupt_handler(processor):
+    """
+    FFmpeg 子进程在单独的进程组中运行，收不到终端的 Ctrl+C；第一次 Ctrl+C 停止当前任务并终止所有子进程，
+    再按一次直接退出。
+    """
+    def interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        processor.cancel()
+
+    signal.signal(signal.SIGINT, interrupt)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="视频一键处理工具：烧录字幕、分割视频、拼接尾巴"
+    )
+    parser.add_argument("folders", nargs="*", help="待处理的文件夹，可一次指定多个")
+    parser.add_argument("--recursive", action="store_true",
+                        help="把文件夹当作片库递归扫描，按文件名、语言标记和集数为每个视频配对字幕，逐个处理")
+    parser.add_argument("--list-jobs", action="store_true", help="与 --recursive 一起使用，只列出扫描到的任务")
+    parser.add_argument("--mode", choices=BURN_MODES, help="字幕烧录模式")
+    parser.add_argument("--quality-metric", choices=sorted(DEFAULT_TARGETS),
+                        help="quality 模式使用的质量指标，默认 ssim")
+    parser.add_argument("--quality-target", type=float,
+                        help="quality 模式的目标质量，默认 ssim 0.98 / psnr 42")
+    parser.add_argument("--split", type=int, help="分割长度（分钟），0 表示不分割")
+    parser.add_argument("--max-part-mb", type=int,
+                        help="每段（含尾巴）大小上限（MB），分割点会同时满足时长与大小要求")
+    parser.add_argument("--delay", type=float, help="字幕时间调整（秒），范围 ±10")
+    parser.add_argument("--tail", help="尾巴视频路径，默认使用文件夹中的 tail 文件")
+    parser.add_argument("--no-tail", action="store_true", help="不拼接尾巴视频")
+    parser.add_argument("--single-pass", action="store_true", default=None,
+                        help="一次编码完成烧录、分割和拼接，不生成完整的中间文件")
+    parser.add_argument("--resume", action="store_true", default=None,
+                        help="记录阶段清单并保留中间文件，重跑时跳过输入未变化的阶段，中断后可继续")
+    parser.add_argument("--workers", type=int,
+                        help="并行烧录的进程数，按关键帧分块同时编码，默认 1（单进程）")
+    parser.add_argument("--smart-render", action="store_true", default=None,
+                        help="只重新编码带字幕的 GOP，其余部分直接流复制（需要闭合 GOP 的 H.264 源视频）")
+    parser.add_argument("--concat-workers", type=int, help="并发拼接尾巴的进程数，默认按 CPU 数自动决定")
+    parser.add_argument("--cores", type=int, help="所有编码进程共用的核心数上限，默认使用全部可用核心")
+    parser.add_argument("--cpu-set", help="限定使用的 CPU 编号，如 0-7,16-23；同机运行多个本程序进程时必须各自指定不重叠的范围")
+    parser.add_argument("--pin", action="store_true", default=None, help="用 taskset 把每个编码进程绑定到分配给它的核心上（仅 Linux）")
+    parser.add_argument("--numa", action="store_true", default=None, help="绑核时尽量把同一进程的核心分在同一个 NUMA 节点内")
+    parser.add_argument("--nice", type=int, help="FFmpeg 子进程的 nice 值（仅 Linux/macOS）")
+    parser.add_argument("--tail-cache", help="尾巴转码缓存目录")
+    parser.add_argument("--tail-cache-mb", type=int, help="尾巴转码缓存容量上限（MB）")
+    parser.add_argument("--no-tail-cache", action="store_true", help="不使用尾巴转码缓存")
+    parser.add_argument("--probe-cache", help="ffprobe 结果的磁盘缓存目录，默认只缓存在内存中")
+    parser.add_argument("--scratch", help="中间文件（burned.mp4、调整后的字幕等）存放目录，可指向 SSD 或 tmpfs")
+    parser.add_argument("--timeout", action="append", dest="stage_timeouts", metavar="STAGE=SECONDS",
+                        help="某阶段（burn、split、tail、probe、quality 等）中单个 FFmpeg 进程的最长运行秒数，可多次指定")
+    parser.add_argument("--stall-timeout", type=int,
+                        help=f"FFmpeg 多少秒没有进展即判定为卡死并终止，0 表示不检测，默认 {DEFAULT_STALL_SECONDS}")
+    parser.add_argument("--metrics", action="store_true", default=None,
+                        help=f"把各阶段的耗时、CPU 时间、读写字节数、FFmpeg 帧率/倍速和峰值内存写入输出文件夹的 {REPORT_NAME}")
+    parser.add_argument("--metrics-textfile", metavar="PATH",
+                        help="每个任务结束后把各阶段统计写成 Prometheus 文本格式文件，供 node exporter 的 textfile 收集器读取")
+    parser.add_argument("--cprofile", metavar="DIR", help="用 cProfile 分析 Python 侧的处理流程，每个任务写出一个 .prof 文件")
+    parser.add_argument("--log-file", help="把完整日志（含 FFmpeg 输出）写入按大小轮转的日志文件")
+    parser.add_argument("--plan", action="store_true",
+                        help="只预演：列出将执行的命令、中间文件大小、磁盘需求和各阶段耗时估算，不处理")
+    parser.add_argument("--no-calibrate", action="store_true",
+                        help="与 --plan 一起使用，没有缓存的校准结果时不试编码，只按历史烧录速度估算")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_DB, help="任务队列数据库（SQLite 文件），多台主机可共享")
+    parser.add_argument("--enqueue", action="store_true", help="不立即处理，把文件夹按当前设置加入任务队列")
+    parser.add_argument("--priority", type=int, default=0, help="加入队列的任务优先级，越大越先处理")
+    parser.add_argument("--worker", action="store_true", help="作为工作进程循环领取并处理队列中的任务")
+    parser.add_argument("--once", action="store_true", help="与 --worker 一起使用，队列为空时退出")
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                        help="任务租约时长（秒），工作进程崩溃后超过这个时间任务会被重新领取")
+    parser.add_argument("--queue-status", action="store_true", help="列出队列中的任务")
+    parser.add_argument("--cancel", type=int, metavar="ID", help="取消队列中的任务")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="配置文件路径")
+    parser.add_argument("--profile", default="default", help="使用的配置方案名称")
+    parser.add_argument("--gui", action="store_true", help="启动图形界面")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.gui:
+        # 仅在启动图形界面时才导入 tkinter
+        from main4 import main as gui_main
+        gui_main()
+        return 0
+
+    if args.queue_status:
+        for job in JobQueue(args.queue).status():
+            print(f"#{job['id']} [{job['state']}] 优先级 {job['priority']} 尝试 {job['attempts']}/{job['max_attempts']} "
+                  f"{job['video'] or job['folder']}" + (f" 错误: {job['error']}" if job['error'] else ""))
+        return 0
+    if args.cancel is not None:
+        if JobQueue(args.queue).cancel(args.cancel):
+            print(f"已取消任务 #{args.cancel}")
+            return 0
+        print(f"任务 #{args.cancel} 不存在或已结束", file=sys.stderr)
+        return 1
+
+    if not args.folders and not args.worker:
+        parser.error("至少需要指定一个文件夹")
+
+    settings = load_profile(args.config, args.profile)
+    profile_timeouts = dict(settings["stage_timeouts"])
+    for key in DEFAULT_SETTINGS:
+        value = getattr(args, key)
+        if value is not None:
+            settings[key] = value
+    if args.no_tail:
+        settings["tail"] = None
+    if args.stage_timeouts:
+        # 命令行给出的阶段时限叠加在配置方案的时限之上
+        settings["stage_timeouts"] = profile_timeouts
+        for item in args.stage_timeouts:
+            stage, _, seconds = item.partition("=")
+            try:
+                seconds = float(seconds)
+            except ValueError:
+                seconds = 0
+            if not stage.strip() or seconds <= 0:
+                parser.error(f"无法解析的阶段时限: {item}，格式为 阶段=秒数")
+            settings["stage_timeouts"][stage.strip()] = seconds
+    if settings["stall_timeout"] is not None and settings["stall_timeout"] < 0:
+        parser.error("--stall-timeout 不能为负数")
+
+    if settings["mode"] not in BURN_MODES:
+        parser.error(f"未知的烧录模式: {settings['mode']}")
+    if settings["mode"] == "size" and not settings["max_part_mb"]:
+        parser.error("size 模式需要同时指定 --max-part-mb")
+    if settings["quality_metric"] not in DEFAULT_TARGETS:
+        parser.error(f"未知的质量指标: {settings['quality_metric']}")
+    if settings["split"] < 0:
+        parser.error("分割长度不能为负数")
+    if settings["max_part_mb"] is not None and settings["max_part_mb"] <= 0:
+        parser.error("每段大小上限必须大于 0")
+    if not -10.0 <= settings["delay"] <= 10.0:
+        parser.error("字幕时间调整范围为 ±10 秒")
+    if settings["workers"] < 1:
+        parser.error("并行进程数至少为 1")
+    if settings["concat_workers"] is not None and settings["concat_workers"] < 1:
+        parser.error("拼接进程数至少为 1")
+    if settings["cores"] is not None and settings["cores"] < 1:
+        parser.error("核心数至少为 1")
+    try:
+        cpu_set = parse_cpu_list(settings["cpu_set"]) if settings["cpu_set"] else None
+    except ValueError:
+        parser.error(f"无法解析的 CPU 编号: {settings['cpu_set']}")
+    if settings["tail"] and not os.path.isfile(settings["tail"]):
+        parser.error(f"尾巴视频不存在: {settings['tail']}")
+
+    governor = ResourceGovernor(settings["cores"], cpu_set, settings["pin"], settings["numa"], settings["nice"])
+    if settings["pin"] and not governor.taskset:
+        parser.error("--pin 需要 taskset 命令（Linux 的 util-linux 软件包），当前系统中找不到")
+
+    tail_cache = None
+    if not args.no_tail_cache and settings["tail_cache"]:
+        tail_cache = TailCache(settings["tail_cache"], settings["tail_cache_mb"] * 1024 ** 2)
+    processor = VideoProcessor(
+        progress_callback=ConsoleProgress(),
+        tail_cache=tail_cache,
+        concat_workers=settings["concat_workers"],
+        probe_cache_dir=settings["probe_cache"],
+        governor=governor,
+        log_file=settings["log_file"],
+        scratch=ScratchManager(settings["scratch"]),
+        supervisor=ProcessSupervisor(settings["stage_timeouts"], settings["stall_timeout"] or None),
+        metrics=MetricsRecorder(settings["metrics"], settings["metrics_textfile"], settings["cprofile"])
+    )
+    install_interrupt_handler(processor)
+    if not args.enqueue and not processor.check_ffmpeg():
+        print("未检测到FFmpeg，请先安装并添加到系统PATH", file=sys.stderr)
+        return 2
+    if args.worker:
+        try:
+            handled = run_worker(JobQueue(args.queue), processor, lease_seconds=args.lease_seconds, once=args.once)
+        except JobCancelled:
+            processor.log("工作进程被中断，当前任务已放回队列", error=True)
+            return 130
+        processor.log(f"工作进程退出，共处理 {handled} 个任务")
+        return 0
+
+    options = {
+        "mode": settings["mode"],
+        "split_minutes": settings["split"],
+        "delay": settings["delay"],
+        "single_pass": settings["single_pass"],
+        "workers": settings["workers"],
+        "smart_render": settings["smart_render"],
+        "resume": settings["resume"],
+        "max_part_mb": settings["max_part_mb"],
+        "quality_metric": settings["quality_metric"],
+        "quality_target": settings["quality_target"],
+    }
+
+    # (输出目录, 视频, 字幕, 尾巴)，不递归扫描时视频和字幕由引擎在文件夹中查找
+    jobs = [(folder, None, None, None) for folder in args.folders]
+    if args.recursive:
+        jobs = []
+        for root in args.folders:
+            scanner = LibraryScanner(root)
+            found = scanner.scan()
+            processor.log(f"扫描 {root}: {len(found)} 个任务，{scanner.rescanned} 个目录有变化")
+            jobs += [(job.output_dir, job.video, job.subtitle, job.tail) for job in found]
+        if args.list_jobs:
+            for output_dir, video, subtitle, tail in jobs:
+                print(f"{video}\n  字幕: {subtitle}\n  尾巴: {tail or '无'}\n  输出: {output_dir}")
+            return 0
+
+    if args.enqueue:
+        queue = JobQueue(args.queue)
+        for folder, video, subtitle, job_tail in jobs:
+            tail = settings["tail"] or ("" if args.no_tail else job_tail)
+            job_id = queue.enqueue(folder, options, args.priority, video, subtitle,
+                                   os.path.abspath(tail) if tail else tail)
+            processor.log(f"已加入队列 #{job_id}: {video or folder}")
+        return 0
+
+    failed = []
+    planned_seconds = 0.0
+    for folder, video, subtitle, job_tail in jobs:
+        if processor.supervisor.cancelled:
+            processor.log("已中断，跳过剩余任务", error=True)
+            return 130
+        # 片库任务的尾巴来自扫描结果，否则为 None 时由引擎使用文件夹中的 tail 文件
+        tail = settings["tail"] or ("" if args.no_tail else job_tail)
+        if args.plan:
+            try:
+                plan = plan_job(processor, folder, tail_path=tail, video_path=video, subtitle_path=subtitle,
+                                calibrate_encode=not args.no_calibrate, **options)
+            except Exception as e:
+                processor.log(f"预演失败 {video or folder}: {str(e)}", error=True)
+                failed.append(video or folder)
+                continue
+            print(format_plan(plan))
+            print()
+            if planned_seconds is not None:
+                planned_seconds = None if plan.total_seconds is None else planned_seconds + plan.total_seconds
+            continue
+        processor.log(f"开始处理: {video or folder}")
+        try:
+            outputs = processor.process_video(
+                folder,
+                tail_path=tail,
+                video_path=video,
+                subtitle_path=subtitle,
+                **options
+            )
+            for output in outputs:
+                processor.log(f"输出文件: {output}")
+        except Exception as e:
+            processor.log(f"处理失败 {video or folder}: {str(e)}", error=True)
+            failed.append(video or folder)
+    if processor.supervisor.cancelled:
+        return 130
+
+    if args.plan and len(jobs) > 1:
+        print(f"全部 {len(jobs)} 个任务预计总耗时: {format_eta(planned_seconds)}")
+    if failed:
+        processor.log(f"共 {len(failed)} 个文件夹处理失败: {', '.join(failed)}", error=True)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# 拼接时必须一致的视频流参数（对应 SPS 中的内容以及封装层的帧率、时间基）
+VIDEO_FIELDS = (
+    'codec_name', 'profile', 'level', 'width', 'height', 'pix_fmt',
+    'r_frame_rate', 'time_base',
+)
+VIDEO_RAW_FIELDS = (
+    'sample_aspect_ratio', 'field_order', 'color_range', 'color_space',
+    'color_transfer', 'color_primaries', 'chroma_location', 'refs',
+)
+AUDIO_FIELDS = ('codec_name', 'profile', 'sample_rate', 'channels', 'channel_layout')
+COPYABLE_VIDEO_CODECS = {'h264'}
+
+
+def _diff(main, tail, fields, raw=False):
+    for name in fields:
+        main_value = main.raw.get(name) if raw else getattr(main, name)
+        tail_value = tail.raw.get(name) if raw else getattr(tail, name)
+        # ffprobe 对未知值输出 unknown 或不输出，二者视为相同
+        if main_value in (None, '', 'unknown') and tail_value in (None, '', 'unknown'):
+            continue
+        if main_value != tail_value:
+            return f"{name} 不一致（主视频 {main_value}，尾巴 {tail_value}）"
+    return None
+
+
+def check_video_compat(main_video, other_video, fields=VIDEO_FIELDS):
+    """比较两条视频流能否直接拼接（不含编码格式检查），返回不一致的原因，一致时返回 None。"""
+    return _diff(main_video, other_video, fields) or _diff(main_video, other_video, VIDEO_RAW_FIELDS, raw=True)
+
+
+def check_tail_compat(main, tail, ts_audio_codecs):
+    """
+    判断尾巴能否不解码、直接流复制后与主视频拼接。main、tail 为 probe.MediaInfo，
+    返回 (是否兼容, 原因)。
+    """
+    main_video, tail_video = main.video, tail.video
+    if not main_video or not tail_video:
+        return False, "缺少视频流"
+    if tail_video.codec_name not in COPYABLE_VIDEO_CODECS:
+        return False, f"尾巴视频编码为 {tail_video.codec_name}，不是 H.264"
+    reason = check_video_compat(main_video, tail_video)
+    if reason:
+        return False, f"视频{reason}"
+
+    main_audio, tail_audio = main.audio, tail.audio
+    if bool(main_audio) != bool(tail_audio):
+        return False, "主视频与尾巴只有一方带音频"
+    if main_audio:
+        if tail_audio.codec_name not in ts_audio_codecs:
+            return False, f"尾巴音频编码 {tail_audio.codec_name} 无法封装进 MPEG-TS"
+        reason = _diff(main_audio, tail_audio, AUDIO_FIELDS)
+        if reason:
+            return False, f"音频{reason}"
+    return True, "编码、档次/级别、分辨率、像素格式、帧率、时间基与音频布局均一致"
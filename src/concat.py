@@ -0,0 +1,140 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_concat_workers():
+    # 拼接只做流复制，瓶颈在磁盘，开太多进程反而互相抢占
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def ts_audio_args(main_params, ts_audio_codecs):
+    """
+    按主视频音频参数一次性决定转 TS 时的音频处理方式，各段不再单独探测。
+    音频方案（audio_plan）已保证有尾巴时成品音频是 TS 支持的编码，这里只为此前生成的中间文件兜底。
+    """
+    if not main_params.get('has_audio') or main_params['a_codec'].lower() in ts_audio_codecs:
+        return ['-c:a', 'copy']
+    return ['-c:a', 'aac', '-b:a', '192k']
+
+
+def write_concat_list(list_file, inputs):
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for item in inputs:
+            path = item if item.startswith('pipe:') else os.path.normpath(item).replace("\\", "/")
+            f.write(f"file '{path}'\n")
+
+
+def concat_command(list_file, output_file, protocols=None):
+    cmd = ['ffmpeg', '-f', 'concat', '-safe', '0']
+    if protocols:
+        cmd += ['-protocol_whitelist', protocols]
+    cmd += ['-i', list_file, '-c', 'copy', '-movflags', '+faststart', '-y', output_file]
+    return cmd
+
+
+def segment_ts_command(segment_mp4, audio_args, output):
+    """把分段 MP4 无损转为 TS，output 可以是 pipe:1。"""
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', segment_mp4,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c:v', 'copy', *audio_args,
+        '-bsf:v', 'h264_mp4toannexb',
+        '-f', 'mpegts', output
+    ]
+
+
+def append_tail_piped(processor, segment_mp4, tail_ts, output_file, audio_args, list_file):
+    """
+    把分段 MP4 实时转成 TS 写入管道，拼接进程通过 concat 列表里的 pipe:N 直接读取，
+    不在磁盘上生成每段的 TS 副本。
+    """
+    read_fd, write_fd = os.pipe()
+    producer = None
+    failed = True
+    try:
+        producer = processor.supervisor.spawn(
+            segment_ts_command(segment_mp4, audio_args, 'pipe:1'),
+            stdout=write_fd,
+            stderr=subprocess.PIPE
+        )
+        os.close(write_fd)
+        write_fd = None
+
+        write_concat_list(list_file, [f"pipe:{read_fd}", tail_ts])
+        processor.run_command(
+            concat_command(list_file, output_file, protocols='file,pipe'),
+            pass_fds=(read_fd,),
+            progress_task=('tail', output_file)
+        )
+        failed = False
+    finally:
+        if write_fd is not None:
+            os.close(write_fd)
+        os.close(read_fd)
+        if producer is not None:
+            # 拼接进程失败或任务被取消时管道已没有读者，直接终止生产者
+            if failed:
+                processor.supervisor.stop(producer)
+            stderr = producer.stderr.read()
+            producer.wait()
+            processor.supervisor.release(producer)
+            if producer.returncode != 0 and not failed:
+                raise RuntimeError(f"分段转 TS 失败: {segment_mp4}: {stderr.decode('utf-8', 'replace').strip()}")
+
+
+def append_tail_via_file(processor, segment_mp4, tail_ts, output_file, audio_args, list_file):
+    """不支持管道传递文件描述符的平台（Windows）上，先写出该段的 TS 再拼接。"""
+    seg_ts = f"{os.path.splitext(list_file)[0]}.ts"
+    try:
+        processor.run_command(segment_ts_command(segment_mp4, audio_args, seg_ts))
+        write_concat_list(list_file, [seg_ts, tail_ts])
+        processor.run_command(concat_command(list_file, output_file), progress_task=('tail', output_file))
+    finally:
+        if os.path.exists(seg_ts):
+            os.remove(seg_ts)
+
+
+def concat_segments_with_tail(processor, jobs, tail_ts, main_params, ts_audio_codecs, workers=None,
+                              keep_segments=False, on_done=None):
+    """
+    在有界线程池中并发地给每段拼接尾巴。jobs 为 (分段路径, 成品路径) 列表，
+    分段可以是 MP4（经管道转 TS）或已经是 TS。每个任务使用自己的 concat 列表文件。
+    keep_segments 为 True 时保留分段，供断点续跑时复用；on_done 在每段拼接完成后
+    以 (分段路径, 成品路径) 调用（在线程池中），其他段失败不影响已完成的段。
+    """
+    workers = workers or default_concat_workers()
+    audio_args = ts_audio_args(main_params, ts_audio_codecs)
+    use_pipe = os.name == 'posix'
+
+    def run_job(job):
+        segment_path, output_file = job
+        list_file = f"{os.path.splitext(output_file)[0]}_concat.txt"
+        try:
+            if segment_path.endswith('.ts'):
+                write_concat_list(list_file, [segment_path, tail_ts])
+                processor.run_command(concat_command(list_file, output_file), progress_task=('tail', output_file))
+            elif use_pipe:
+                append_tail_piped(processor, segment_path, tail_ts, output_file, audio_args, list_file)
+            else:
+                append_tail_via_file(processor, segment_path, tail_ts, output_file, audio_args, list_file)
+        except BaseException:
+            # 只删除本段写了一半的成品，其他段已拼接好的成品保留
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
+        finally:
+            if os.path.exists(list_file):
+                os.remove(list_file)
+        if on_done:
+            on_done(segment_path, output_file)
+        if not keep_segments:
+            os.remove(segment_path)
+        processor.log(f"已拼接尾巴: {os.path.basename(output_file)}")
+        return output_file
+
+    processor.log(f"并发拼接尾巴: {len(jobs)} 段，{min(workers, len(jobs))} 个进程")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+    # 全部段结束后才报告错误，一段失败不会让尚未开始的段被取消
+    return [future.result() for future in futures]
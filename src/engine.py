@@ -0,0 +1,1076 @@
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import time
+from datetime import datetime
+
+from audio_plan import TS_AUDIO_CODECS, AudioTrack, encoder_args, plan_audio
+from compat import check_tail_compat
+from concat import concat_segments_with_tail
+from fonts import JOB_FONTS_DIR, FontCache, prepare_fonts
+from governor import ResourceGovernor
+from logbuffer import ConsoleLog, RateLimiter, is_stats_line, open_log_file
+from manifest import MANIFEST_NAME, JobManifest, file_fingerprint
+from metrics import MetricsRecorder
+from parallel import burn_subtitles_parallel, record_burn_speed
+from probe import MediaProbe
+from split_planner import load_packet_index, plan_split, segment_times_arg
+from scratch import ScratchManager, estimate_output_bytes
+from smartrender import burn_subtitles_smart
+from progress import ProgressTracker, parse_progress_line, progress_args
+from quality import cached_encode_settings, choose_encode_settings
+from size_budget import audio_bitrate, longest_part_seconds, plan_size_budget
+from subtitles import SubtitleFile
+from supervisor import ProcessSupervisor
+
+BURN_MODES = ("lossless", "balanced", "fast", "quality", "size")
+SPLIT_LENGTHS = (0, 6, 9, 12, 15)
+# 准备尾巴时在分段目录中写出的临时文件（转码结果、音频重编码结果、TS）
+TAIL_TEMP_FILES = ("transcoded_tail.mp4", "transcoded_tail_reencoded.mp4", "tail.ts")
+
+class VideoProcessor:
+    """
+    视频处理核心：烧录字幕、分割视频、拼接尾巴。
+    不依赖 tkinter，GUI 与命令行共用，通过回调输出日志与进度。
+    """
+
+    def __init__(self, log_callback=None, output_callback=None, progress_callback=None, tail_cache=None,
+                 concat_workers=None, probe_cache_dir=None, governor=None, log_file=None, scratch=None,
+                 font_cache=None, supervisor=None, metrics=None):
+        # 没有界面时日志与 FFmpeg 输出交给 ConsoleLog，由它限制写到控制台的行数
+        console = ConsoleLog() if not (log_callback and output_callback) else None
+        self.log_callback = log_callback or console.log
+        self.output_callback = output_callback or console.output
+        # 进度回调接收 progress.ProgressEvent，GUI 与命令行共用
+        self.progress = ProgressTracker(progress_callback)
+        # 转码后尾巴的缓存（tail_cache.TailCache），为 None 时每次重新转码
+        self.tail_cache = tail_cache
+        # 并发拼接尾巴的进程数，为 None 时按 CPU 数自动决定
+        self.concat_workers = concat_workers
+        # 所有外部进程的启动、超时、卡死检测与取消（supervisor.ProcessSupervisor）
+        self.supervisor = supervisor or ProcessSupervisor()
+        # 各阶段的耗时、子进程资源消耗与性能报告（metrics.MetricsRecorder）
+        self.metrics = metrics or MetricsRecorder()
+        self.supervisor.listeners.append(self.metrics.on_process)
+        # 同一任务中所有阶段共用一次 ffprobe 的结果
+        self.media_probe = MediaProbe(probe_cache_dir, self.supervisor)
+        # 编码进程的 CPU 预算、线程数与绑核（governor.ResourceGovernor）
+        self.governor = governor or ResourceGovernor()
+        # 完整日志写入轮转的日志文件；FFmpeg 统计行转发给界面/控制台时限制为每秒一行
+        self.file_log = open_log_file(log_file) if log_file else None
+        self.stats_limiter = RateLimiter(1.0)
+        # 中间文件的存放位置、磁盘空间预检与失败清理（scratch.ScratchManager）
+        self.scratch = scratch or ScratchManager()
+        # quality 模式下试编码选出的 {'preset', 'crf', ...}，处理每个视频前重新确定
+        self.quality_settings = None
+        # size 模式下按每段大小上限算出的 VBV 上限 {'maxrate', 'bufsize'}
+        self.size_settings = None
+        # 本任务成品音频的方案（audio_plan.AudioPlan），处理每个视频前决定一次，之后各阶段不再转码音频
+        self.audio_plan = None
+        # 字幕引用的字体按内容哈希缓存（fonts.FontCache），每个任务只放入用到的字体
+        self.font_cache = font_cache or FontCache()
+        # 本任务的字体目录，作为 subtitles 滤镜的 fontsdir；为 None 时 libass 只使用系统字体
+        self.fonts_dir = None
+
+    def probe(self, path):
+        return self.media_probe.probe(path)
+
+    def run_stage(self, manifest, stage, inputs, func, paths=()):
+        """
+        执行一个阶段并返回其输出文件列表。启用清单时，输入未变且输出完好的阶段直接复用上次结果。
+        阶段失败时删除 paths（该阶段自己的输出与临时文件，文件名可含通配符）中新建或改写的文件。
+        """
+        fresh = bool(manifest) and manifest.is_fresh(stage, inputs)
+        with self.metrics.stage(stage, skipped=fresh):
+            if fresh:
+                self.log(f"阶段 {stage} 的输入未变化，跳过并复用上次的输出")
+                return manifest.outputs(stage)
+            if manifest:
+                # 先作废旧记录，阶段中途被中断时下次会重做
+                manifest.invalidate(stage)
+            with self.scratch.guard(*paths):
+                outputs = func()
+            if manifest:
+                manifest.record(stage, inputs, outputs)
+            return outputs
+
+    def process_video(self, folder, mode, split_minutes, delay=0.0, tail_path=None, single_pass=False,
+                      workers=1, resume=False, max_part_mb=None, quality_metric='ssim', quality_target=None,
+                      video_path=None, subtitle_path=None, smart_render=False):
+        """
+        resume 为 True 时在文件夹中维护阶段清单，并保留 burned.mp4 和分段等中间文件，
+        重跑时只重做输入发生变化的阶段，也可以在中断后继续。
+        mode 为 quality 时先试编码采样片段，选出达到 quality_target（ssim/psnr）的最快预设和 CRF。
+        mode 为 size 时按 max_part_mb 和分割方案算出码率上限，各段加上尾巴一次编码即可满足大小上限。
+        给出 video_path 和 subtitle_path（如 library.LibraryScanner 扫描出的任务）时不再在 folder 中查找，
+        folder 只作为输出目录。
+        smart_render 为 True 时只重新编码带字幕的 GOP，其余部分直接流复制（需要闭合 GOP 的 H.264 源视频）。
+        """
+        # 任务之间收到的取消（如 Ctrl+C）在开始前生效；清除取消状态由发起取消的一方负责
+        self.supervisor.check()
+        video_path, subtitle_path, tail_path = self.resolve_inputs(folder, tail_path, video_path, subtitle_path)
+        os.makedirs(folder, exist_ok=True)
+        with self.metrics.job(self, video_path, folder):
+            return self._process_job(folder, mode, split_minutes, delay, tail_path, single_pass, workers, resume,
+                                     max_part_mb, quality_metric, quality_target, video_path, subtitle_path,
+                                     smart_render)
+
+    def _process_job(self, folder, mode, split_minutes, delay, tail_path, single_pass, workers, resume,
+                     max_part_mb, quality_metric, quality_target, video_path, subtitle_path, smart_render):
+        segment_folder = os.path.join(folder, "segments")
+        os.makedirs(segment_folder, exist_ok=True)
+        manifest = JobManifest(os.path.join(folder, MANIFEST_NAME)) if resume else None
+        # 中间文件写在 scratch 工作目录（未配置时即源文件夹），成品分段写在源文件夹的 segments 中
+        work_dir = self.scratch.work_dir(folder)
+        output_path = os.path.join(work_dir, "burned.mp4")
+        fonts_dir = os.path.join(work_dir, JOB_FONTS_DIR)
+        try:
+            with self.metrics.stage('probe'):
+                self.probe(video_path)
+                if tail_path:
+                    self.probe(tail_path)
+
+            # 先调整字幕时间，生成新的字幕文件
+            adjusted_subtitle_path = self.run_stage(
+                manifest, 'subtitle',
+                {'subtitle': file_fingerprint(subtitle_path), 'delay': delay},
+                lambda: [self.adjust_subtitle_timestamps(subtitle_path, work_dir, delay)],
+                [os.path.join(work_dir, "adjusted_subtitles.*")]
+            )[0]
+
+            # 导出视频中的字体附件，只把字幕引用的字体放入本任务的字体目录
+            fonts = self.run_stage(
+                manifest, 'fonts',
+                {'video': file_fingerprint(video_path), 'subtitle': file_fingerprint(adjusted_subtitle_path)},
+                lambda: prepare_fonts(self, self.font_cache, video_path, adjusted_subtitle_path, fonts_dir),
+                [os.path.join(fonts_dir, "*")]
+            )
+            self.fonts_dir = fonts_dir if fonts else None
+
+            with self.metrics.stage('encode_settings'):
+                duration, tail_duration, audio_bps = self.prepare_encode_settings(
+                    video_path, tail_path, mode, split_minutes, single_pass, max_part_mb, quality_metric,
+                    quality_target
+                )
+            segment_count = max(1, int(duration // (split_minutes * 60)) + 1) if split_minutes else 1
+
+            # 开始编码前按估算的输出大小检查磁盘空间
+            burned_bytes = estimate_output_bytes(os.path.getsize(video_path), mode, duration, self.size_settings,
+                                                 audio_bps)
+            self.scratch.preflight(self.disk_needs(burned_bytes, segment_folder, work_dir, output_path,
+                                                   tail_path, single_pass))
+
+            if single_pass:
+                if workers > 1:
+                    self.log("单次编码模式不支持并行烧录，使用单进程")
+                if smart_render:
+                    self.log("单次编码模式不支持智能渲染，整片重新编码")
+                if max_part_mb and mode != 'size':
+                    self.log("单次编码模式在编码前无法得知分段大小，忽略每段大小上限（size 模式除外）")
+                self.progress.reset([('burn', 90), ('tail', 10)] if tail_path else [('burn', 100)])
+                self.progress.start_stage('burn', duration)
+                self.progress.start_stage('tail', duration + tail_duration * (segment_count + 1))
+                self.log(f"单次编码: {mode} 模式，每 {split_minutes} 分钟一段")
+                segments = self.run_stage(
+                    manifest, 'single_pass',
+                    {
+                        'video': file_fingerprint(video_path),
+                        'subtitle': file_fingerprint(adjusted_subtitle_path),
+                        'mode': self.mode_key(mode),
+                        'audio': self.audio_plan.key,
+                        'fonts': [os.path.basename(f) for f in fonts],
+                        'split_minutes': split_minutes,
+                        'tail': file_fingerprint(tail_path),
+                    },
+                    lambda: self.burn_split_single_pass(
+                        video_path, adjusted_subtitle_path, folder, split_minutes, tail_path, mode
+                    ),
+                    [os.path.join(segment_folder, name) for name in
+                     ("part_*.mp4", "temp_part_*.ts", "full_video.*", "final_*", *TAIL_TEMP_FILES)]
+                )
+                self.progress.finish_stage('burn')
+                if tail_path:
+                    self.progress.finish_stage('tail')
+                self.log("处理完成！")
+                return segments
+
+            self.progress.reset([('burn', 80), ('split', 5), ('tail', 15)] if tail_path else [('burn', 90), ('split', 10)])
+            self.progress.start_stage('burn', duration)
+
+            def burn():
+                if smart_render:
+                    if workers > 1:
+                        self.log("智能渲染自行并行编码带字幕的片段，忽略并行进程数")
+                    self.log(f"开始智能渲染: {mode} 模式")
+                    burn_subtitles_smart(self, video_path, adjusted_subtitle_path, output_path, mode)
+                elif workers > 1:
+                    self.log(f"开始并行烧录字幕: {mode} 模式，{workers} 个进程")
+                    burn_subtitles_parallel(self, video_path, adjusted_subtitle_path, output_path, mode, workers)
+                else:
+                    self.log(f"开始烧录字幕: {mode} 模式")
+                    self.burn_subtitles(video_path, adjusted_subtitle_path, output_path, mode)
+                if not os.path.exists(output_path):
+                    raise Exception("字幕烧录失败")
+                return [output_path]
+
+            self.run_stage(
+                manifest, 'burn',
+                {
+                    'video': file_fingerprint(video_path),
+                    'subtitle': file_fingerprint(adjusted_subtitle_path),
+                    'mode': self.mode_key(mode),
+                    'audio': self.audio_plan.key,
+                    'fonts': [os.path.basename(f) for f in fonts],
+                    'smart_render': smart_render,
+                },
+                burn,
+                [output_path]
+            )
+            self.progress.finish_stage('burn')
+
+            self.log(f"开始分割视频: 每 {split_minutes} 分钟一段")
+            self.progress.start_stage('split', duration)
+            max_part_bytes = None
+            if max_part_mb:
+                max_part_bytes = max_part_mb * 1024 ** 2
+                if tail_path:
+                    # 为拼接的尾巴预留空间，尾巴按主视频码率转码，体积按同样码率估算
+                    max_part_bytes -= int(tail_duration * self.probe(output_path).bit_rate / 8)
+                if max_part_bytes <= 0:
+                    raise Exception("每段大小上限过小，容纳不下尾巴视频")
+            segments = self.run_stage(
+                manifest, 'split',
+                {
+                    'video': file_fingerprint(output_path),
+                    'split_minutes': split_minutes,
+                    'max_part_bytes': max_part_bytes,
+                    'subtitle': file_fingerprint(adjusted_subtitle_path),
+                },
+                lambda: [
+                    os.path.join(segment_folder, seg)
+                    for seg in self.split_video(output_path, folder, split_minutes, max_part_bytes, adjusted_subtitle_path)
+                ],
+                [os.path.join(segment_folder, name) for name in ("part_*.mp4", "full_video.mp4")]
+            )
+            segments = [os.path.basename(seg) for seg in segments]
+            self.progress.finish_stage('split')
+
+            if tail_path:
+                self.log("检测到尾部视频，开始拼接...")
+                self.progress.start_stage('tail', duration + tail_duration * (len(segments) + 1))
+
+                def tail_inputs(seg):
+                    return {
+                        'segment': file_fingerprint(os.path.join(segment_folder, seg)),
+                        'tail': file_fingerprint(tail_path),
+                        'mode': self.mode_key(mode),
+                    }
+
+                stale = [seg for seg in segments
+                         if not (manifest and manifest.is_fresh(f"tail:{seg}", tail_inputs(seg)))]
+                if len(stale) < len(segments):
+                    self.log(f"{len(segments) - len(stale)} 段的尾巴已拼接且输入未变化，跳过")
+                if stale:
+                    inputs = {seg: tail_inputs(seg) for seg in stale}
+
+                    def record_tail(segment_path, final_path):
+                        # 每段拼接完成时立即记录，其他段失败或中断后已拼接好的段不再重做
+                        seg = os.path.basename(segment_path)
+                        manifest.record(f"tail:{seg}", inputs[seg], [final_path])
+
+                    # 获取主视频参数
+                    main_params = self.get_video_params(output_path)
+                    # 传递当前烧录模式
+                    # 不包在 scratch.guard 中：失败时各段只删除自己写了一半的成品，已拼接好的段保留
+                    self.concat_tail(stale, tail_path, folder, main_params, mode,
+                                     keep_segments=bool(manifest), main_info=self.probe(output_path),
+                                     on_done=record_tail if manifest else None)
+                segments = [f"final_{seg}" for seg in segments]
+                self.progress.finish_stage('tail')
+
+            if manifest:
+                self.remove_stale_outputs(segment_folder, segments)
+            else:
+                self.cleanup_temp_files(output_path)
+
+            self.log("处理完成！")
+            return [os.path.join(segment_folder, seg) for seg in segments]
+        finally:
+            self.fonts_dir = None
+            # 不续跑时中间文件没有保留价值，无论成败都删除 scratch 中的工作目录
+            if not manifest:
+                shutil.rmtree(fonts_dir, ignore_errors=True)
+                self.scratch.release(work_dir)
+
+    def resolve_inputs(self, folder, tail_path=None, video_path=None, subtitle_path=None):
+        """返回本任务的 (视频, 字幕, 尾巴) 路径，没有尾巴时尾巴为 None 或空字符串。"""
+        if video_path and subtitle_path:
+            tail_file = None
+        else:
+            video_file, subtitle_file, tail_file = self.find_input_files(folder)
+            if not video_file or not subtitle_file:
+                raise Exception("文件夹中必须包含一个视频文件和一个字幕文件")
+            video_path = os.path.join(folder, video_file)
+            subtitle_path = os.path.join(folder, subtitle_file)
+        # 未显式指定尾巴时使用文件夹中的 tail 文件，传入空字符串表示不拼接尾巴
+        if tail_path is None and tail_file:
+            tail_path = os.path.join(folder, tail_file)
+        return video_path, subtitle_path, tail_path
+
+    def prepare_encode_settings(self, video_path, tail_path, mode, split_minutes, single_pass, max_part_mb,
+                                quality_metric='ssim', quality_target=None, search_quality=True):
+        """
+        决定本任务的编码参数：quality 模式的预设与 CRF、size 模式的码率上限以及音频方案。
+        返回 (主视频时长, 尾巴时长, 成品音频码率)。search_quality 为 False 时（预演）只使用缓存的 quality 设置。
+        """
+        self.quality_settings = None
+        if mode == 'quality':
+            if search_quality:
+                self.quality_settings = choose_encode_settings(self, video_path, quality_metric, quality_target)
+            else:
+                self.quality_settings = cached_encode_settings(video_path, quality_metric, quality_target)
+
+        duration = self.probe(video_path).duration
+        tail_duration = self.probe(tail_path).duration if tail_path else 0.0
+        # 有尾巴时成品要经过 TS 拼接，音频在烧录时一次转成 TS 支持的编码
+        source_audio = self.probe(video_path).audio
+        self.audio_plan = plan_audio(source_audio, self.has_high_end_audio(video_path), need_ts=bool(tail_path))
+        self.log(f"音频方案: {self.audio_plan.reason}")
+        audio_bps = self.audio_plan.bitrate_bps or audio_bitrate(source_audio)
+        self.size_settings = None
+        if mode == 'size':
+            if not max_part_mb:
+                raise Exception("size 模式需要指定每段大小上限")
+            part_seconds = longest_part_seconds(duration, split_minutes, exact_cuts=single_pass)
+            self.size_settings = plan_size_budget(max_part_mb * 1024 ** 2, part_seconds, tail_duration, audio_bps)
+            self.log(f"每段上限 {max_part_mb} MB，最长一段 {part_seconds:.0f} 秒，"
+                     f"视频码率上限 {self.size_settings['maxrate'] // 1000} kbps")
+        return duration, tail_duration, audio_bps
+
+    def disk_needs(self, burned_bytes, segment_folder, work_dir, output_path, tail_path, single_pass):
+        # 单次编码只写分段，否则还要写完整的烧录结果；拼接尾巴时分段与成品同时存在
+        needs = [(segment_folder, burned_bytes * (2 if tail_path else 1))]
+        if not single_pass and not os.path.exists(output_path):
+            needs.append((work_dir, burned_bytes))
+        return needs
+
+    def remove_stale_outputs(self, segment_folder, current):
+        # 分割长度变化后，上次多出来的成品分段不再属于本次结果
+        for name in os.listdir(segment_folder):
+            if name.startswith('final_') and name.endswith('.mp4') and name not in current:
+                os.remove(os.path.join(segment_folder, name))
+                self.log(f"已删除过期的成品分段: {name}")
+
+    def adjust_subtitle_timestamps(self, subtitle_path, folder, delay=0.0):
+        try:
+            subtitles = SubtitleFile.load(subtitle_path).shift(delay * 1000)
+            # 创建新的字幕文件，保持原格式
+            ext = os.path.splitext(subtitle_path)[1].lower()
+            new_subtitle_path = subtitles.save(os.path.join(folder, f"adjusted_subtitles{ext}"))
+            self.log(f"已生成新的字幕文件: {new_subtitle_path}（{len(subtitles)} 条字幕）")
+            return new_subtitle_path
+        except Exception as e:
+            self.log(f"调整字幕时间失败: {str(e)}", error=True)
+            raise
+
+    def find_input_files(self, folder):
+        video_ext = ('.mp4', '.mkv', '.avi', '.mov', '.flv')
+        sub_ext = ('.srt', '.ass', '.ssa')
+
+        video_files = []
+        sub_files = []
+        tail_files = []
+
+        for f in os.listdir(folder):
+            lower_f = f.lower()
+            if lower_f.endswith(video_ext):
+                if lower_f.startswith('tail'):
+                    tail_files.append(f)
+                else:
+                    video_files.append(f)
+            elif lower_f.endswith(sub_ext):
+                sub_files.append(f)
+
+        # 选择最大的视频文件
+        video_file = max(video_files, key=lambda x: os.path.getsize(os.path.join(folder, x))) if video_files else None
+        # 匹配同名字幕文件
+        sub_file = next((s for s in sub_files if os.path.splitext(s)[0] == os.path.splitext(video_file)[0]), None) if video_file else None
+
+        return (
+            video_file,
+            sub_file or (sub_files[0] if sub_files else None),
+            tail_files[0] if tail_files else None
+        )
+
+    def has_high_end_audio(self, file_path):
+        try:
+            info = self.probe(file_path)
+        except Exception as e:
+            self.log(f"探测音频失败: {str(e)}", error=True)
+            return False
+
+        # Assume the first audio stream is the main audio
+        audio = info.audio
+        if audio is None:
+            return False
+
+        codec_name = audio.codec_name
+        codec_long = audio.codec_long_name.lower()
+        profile = audio.profile.lower()
+        codec_tag = audio.codec_tag_string
+        channels = audio.channels
+        tags = audio.tags
+
+        high_end = False
+        # Dolby TrueHD (includes Atmos)
+        if codec_name == "truehd":
+            high_end = True
+        # DTS variants (DTS-HD MA, DTS:X)
+        if codec_name in ("dts", "dca"):
+            if "dts-hd ma" in profile or "dts:x" in profile:
+                high_end = True
+        if "dts-hd" in codec_long:
+            high_end = True
+        # Dolby Atmos (TrueHD with Atmos), indicated by A_TRUEHD tag
+        if codec_tag == "A_TRUEHD":
+            high_end = True
+        # High channel count (>=9) likely object audio or Auro-3D
+        if channels >= 9:
+            high_end = True
+        # Check tags for Auro-3D keyword
+        for key in ("title", "handler_name", "comment"):
+            if tags.get(key) and "auro" in tags[key].lower():
+                high_end = True
+        return high_end
+
+    def subtitle_filter(self, subtitle_file):
+        subs_path = self.filter_path(subtitle_file)
+        # Use single quotes around the path to handle spaces/colons in Windows paths
+        if self.fonts_dir:
+            # 只扫描本任务的字体目录，启动更快，并行分块与单进程烧录使用同一套字体
+            return f"subtitles='{subs_path}':fontsdir='{self.filter_path(self.fonts_dir)}'"
+        return f"subtitles='{subs_path}'"
+
+    @staticmethod
+    def filter_path(path):
+        return path.replace("\\", "/").replace(":", "\\:")
+
+    def mode_key(self, mode):
+        # quality 模式的实际编码参数因源视频而异，写入清单和缓存键时带上选定的预设与 CRF
+        if mode == "quality" and self.quality_settings:
+            return f"quality:{self.quality_settings['preset']}:{self.quality_settings['crf']}"
+        if mode == "size" and self.size_settings:
+            return f"size:{self.size_settings['maxrate']}"
+        return mode
+
+    def size_encode_args(self):
+        # CRF 决定画质，VBV 只在码率超出预算的片段起作用
+        return ["-preset", "medium", "-crf", "18",
+                "-maxrate", str(self.size_settings['maxrate']), "-bufsize", str(self.size_settings['bufsize'])]
+
+    def video_encode_args(self, mode):
+        # Video encoding settings by mode
+        cmd = ["-c:v", "libx264"]
+        if mode == "lossless":
+            cmd += ["-preset", "veryslow","-crf", "0"]
+        elif mode == "quality" and self.quality_settings:
+            cmd += ["-preset", self.quality_settings['preset'], "-crf", str(self.quality_settings['crf'])]
+        elif mode == "size" and self.size_settings:
+            cmd += self.size_encode_args()
+        elif mode == "fast":
+            cmd += ["-preset", "fast", "-crf", "28"]
+        else:  # balanced or default
+            cmd += ["-preset", "medium", "-crf", "18"]
+        return cmd
+
+    def audio_plan_for(self, input_file, need_ts=False):
+        # process_video 已为本任务决定过音频方案时沿用；直接调用烧录（如基准测试）时按源文件决定
+        if self.audio_plan is None:
+            return plan_audio(self.probe(input_file).audio, self.has_high_end_audio(input_file), need_ts)
+        return self.audio_plan
+
+    def burn_command(self, input_file, subtitle_file, output_file, mode, audio_args):
+        cmd = ["ffmpeg", "-hide_banner", "-y", "-i", input_file, "-vf", self.subtitle_filter(subtitle_file)]
+        cmd += self.video_encode_args(mode)
+        cmd += audio_args
+        cmd.append(output_file)
+        return cmd
+
+    def mux_command(self, video_file, audio_input, audio_map, output_file):
+        # 视频与单独编码的音频都只做流复制
+        return [
+            "ffmpeg", "-hide_banner", "-y", "-i", video_file, *audio_input,
+            "-map", "0:v:0", "-c:v", "copy", *audio_map,
+            "-movflags", "+faststart", output_file
+        ]
+
+    def burn_subtitles(self,input_file, subtitle_file, output_file, mode='balanced'):
+        """
+        把字幕烧录进视频。FFmpeg 失败时抛出 subprocess.CalledProcessError（output 为错误输出的最后若干行），
+        不留下写了一半的 output_file。
+        """
+        audio_plan = self.audio_plan_for(input_file)
+        started = time.monotonic()
+        try:
+            with AudioTrack(self, input_file, audio_plan, os.path.dirname(output_file)) as audio:
+                if not audio.separate:
+                    # 音频直接复制，一条命令完成
+                    cmd = self.burn_command(input_file, subtitle_file, output_file, mode, audio_plan.encode_args())
+                    self.run_command(cmd, progress_task=('burn', 'main'), threads=self.governor.budget)
+                else:
+                    # 音频在另一个进程中同时编码，视频编码完成后只做流复制混流
+                    base, ext = os.path.splitext(output_file)
+                    video_only = f"{base}_video{ext}"
+                    try:
+                        cmd = self.burn_command(input_file, subtitle_file, video_only, mode, ["-an"])
+                        self.run_command(cmd, progress_task=('burn', 'main'), threads=self.governor.budget)
+                        self.run_command(self.mux_command(video_only, audio.mux_input(), audio.mux_map(), output_file))
+                    finally:
+                        if os.path.exists(video_only):
+                            os.remove(video_only)
+        except BaseException:
+            # 不留下写了一半的输出文件；FFmpeg 的错误输出已由 run_command 写入日志，异常交给调用方
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
+        self.record_serial_speed(input_file, mode, time.monotonic() - started)
+
+    def record_serial_speed(self, input_file, mode, elapsed):
+        # 记录单进程烧录速度，供并行烧录计算加速比
+        try:
+            duration = self.probe(input_file).duration
+            key = f"{self.mode_key(mode)}:{self.get_video_params(input_file)['height']}p"
+        except Exception:
+            return
+        if elapsed > 0 and duration > 0:
+            speed = duration / elapsed
+            record_burn_speed(key, 'serial', speed)
+            # 记录每种核心分配（并发数 x 每进程线程数）实际达到的总吞吐
+            record_burn_speed(key, f"alloc:1x{self.governor.budget}", speed)
+            self.log(f"烧录耗时 {elapsed:.1f} 秒（{speed:.2f}x 实时）")
+
+    def planned_output_params(self, source_params, audio_plan):
+        """
+        单次编码时烧录结果尚未落盘，根据源视频参数和编码设置推算输出流参数，
+        供尾巴视频提前转码使用。
+        """
+        params = audio_plan.output_params(source_params)
+        params['v_codec'] = 'libx264'
+        return params
+
+    def burn_split_single_pass(self, video_path, subtitle_path, folder, split_minutes, tail_path, mode):
+        """
+        一条 FFmpeg 命令完成烧录与分割：在分割点强制关键帧，由 segment 复用器直接写出各段，
+        不再生成完整的 burned.mp4；有尾巴时各段写为 TS 并直接与预先转码的尾巴拼接为成品。
+        """
+        segment_folder = os.path.join(folder, "segments")
+        os.makedirs(segment_folder, exist_ok=True)
+
+        # 有尾巴时各段以 TS 封装，音频方案已保证是 TS 支持的编码
+        audio_plan = self.audio_plan_for(video_path, need_ts=bool(tail_path))
+        params = self.planned_output_params(self.get_video_params(video_path), audio_plan)
+
+        tail_ts, tail_files = None, []
+        if tail_path:
+            # 主视频尚未生成，无法与尾巴比较流参数，尾巴总是转码
+            self.log("检测到尾部视频，先按主视频参数转码尾巴...")
+            tail_ts, tail_files = self.prepare_tail_ts(tail_path, segment_folder, params, mode)
+
+        cmd = self.single_pass_command(video_path, subtitle_path, segment_folder, split_minutes, mode, audio_plan,
+                                       bool(tail_ts))
+        self.log(f"执行单次编码命令: {' '.join(cmd)}")
+        self.run_command(cmd, progress_task=('burn', 'main'), threads=self.governor.budget)
+
+        ext = "ts" if tail_ts else "mp4"
+        prefix = "temp_" if tail_ts else ""
+        if split_minutes == 0:
+            segment_names = [f"full_video.{ext}"]
+        else:
+            segment_names = sorted(
+                f[len(prefix):] for f in os.listdir(segment_folder)
+                if f.startswith(f"{prefix}part_") and f.endswith(f".{ext}")
+            )
+        if not tail_ts:
+            return [os.path.join(segment_folder, seg) for seg in segment_names]
+
+        jobs = [
+            (os.path.join(segment_folder, f"temp_{seg}"),
+             os.path.join(segment_folder, f"final_{os.path.splitext(seg)[0]}.mp4"))
+            for seg in segment_names
+        ]
+        try:
+            return concat_segments_with_tail(self, jobs, tail_ts, params, TS_AUDIO_CODECS, self.concat_workers)
+        finally:
+            for f in tail_files:
+                if os.path.exists(f):
+                    os.remove(f)
+
+    def single_pass_command(self, video_path, subtitle_path, segment_folder, split_minutes, mode, audio_plan, ts):
+        """ts 为 True 时各段写为 temp_*.ts 供拼接尾巴，否则直接写出 MP4 成品。"""
+        cmd = ["ffmpeg", "-hide_banner", "-y", "-i", video_path, "-vf", self.subtitle_filter(subtitle_path)]
+        cmd += self.video_encode_args(mode)
+        # 各段由 segment 复用器直接写出，音频在同一命令中按方案编码一次
+        cmd += audio_plan.encode_args()
+        # 字幕已烧录进画面，不再复制字幕流
+        cmd += ["-sn"]
+
+        ext = "ts" if ts else "mp4"
+        prefix = "temp_" if ts else ""
+        if split_minutes == 0:
+            cmd += ["-f", "mpegts" if ts else "mp4", os.path.join(segment_folder, f"{prefix}full_video.{ext}")]
+        else:
+            split_seconds = split_minutes * 60
+            cmd += [
+                "-force_key_frames", f"expr:gte(t,n_forced*{split_seconds})",
+                "-f", "segment",
+                "-segment_time", str(split_seconds),
+                "-segment_format", "mpegts" if ts else "mp4",
+                "-reset_timestamps", "1",
+                os.path.join(segment_folder, f"{prefix}part_%03d.{ext}")
+            ]
+        return cmd
+
+    def split_video(self, video_path, folder, split_minutes, max_part_bytes=None, subtitle_path=None):
+        """
+        按关键帧索引规划分割点后用 -segment_times 精确分割。max_part_bytes 限制每段大小，
+        subtitle_path 用于避免切点落在字幕显示中间。
+        """
+        segment_folder = os.path.join(folder, "segments")
+        os.makedirs(segment_folder, exist_ok=True)
+
+        if split_minutes == 0 and not max_part_bytes:
+            # 不分割时内容与烧录结果完全相同，不必再经过 FFmpeg 复制一遍
+            output_path = os.path.join(segment_folder, "full_video.mp4")
+            method = self.scratch.link_or_copy(video_path, output_path)
+            self.log(f"不分割: 以{'硬链接' if method == 'link' else '文件复制'}方式生成 {output_path}")
+            return ["full_video.mp4"]
+        else:
+            index = load_packet_index(video_path, self.media_probe.cache_dir, self.supervisor)
+            events = []
+            if subtitle_path:
+                subtitles = SubtitleFile.load(subtitle_path)
+                events = [(start / 1000, end / 1000) for start, end in zip(subtitles.starts, subtitles.ends)]
+            cuts = plan_split(
+                index, self.probe(video_path).duration,
+                target_seconds=split_minutes * 60 or None,
+                max_bytes=max_part_bytes,
+                subtitle_events=events
+            )
+            bounds = [index.start_time, *cuts, index.start_time + self.probe(video_path).duration]
+            lengths = ', '.join(f"{(end - start) / 60:.1f}" for start, end in zip(bounds[:-1], bounds[1:]))
+            self.log(f"分割计划: {len(cuts) + 1} 段，各段时长（分钟）: {lengths}")
+
+            # 清除上次分割留下的分段，避免分割长度变化后混入旧文件
+            for f in os.listdir(segment_folder):
+                if f.startswith('part_') and f.endswith('.mp4'):
+                    os.remove(os.path.join(segment_folder, f))
+            cmd = self.split_command(video_path, segment_folder, cuts, index.start_time)
+            self.log(f"执行分割命令: {' '.join(cmd)}")
+            self.run_command(cmd, progress_task=('split', 'main'))
+            return sorted(
+                f for f in os.listdir(segment_folder)
+                if f.endswith('.mp4') and f.startswith('part_')
+            )
+
+    def split_command(self, video_path, segment_folder, cuts, start_time):
+        cmd = [
+            'ffmpeg', '-y', '-i', video_path,
+            '-c', 'copy',
+            '-f', 'segment',
+        ]
+        if cuts:
+            cmd += ['-segment_times', segment_times_arg(cuts, start_time)]
+        else:
+            # 整段不超过限制，仍按分段命名输出
+            cmd += ['-segment_time', str(10 ** 9)]
+        cmd += [
+            '-reset_timestamps', '1',
+            os.path.join(segment_folder, 'part_%03d.mp4')
+        ]
+        return cmd
+
+    def concat_tail(self, segments, tail_path, folder, main_params, burn_mode, keep_segments=False,
+                    main_info=None, on_done=None):
+        try:
+            segment_folder = os.path.join(folder, "segments")
+
+            # 尾巴转码或复制失败时只删除这一步写出的临时文件
+            with self.scratch.guard(*(os.path.join(segment_folder, name) for name in TAIL_TEMP_FILES)):
+                transcoded_ts, tail_files = self.prepare_tail_ts(tail_path, segment_folder, main_params, burn_mode,
+                                                                 main_info)
+
+            jobs = [
+                (os.path.join(segment_folder, seg), os.path.join(segment_folder, f"final_{seg}"))
+                for seg in segments
+            ]
+            try:
+                with self.metrics.stage('concat'):
+                    concat_segments_with_tail(self, jobs, transcoded_ts, main_params, TS_AUDIO_CODECS,
+                                              self.concat_workers, keep_segments, on_done)
+            finally:
+                for f in tail_files:
+                    if os.path.exists(f):
+                        os.remove(f)
+            return [f"final_{seg}" for seg in segments]
+
+        except Exception as e:
+            self.log(f"拼接失败: {str(e)}", error=True)
+            raise
+
+    def prepare_tail_ts(self, tail_path, segment_folder, main_params, burn_mode, main_info=None):
+        """
+        返回 (尾巴 TS 路径, 用完后需删除的临时文件列表)。
+        给出主视频的 main_info 且尾巴与之兼容时直接流复制，不解码；
+        否则转码，启用缓存时相同尾巴、相同目标参数和模式的转码结果直接复用，缓存文件不会被删除。
+        """
+        if main_info is not None:
+            tail_info = self.probe(tail_path)
+            compatible, reason = check_tail_compat(main_info, tail_info, TS_AUDIO_CODECS)
+            tail_bps = tail_info.video.bit_rate or tail_info.bit_rate if tail_info.video else 0
+            if compatible and burn_mode == "size" and self.size_settings and tail_bps > self.size_settings['maxrate']:
+                # 预算按码率上限为尾巴预留空间，码率更高的尾巴直接复制会撑破大小上限
+                compatible, reason = False, f"尾巴码率 {tail_bps // 1000} kbps 超出预算"
+            if compatible:
+                self.log(f"尾巴与主视频兼容，直接流复制: {reason}")
+                copied_ts = os.path.join(segment_folder, "tail.ts")
+                with self.metrics.stage('tail_copy'):
+                    self.copy_tail_to_ts(tail_path, copied_ts)
+                return copied_ts, [copied_ts]
+            self.log(f"尾巴需要转码: {reason}")
+
+        cache_key = None
+        if self.tail_cache:
+            cache_key = self.tail_cache.make_key(tail_path, main_params, self.mode_key(burn_mode))
+            cached_ts = self.tail_cache.get(cache_key)
+            if cached_ts:
+                self.log(f"尾巴转码命中缓存: {cached_ts}")
+                return cached_ts, []
+
+        with self.metrics.stage('tail_transcode'):
+            transcoded_mp4 = self.transcode_tail(tail_path, segment_folder, main_params, burn_mode)
+        transcoded_ts = os.path.join(segment_folder, "tail.ts")
+        with self.metrics.stage('ts_convert'):
+            self.convert_to_ts(transcoded_mp4, transcoded_ts)
+        if cache_key:
+            transcoded_ts = self.tail_cache.put(cache_key, transcoded_ts)
+            self.log(f"尾巴转码结果已写入缓存: {transcoded_ts}")
+            return transcoded_ts, [transcoded_mp4]
+        return transcoded_ts, [transcoded_mp4, transcoded_ts]
+
+    @staticmethod
+    def copy_tail_command(tail_path, output_ts):
+        return [
+            'ffmpeg', '-y', '-i', tail_path,
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c', 'copy', '-bsf:v', 'h264_mp4toannexb',
+            '-f', 'mpegts', output_ts
+        ]
+
+    @staticmethod
+    def ts_remux_command(input_file, output_ts):
+        return [
+            'ffmpeg', '-y', '-i', input_file,
+            '-c', 'copy', '-f', 'mpegts',
+            output_ts
+        ]
+
+    def copy_tail_to_ts(self, tail_path, output_ts):
+        cmd = self.copy_tail_command(tail_path, output_ts)
+        self.log(f"尾巴流复制命令: {' '.join(cmd)}")
+        self.run_command(cmd, progress_task=('tail', 'transcode'))
+
+    def convert_to_ts(self, input_file: str, output_ts: str):
+        if not os.path.isfile(input_file):
+            raise FileNotFoundError(f"Input file does not exist: {input_file}")
+        try:
+            audio = self.probe(input_file).audio
+            audio_codec = audio.codec_name if audio else ''
+            if not audio_codec:
+                self.log("No audio stream detected, proceeding with TS remux directly.")
+                input_for_ts = input_file
+            else:
+                self.log(f"Detected audio codec: {audio_codec}")
+                if audio_codec in TS_AUDIO_CODECS:
+                    self.log(f"Audio codec '{audio_codec}' is supported by MPEG-TS. Skipping re-encoding.")
+                    input_for_ts = input_file
+                else:
+                    self.log(f"Audio codec '{audio_codec}' is not supported by MPEG-TS. Re-encoding audio to AAC (192k)...")
+                    # Prepare temporary output file path for re-encoded audio
+                    base, ext = os.path.splitext(input_file)
+                    temp_file = f"{base}_reencoded.mp4"
+                    # Perform re-encoding: copy video, encode audio to AAC 192k
+                    ffmpeg_cmd = [
+                        'ffmpeg', '-y', '-i', input_file,
+                        '-c:v', 'copy',
+                        '-c:a', 'aac', '-b:a', '192k',
+                        temp_file
+                    ]
+                    self.log(f"Running ffmpeg to transcode audio: {' '.join(ffmpeg_cmd)}")
+                    self.run_command(ffmpeg_cmd, stage='tail')
+                    input_for_ts = temp_file
+        except subprocess.CalledProcessError as e:
+            self.log(f"Error detecting or transcoding audio: {e}")
+            raise RuntimeError(f"Failed audio detection or transcoding: {e}")
+        except Exception as e:
+            self.log(f"Unexpected error: {e}")
+            raise
+
+        try:
+            self.log(f"Remuxing to MPEG-TS: input='{input_for_ts}', output='{output_ts}'")
+            ffmpeg_remux_cmd = self.ts_remux_command(input_for_ts, output_ts)
+            self.log(f"Running ffmpeg command: {' '.join(ffmpeg_remux_cmd)}")
+            self.run_command(ffmpeg_remux_cmd, stage='tail')
+            self.log(f"Successfully created TS file: {output_ts}")
+        except subprocess.CalledProcessError as e:
+            self.log(f"Error during TS remux: {e}")
+            raise RuntimeError(f"Failed to remux to TS: {e}")
+        finally:
+            # Clean up temporary file if created
+            if 'temp_file' in locals() and os.path.isfile(temp_file):
+                try:
+                    os.remove(temp_file)
+                    self.log(f"Removed temporary file: {temp_file}")
+                except Exception as e:
+                    self.log(f"Could not remove temporary file '{temp_file}': {e}")
+
+    def concat_ts_files(self, ts_files, output_file):
+        try:
+            # 每个输出使用独立的列表文件，多段可以同时拼接
+            list_file = f"{os.path.splitext(output_file)[0]}_concat.txt"
+            with open(list_file, "w", encoding="utf-8") as f:
+                for ts in ts_files:
+                    ts_path = os.path.normpath(ts).replace("\\", "/")
+                    f.write(f"file '{ts_path}'\n")
+
+            cmd = [
+                'ffmpeg',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', list_file,
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                '-y', output_file
+            ]
+            self.run_command(cmd)
+        finally:
+            if os.path.exists(list_file):
+                os.remove(list_file)
+
+    def get_video_params(self, video_path):
+        params = {
+            'v_codec': 'libx264',
+            'width': '1920',
+            'height': '1080',
+            'frame_rate': '23.98',
+            'pix_fmt': 'yuv420p',
+            'a_codec': 'aac',
+            'sample_rate': '48000',
+            'channels': '2',
+            'a_bitrate': '192k',
+            'has_audio': False
+        }
+
+        try:
+            info = self.probe(video_path)
+            video = info.video
+            if video:
+                params.update({
+                    'v_codec': video.codec_name or 'libx264',
+                    'width': str(video.width or 1920),
+                    'height': str(video.height or 1080),
+                    'frame_rate': self.safe_frame_rate(video.r_frame_rate),
+                    'pix_fmt': video.pix_fmt or 'yuv420p'
+                })
+
+            audio = info.audio
+            if audio:
+                params.update({
+                    'a_codec': audio.codec_name or 'aac',
+                    'sample_rate': str(audio.sample_rate or 48000),
+                    'channels': str(audio.channels or 2),
+                    'a_bitrate': f"{audio.bit_rate // 1000}k" if audio.bit_rate else '192k',
+                    'has_audio': True
+                })
+            else:
+                self.log("未检测到有效音频流，将禁用尾部音频")
+                params['has_audio'] = False
+
+        except Exception as e:
+            self.log(f"参数解析警告: {str(e)}，使用默认音频参数", error=True)
+            params['has_audio'] = False
+
+        # 强制合法像素格式
+        params['pix_fmt'] = params['pix_fmt'].split('/')[0].split(':')[0]  # 移除非法字符
+        if params['pix_fmt'] not in ['yuv420p', 'yuvj420p', 'yuv422p']:
+            params['pix_fmt'] = 'yuv420p'
+
+        return params
+
+    def safe_frame_rate(self, rate_str):
+        try:
+            if '/' in rate_str:
+                num, den = rate_str.split('/')
+                return f"{float(num)/float(den):.2f}"
+            return f"{float(rate_str):.2f}"
+        except:
+            return '23.98'  # 默认常用帧率
+
+    def transcode_tail(self, input_path, output_dir, main_params, burn_mode):
+        output_path = os.path.join(output_dir, "transcoded_tail.mp4")
+        cmd = self.transcode_tail_command(input_path, output_path, main_params, burn_mode)
+        self.log(f"转码命令: {' '.join(cmd)}")
+        self.run_command(cmd, progress_task=('tail', 'transcode'), threads=self.governor.budget)
+        return output_path
+
+    def transcode_tail_command(self, input_path, output_path, main_params, burn_mode):
+
+        # 视频参数
+        video_params = [
+            '-c:v', main_params['v_codec'],
+            '-s', f"{main_params['width']}x{main_params['height']}",
+            '-r', main_params['frame_rate'],
+            '-pix_fmt', main_params['pix_fmt'],
+            '-x264-params', 'nal-hrd=cbr'
+        ]
+
+        # 质量参数
+        quality_params = {
+            "lossless": ['-crf', '0', '-preset', 'slower'],
+            "balanced": ['-crf', '18', '-preset', 'medium'],
+            "fast": ['-crf', '28', '-preset', 'faster']
+        }.get(burn_mode, ['-crf', '28', '-preset', 'faster'])
+        if burn_mode == "quality" and self.quality_settings:
+            quality_params = ['-crf', str(self.quality_settings['crf']), '-preset', self.quality_settings['preset']]
+        elif burn_mode == "size" and self.size_settings:
+            # 尾巴使用同样的码率上限，预算中已为它留出空间
+            quality_params = self.size_encode_args()
+
+        audio_params = ['-an']  # 默认无音频
+        if main_params['has_audio']:
+            # 主视频的音频是音频方案选定的 TS 编码，按编码名选择对应的编码器
+            audio_params = [
+                *encoder_args(main_params['a_codec'].lower()),
+                '-ar', main_params['sample_rate'],
+                '-ac', main_params['channels'],
+                '-b:a', main_params['a_bitrate'],
+            ]
+
+        cmd = [
+            'ffmpeg', '-i', input_path,
+            *video_params,
+            *quality_params,
+            *audio_params,
+            '-vsync', 'cfr',
+            '-avoid_negative_ts', 'make_zero',
+            '-fflags', '+genpts',
+            '-y', output_path
+        ]
+        return cmd
+
+    def parse_frame_rate(self, rate_str):
+        try:
+            if '/' in rate_str:
+                numerator, denominator = map(int, rate_str.split('/'))
+                return f"{round(numerator/denominator, 2):.2f}"
+            return f"{float(rate_str):.2f}"
+        except:
+            return '30.00'
+
+    def safe_path(self, raw_path):
+        path = pathlib.Path(raw_path)
+        return path.resolve().as_posix()
+
+    def cleanup_temp_files(self, output_path):
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+                self.log("已清理临时烧录文件")
+        except Exception as e:
+            self.log(f"清理临时文件出错: {str(e)}", error=True)
+
+    def run_command(self, cmd, pass_fds=(), progress_task=None, threads=None, stage=None):
+        """
+        运行外部命令并实时转发输出。progress_task 为 (阶段, 任务) 时给 ffmpeg 加上 -progress，
+        进度行只交给进度跟踪器，不进入日志。threads 为编码进程需要的核心数，
+        从 governor 租用后设置对应的线程参数，核心不足时等待其他编码结束。
+        stage 决定使用哪个阶段的时限，未给出时取 progress_task 的阶段。
+        """
+        if progress_task:
+            cmd = [cmd[0], *progress_args(), *cmd[1:]]
+        stage = stage or (progress_task[0] if progress_task else None)
+        with self.governor.lease(threads) as cpus:
+            # 等待核心期间任务可能已被取消
+            self.supervisor.check()
+            if cpus:
+                cmd = self.governor.thread_args(cmd, len(cpus))
+            self._run_leased(self.governor.wrap(cmd, cpus), pass_fds, progress_task, stage)
+
+    def _run_leased(self, cmd, pass_fds, progress_task, stage):
+        fields = {}
+
+        def on_line(line):
+            nonlocal fields
+            parsed = parse_progress_line(line) if progress_task else None
+            if parsed:
+                key, value = parsed
+                fields[key] = value
+                # 每个进度块以 progress=continue/end 结尾
+                if key == 'progress':
+                    self.progress.update(*progress_task, fields)
+                    fields = {}
+                return
+            if self.file_log:
+                self.file_log.info(line)
+            if is_stats_line(line) and not self.stats_limiter.allow():
+                return
+            # 有界面时交给界面的 LogBuffer，否则交给 ConsoleLog
+            self.output_callback(line)
+
+        try:
+            self.supervisor.run(cmd, on_line, stage=stage, pass_fds=pass_fds)
+        except subprocess.CalledProcessError as e:
+            self.log(f"命令执行失败: {str(e)}\n{e.output}" if e.output else f"命令执行失败: {str(e)}", error=True)
+            raise
+        except Exception as e:
+            self.log(f"命令执行失败: {str(e)}", error=True)
+            raise
+
+    def cancel(self):
+        """停止当前任务：终止所有正在运行的 FFmpeg 进程，之后的阶段不再启动。可在任意线程调用。"""
+        self.log("正在停止当前任务...")
+        self.supervisor.cancel()
+
+    def check_ffmpeg(self):
+        try:
+            subprocess.run(['ffmpeg', '-version'],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return True
+        except:
+            return False
+
+    def get_ffmpeg_version(self):
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-version'],
+                capture_output=True,
+                text=True
+            )
+            version_line = result.stdout.split('\n')[0]
+            return re.search(r'ffmpeg version (\d+\.\d+)', version_line).group(1)
+        except:
+            return "未知版本"
+
+    def log(self, message, error=False):
+        # 过滤concat调试信息
+        if "[concat @" in message and not error:
+            return
+
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.log_callback(f"[{timestamp}] {message}", error)
+        if self.file_log:
+            if error:
+                self.file_log.error(message)
+            else:
+                self.file_log.info(message)
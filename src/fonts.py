@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+
+from subtitles import detect_encoding
+
+
+DEFAULT_FONT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoprocessor", "fonts")
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+# 每个任务的字体目录，放在工作目录中；以点开头，扫描片库时跳过，也不会与用户自己的 fonts 目录冲突
+JOB_FONTS_DIR = ".videoprocessor_fonts"
+FONT_EXTS = ('.ttf', '.otf', '.ttc', '.otc')
+FONT_MIMETYPES = {
+    'application/x-truetype-font', 'application/x-font-ttf', 'application/x-font-truetype',
+    'application/vnd.ms-opentype', 'application/x-font-otf', 'application/x-font-opentype',
+    'application/font-sfnt', 'font/ttf', 'font/otf', 'font/sfnt', 'font/collection',
+}
+# 源文件夹中与视频放在一起的字体目录
+LOCAL_FONT_DIRS = ('fonts', 'font', '字体')
+# name 表中 libass 按名称匹配时使用的记录：族名、全名、PostScript 名、排版族名
+NAME_IDS = (1, 4, 6, 16)
+# Windows 平台 name 记录的旧式双字节编码（中文字体常见），每个字符占两个字节
+LEGACY_ENCODINGS = {3: 'gbk', 4: 'big5'}
+STYLE_SECTIONS = ('[v4+ styles]', '[v4 styles]')
+OVERRIDE_FONT = re.compile(r'\\fn([^\\}]*)')
+
+
+def referenced_fonts(subtitle_path):
+    """返回 ASS/SSA 字幕样式与 \\fn 标签引用的字体名（小写）；SRT 没有字体信息，返回空集合。"""
+    if os.path.splitext(subtitle_path)[1].lower() not in ('.ass', '.ssa'):
+        return set()
+    with open(subtitle_path, 'rb') as f:
+        raw = f.read()
+    encoding = detect_encoding(raw)
+    if encoding is None:
+        return set()
+
+    names = set()
+    section = None
+    columns = None
+    for line in raw.decode(encoding).splitlines():
+        stripped = line.strip()
+        if stripped.startswith('['):
+            section = stripped.lower()
+            continue
+        if section in STYLE_SECTIONS:
+            kind, _, value = stripped.partition(':')
+            if kind == 'Format':
+                columns = [c.strip().lower() for c in value.split(',')]
+            elif kind == 'Style' and columns and 'fontname' in columns:
+                fields = value.split(',')
+                if len(fields) >= len(columns):
+                    names.add(fields[columns.index('fontname')])
+        elif section == '[events]' and stripped.startswith(('Dialogue', 'Comment')):
+            names.update(OVERRIDE_FONT.findall(stripped))
+    # 以 @ 开头表示竖排，使用的仍是同一字体
+    return {name.strip().lstrip('@').strip().lower() for name in names} - {''}
+
+
+def _decode_name(platform, encoding, raw):
+    if platform == 0 or (platform == 3 and encoding in (0, 1, 10)):
+        return raw.decode('utf-16-be', 'replace')
+    if platform == 3 and encoding in LEGACY_ENCODINGS:
+        packed = b''.join(raw[i:i + 2].lstrip(b'\0') for i in range(0, len(raw), 2))
+        return packed.decode(LEGACY_ENCODINGS[encoding], 'replace')
+    if platform == 1 and encoding == 0:
+        return raw.decode('mac_roman', 'replace')
+    return None
+
+
+def _sfnt_names(data, offset):
+    num_tables = struct.unpack_from('>H', data, offset + 4)[0]
+    for i in range(num_tables):
+        tag, _, table_offset, _ = struct.unpack_from('>4sIII', data, offset + 12 + 16 * i)
+        if tag == b'name':
+            break
+    else:
+        return set()
+    _, count, string_offset = struct.unpack_from('>HHH', data, table_offset)
+    storage = table_offset + string_offset
+    names = set()
+    for i in range(count):
+        platform, encoding, _, name_id, length, str_offset = struct.unpack_from('>6H', data, table_offset + 6 + 12 * i)
+        if name_id not in NAME_IDS:
+            continue
+        text = _decode_name(platform, encoding, data[storage + str_offset:storage + str_offset + length])
+        if text and text.strip():
+            names.add(text.strip().lower())
+    return names
+
+
+def font_names(data):
+    """读取 TrueType/OpenType 字体（含 TTC 字体集合）name 表中的名称，返回小写名称集合，无法解析时为空。"""
+    try:
+        if data[:4] == b'ttcf':
+            count = struct.unpack_from('>I', data, 8)[0]
+            offsets = struct.unpack_from(f'>{count}I', data, 12)
+        else:
+            offsets = (0,)
+        names = set()
+        for offset in offsets:
+            names |= _sfnt_names(data, offset)
+        return names
+    except struct.error:
+        return set()
+
+
+def font_attachments(info):
+    """源文件（probe.MediaInfo）中的字体附件流。"""
+    fonts = []
+    for stream in info.attachments:
+        mimetype = (stream.tags.get('mimetype') or '').lower()
+        filename = (stream.tags.get('filename') or '').lower()
+        if mimetype in FONT_MIMETYPES or filename.endswith(FONT_EXTS) or stream.codec_name in ('ttf', 'otf'):
+            fonts.append(stream)
+    return fonts
+
+
+def dump_attachments_command(video_path, streams, folder):
+    # 按流序号指定输出文件名，不使用附件自带的文件名，避免写到目录外；一次运行导出全部附件
+    args = []
+    for stream in streams:
+        args += [f'-dump_attachment:{stream.index}', os.path.join(folder, f"{stream.index}.font")]
+    return ['ffmpeg', '-hide_banner', '-y', *args, '-i', video_path, '-t', '0', '-f', 'null', '-']
+
+
+class FontCache:
+    """
+    按内容哈希保存字体的磁盘缓存，索引中记录每个字体的名称，以及每个源视频导出过的字体，
+    同一视频（路径、大小、修改时间不变）的附件只导出一次，不同视频中相同的字体只保存一份。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_FONT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_NAME)
+        self.index = {'version': INDEX_VERSION, 'fonts': {}, 'sources': {}}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.index = data
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            pass
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}{self.index['fonts'][digest]['ext']}")
+
+    def add(self, path, ext=None):
+        """把字体文件加入缓存，返回其哈希；不是可识别的字体时返回 None。"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        names = font_names(data)
+        if not names:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self.index['fonts']:
+            ext = ext or ('.ttc' if data[:4] == b'ttcf' else '.otf' if data[:4] == b'OTTO' else '.ttf')
+            self.index['fonts'][digest] = {'ext': ext, 'names': sorted(names)}
+        cached = self.path_for(digest)
+        if not os.path.isfile(cached):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{cached}.{os.getpid()}.tmp"
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, cached)
+        return digest
+
+    @staticmethod
+    def source_key(path):
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def attached_fonts(self, processor, video_path):
+        """导出视频中的字体附件（已导出过时直接复用），返回字体哈希列表。"""
+        key = self.source_key(video_path)
+        digests = self.index['sources'].get(key)
+        if digests is not None and all(os.path.isfile(self.path_for(d)) for d in digests):
+            return digests
+
+        streams = font_attachments(processor.probe(video_path))
+        digests = []
+        if streams:
+            processor.log(f"导出视频中的 {len(streams)} 个字体附件")
+            with tempfile.TemporaryDirectory(prefix="videoprocessor_fonts_") as folder:
+                processor.run_command(dump_attachments_command(video_path, streams, folder))
+                for stream in streams:
+                    path = os.path.join(folder, f"{stream.index}.font")
+                    if not os.path.isfile(path):
+                        continue
+                    ext = os.path.splitext(stream.tags.get('filename') or '')[1].lower()
+                    digest = self.add(path, ext if ext in FONT_EXTS else None)
+                    if digest:
+                        digests.append(digest)
+        self.index['sources'][key] = digests
+        self.save()
+        return digests
+
+    def local_fonts(self, folder):
+        """源文件夹及其字体子目录中的字体文件，返回字体哈希列表。"""
+        paths = []
+        for directory in [folder] + [os.path.join(folder, d) for d in LOCAL_FONT_DIRS]:
+            if not os.path.isdir(directory):
+                continue
+            paths += [os.path.join(directory, n) for n in sorted(os.listdir(directory))
+                      if n.lower().endswith(FONT_EXTS)]
+
+        digests = []
+        for path in paths:
+            key = self.source_key(path)
+            cached = self.index['sources'].get(key)
+            if cached is None or not all(os.path.isfile(self.path_for(d)) for d in cached):
+                digest = self.add(path, os.path.splitext(path)[1].lower())
+                cached = [digest] if digest else []
+                self.index['sources'][key] = cached
+            digests += cached
+        if paths:
+            self.save()
+        return digests
+
+
+def prepare_fonts(processor, font_cache, video_path, subtitle_path, fonts_dir):
+    """
+    把字幕引用的字体（来自视频的字体附件和源文件夹中的字体文件）放入本任务的 fonts_dir，
+    返回放入的字体文件列表；字幕没有引用字体或一个都找不到时返回空列表。
+    """
+    shutil.rmtree(fonts_dir, ignore_errors=True)
+    wanted = referenced_fonts(subtitle_path)
+    if not wanted:
+        return []
+
+    # 附件优先，与源文件夹中同名的字体都放入，由 libass 按样式挑选
+    digests = font_cache.attached_fonts(processor, video_path)
+    digests += font_cache.local_fonts(os.path.dirname(os.path.abspath(video_path)))
+    fonts = font_cache.index['fonts']
+    selected = [d for d in dict.fromkeys(digests) if wanted & set(fonts[d]['names'])]
+    found = set().union(*(fonts[d]['names'] for d in selected)) if selected else set()
+    missing = sorted(wanted - found)
+    if missing:
+        processor.log(f"字幕引用的字体未在附件或源文件夹中找到，由系统字体代替: {', '.join(missing)}")
+    if not selected:
+        return []
+
+    os.makedirs(fonts_dir, exist_ok=True)
+    outputs = []
+    for digest in selected:
+        output = os.path.join(fonts_dir, os.path.basename(font_cache.path_for(digest)))
+        processor.scratch.link_or_copy(font_cache.path_for(digest), output)
+        outputs.append(output)
+    processor.log(f"字体: 字幕引用 {len(wanted)} 个字体，放入 {len(outputs)} 个字体文件")
+    return outputs
@@ -0,0 +1,130 @@
+import glob
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+
+NUMA_NODE_GLOB = "/sys/devices/system/node/node[0-9]*/cpulist"
+
+
+def parse_cpu_list(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    # 优先使用当前进程允许运行的 CPU，容器或 taskset 限制下比 cpu_count 准确
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """读取各 NUMA 节点的 CPU 列表，非 Linux 或单节点时返回空列表。"""
+    nodes = []
+    for path in sorted(glob.glob(NUMA_NODE_GLOB)):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cpus = parse_cpu_list(f.read())
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes if len(nodes) > 1 else []
+
+
+class ResourceGovernor:
+    """
+    把总 CPU 预算分给同时运行的编码进程：每个编码进程按需租用若干核心，核心不足时等待，
+    按租到的核心数设置 FFmpeg/x264 的线程数，可选把进程绑定到这些核心（同一 NUMA 节点内）并调低优先级。
+    """
+
+    def __init__(self, cores=None, cpu_set=None, pin=False, numa=False, nice=None):
+        cpus = sorted(cpu_set) if cpu_set else available_cpus()
+        self.cpus = cpus[:cores] if cores else cpus
+        self.budget = len(self.cpus)
+        self.pin = pin
+        self.nice = nice
+        # 绑定核心和调整优先级用的外部命令，找不到时为 None（Windows，或未安装 util-linux 的 Linux）
+        self.taskset = shutil.which('taskset') if pin and os.name != 'nt' else None
+        self.nice_cmd = shutil.which('nice') if nice and os.name != 'nt' else None
+        # 只保留落在预算内的节点
+        self.nodes = [
+            [cpu for cpu in node if cpu in self.cpus] for node in numa_nodes()
+        ] if numa else []
+        self.nodes = [node for node in self.nodes if node]
+        self._free = list(self.cpus)
+        self._cond = threading.Condition()
+
+    def share(self, concurrency):
+        """concurrency 个编码同时运行时每个可分到的核心数。"""
+        return max(1, self.budget // max(1, concurrency))
+
+    def _take(self, count):
+        free = set(self._free)
+        chosen = None
+        # 优先从空闲核心足够的单个 NUMA 节点中分配，避免跨节点访问内存
+        for node in sorted(self.nodes, key=lambda n: -len(free.intersection(n))):
+            in_node = [cpu for cpu in node if cpu in free]
+            if len(in_node) >= count:
+                chosen = in_node[:count]
+                break
+        if chosen is None:
+            chosen = self._free[:count]
+        for cpu in chosen:
+            self._free.remove(cpu)
+        return chosen
+
+    @contextmanager
+    def lease(self, threads=None):
+        """租用 threads 个核心，返回核心编号列表；threads 为 None 时不占用预算（流复制等）。"""
+        if not threads:
+            yield []
+            return
+        count = min(threads, self.budget)
+        with self._cond:
+            while len(self._free) < count:
+                self._cond.wait()
+            cpus = self._take(count)
+        try:
+            yield cpus
+        finally:
+            with self._cond:
+                self._free.extend(cpus)
+                self._free.sort()
+                self._cond.notify_all()
+
+    def thread_args(self, cmd, threads):
+        """在输出文件前插入线程参数：编码线程、滤镜线程，以及 x264 的前瞻线程（x264 默认为线程数的 1/6）。"""
+        args = ['-threads', str(threads), '-filter_threads', str(threads)]
+        cmd = list(cmd)
+        if 'libx264' in cmd:
+            lookahead = f"lookahead-threads={max(1, threads // 6)}"
+            if '-x264-params' in cmd:
+                i = cmd.index('-x264-params') + 1
+                cmd[i] = f"{cmd[i]}:{lookahead}"
+            else:
+                args += ['-x264-params', lookahead]
+        return cmd[:-1] + args + cmd[-1:]
+
+    def wrap(self, cmd, cpus):
+        """
+        在命令前加上 taskset/nice，由它们绑定核心、调整优先级后再 exec FFmpeg，FFmpeg 的所有线程都继承这些设置；
+        不在子进程中执行 Python 代码（preexec_fn 在多线程程序中不安全）。无需处理时原样返回。
+        """
+        prefix = []
+        if self.taskset and cpus:
+            prefix += [self.taskset, '-c', ','.join(str(cpu) for cpu in cpus)]
+        if self.nice_cmd and self.nice:
+            prefix += [self.nice_cmd, '-n', str(self.nice)]
+        return prefix + list(cmd)
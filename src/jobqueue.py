@@ -0,0 +1,267 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from supervisor import JobCancelled
+
+
+DEFAULT_QUEUE_DB = os.path.join(os.path.expanduser("~"), ".videoprocessor", "queue.db")
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    folder TEXT NOT NULL,
+    video TEXT,
+    subtitle TEXT,
+    tail TEXT,
+    options TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    outputs TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pick ON jobs (state, priority DESC, id);
+"""
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    保存在 SQLite 文件中的任务队列，多个工作进程（可在不同主机上共享同一文件）通过租约领取任务。
+    租约需要定期续期，进程崩溃后租约过期，任务会被其他工作进程重新领取。
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 共享到网络文件系统时 WAL 不可用，保持默认的回滚日志模式
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.executescript(SCHEMA)
+
+    def _write(self, func):
+        # BEGIN IMMEDIATE 在读取前就拿到写锁，多个进程不会领到同一个任务
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn, time.time())
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, folder, options, priority=0, video=None, subtitle=None, tail=None,
+                max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """加入一个任务，options 为 VideoProcessor.process_video 的关键字参数，返回任务编号。"""
+        def insert(conn, now):
+            cursor = conn.execute(
+                "INSERT INTO jobs (folder, video, subtitle, tail, options, priority, max_attempts, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(folder), video, subtitle, tail, json.dumps(options, ensure_ascii=False),
+                 priority, max_attempts, now, now)
+            )
+            return cursor.lastrowid
+        return self._write(insert)
+
+    def lease(self, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """领取优先级最高的任务（包括租约已过期的运行中任务），没有可领的任务时返回 None。"""
+        def pick(conn, now):
+            # 超过重试次数的过期任务不再领取，直接标记为失败
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', error = '租约过期次数过多', updated_at = ?"
+                " WHERE state = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' OR (state = 'running' AND lease_expires < ?)"
+                " ORDER BY priority DESC, id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'running', lease_owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                " error = NULL, updated_at = ? WHERE id = ?",
+                (owner, now + lease_seconds, now, row['id'])
+            )
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+        row = self._write(pick)
+        return self._to_dict(row) if row else None
+
+    def heartbeat(self, job_id, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """续租，任务已被取消或租约已被他人领走时返回 False。"""
+        def renew(conn, now):
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ?"
+                " WHERE id = ? AND state = 'running' AND lease_owner = ?",
+                (now + lease_seconds, now, job_id, owner)
+            )
+            return cursor.rowcount == 1
+        return self._write(renew)
+
+    def complete(self, job_id, owner, outputs):
+        def finish(conn, now):
+            conn.execute(
+                "UPDATE jobs SET state = 'done', outputs = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND state = 'running' AND lease_owner = ?",
+                (json.dumps(outputs, ensure_ascii=False), now, job_id, owner)
+            )
+        self._write(finish)
+
+    def fail(self, job_id, owner, error):
+        """任务失败，未超过重试次数时重新排队。"""
+        def finish(conn, now):
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,"
+                " error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND state = 'running' AND lease_owner = ?",
+                (error, now, job_id, owner)
+            )
+        self._write(finish)
+
+    def release(self, job_id, owner, reason):
+        """放回队列而不计入尝试次数（工作进程被中断，任务本身没有失败）。"""
+        def requeue(conn, now):
+            conn.execute(
+                "UPDATE jobs SET state = 'queued', attempts = MAX(attempts - 1, 0), error = ?,"
+                " lease_owner = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND state = 'running' AND lease_owner = ?",
+                (reason, now, job_id, owner)
+            )
+        self._write(requeue)
+
+    def cancel(self, job_id):
+        """取消排队或运行中的任务；运行中的任务在工作进程下次续租时得知。返回是否取消成功。"""
+        def update(conn, now):
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'cancelled', lease_owner = NULL, updated_at = ?"
+                " WHERE id = ? AND state IN ('queued', 'running')",
+                (now, job_id)
+            )
+            return cursor.rowcount == 1
+        return self._write(update)
+
+    def status(self, job_id=None):
+        with self._lock:
+            if job_id is None:
+                rows = self.conn.execute("SELECT * FROM jobs ORDER BY priority DESC, id").fetchall()
+            else:
+                rows = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['outputs'] = json.loads(job['outputs']) if job['outputs'] else []
+        return job
+
+
+class LeaseKeeper:
+    """
+    后台线程定期为正在处理的任务续租，得知任务被取消或租约丢失后设置 lost，
+    并调用 on_lost（如 VideoProcessor.cancel）中止正在进行的编码。
+    """
+
+    def __init__(self, queue, job_id, owner, lease_seconds, on_lost=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.on_lost = on_lost
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.owner, self.lease_seconds):
+                    self.lost.set()
+                    if self.on_lost:
+                        self.on_lost()
+                    return
+            except sqlite3.Error:
+                # 数据库暂时被锁或网络存储抖动，下次再试，租约过期前还有两次机会
+                continue
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, processor, owner=None, lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=10.0,
+               once=False):
+    """
+    循环领取并处理任务。once 为 True 时队列空了就返回，否则每 poll_interval 秒检查一次新任务。
+    返回本进程处理的任务数；工作进程被中断（processor.cancel，如 Ctrl+C）时抛出 JobCancelled，
+    包括在两个任务之间或等待新任务时被中断。
+    """
+    owner = owner or default_owner()
+    handled = 0
+    while True:
+        processor.supervisor.check()
+        job = queue.lease(owner, lease_seconds)
+        if job is None:
+            if once:
+                return handled
+            # 等待新任务期间被中断时立即退出
+            processor.supervisor.wait_cancelled(poll_interval)
+            continue
+
+        handled += 1
+        processor.log(f"领取任务 #{job['id']}（优先级 {job['priority']}，第 {job['attempts']} 次）: "
+                      f"{job['video'] or job['folder']}")
+        keeper = LeaseKeeper(queue, job['id'], owner, lease_seconds, on_lost=processor.cancel)
+        try:
+            with keeper:
+                try:
+                    outputs = processor.process_video(
+                        job['folder'],
+                        tail_path=job['tail'],
+                        video_path=job['video'],
+                        subtitle_path=job['subtitle'],
+                        **job['options']
+                    )
+                except JobCancelled:
+                    if not keeper.lost.is_set():
+                        # 不是队列取消的（如工作进程收到 Ctrl+C），放回队列后退出
+                        queue.release(job['id'], owner, "工作进程被中断")
+                        raise
+                    processor.log(f"任务 #{job['id']} 已被取消或租约已失效，已中止处理")
+                    continue
+                except Exception as e:
+                    processor.log(f"任务 #{job['id']} 失败: {str(e)}", error=True)
+                    queue.fail(job['id'], owner, str(e))
+                    continue
+            if keeper.lost.is_set():
+                processor.log(f"任务 #{job['id']} 已被取消或租约已失效，结果不写回队列")
+                continue
+            queue.complete(job['id'], owner, outputs)
+            processor.log(f"任务 #{job['id']} 完成")
+        finally:
+            if keeper.lost.is_set():
+                # 队列发来的取消只针对这个任务，任务结束后才清除，不影响后续任务
+                processor.supervisor.reset()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+
+
+VIDEO_EXTS = ('.mp4', '.mkv', '.avi', '.mov', '.flv')
+SUB_EXTS = ('.srt', '.ass', '.ssa')
+INDEX_NAME = ".videoprocessor_library.json"
+INDEX_VERSION = 1
+# 处理过程中生成的文件和目录，扫描时跳过
+OUTPUT_DIRS = {'segments', 'chunks'}
+OUTPUT_DIR_SUFFIX = '_output'
+OUTPUT_PREFIXES = ('burned', 'adjusted_subtitles', 'final_', 'part_', 'full_video', 'temp_', 'transcoded_tail')
+# 字幕文件名末尾的语言标记，按优先级排列，多个字幕都能匹配时优先选靠前的
+LANGUAGE_SUFFIXES = (
+    'chs', 'sc', 'gb', 'zh-hans', 'zh-cn', 'zh', 'chi', 'chs&eng', 'chs_eng', 'chseng',
+    'cht', 'tc', 'big5', 'zh-hant', 'zh-tw', 'cht&eng', 'cht_eng', 'chteng',
+    'en', 'eng', 'ja', 'jp', 'jpn',
+)
+EPISODE_PATTERNS = (
+    re.compile(r'[Ss](\d{1,2})[ ._-]?[Ee](\d{1,3})'),
+    re.compile(r'第\s*(\d{1,3})\s*[集话話]'),
+    re.compile(r'(?:^|[ ._\-\[])(?:EP?|ep?)[ ._-]?(\d{1,3})(?=$|[ ._\-\]v])'),
+    re.compile(r'\[(\d{1,3})(?:v\d)?\]'),
+    re.compile(r'[ ._]-[ ._](\d{1,3})(?=$|[ ._\[(])'),
+)
+
+
+@dataclass
+class LibraryJob:
+    """一个待处理的标题：视频、配对的字幕、共用的尾巴，以及成品输出目录。"""
+    video: str
+    subtitle: str
+    tail: str = None
+    output_dir: str = None
+    episode: str = None
+
+
+def is_output_file(name):
+    lower = name.lower()
+    return lower.startswith(OUTPUT_PREFIXES) or lower.startswith('.videoprocessor')
+
+
+def is_tail_file(name):
+    lower = name.lower()
+    return lower.startswith('tail') and lower.endswith(VIDEO_EXTS)
+
+
+def strip_language(stem):
+    """'Show.S01E02.chs' -> ('Show.S01E02', 'chs')，没有语言标记时语言为 None。"""
+    base, dot, suffix = stem.rpartition('.')
+    if dot and suffix.lower() in LANGUAGE_SUFFIXES:
+        return base, suffix.lower()
+    return stem, None
+
+
+def episode_key(stem):
+    """提取 (季, 集)，没有季号时季为 None，无法识别时返回 None。"""
+    for pattern in EPISODE_PATTERNS:
+        match = pattern.search(stem)
+        if match:
+            groups = [int(g) for g in match.groups()]
+            return (groups[0], groups[1]) if len(groups) == 2 else (None, groups[0])
+    return None
+
+
+def _language_rank(language):
+    return LANGUAGE_SUFFIXES.index(language) if language in LANGUAGE_SUFFIXES else len(LANGUAGE_SUFFIXES)
+
+
+def pair_subtitles(videos, subtitles):
+    """
+    为同一目录下的每个视频选字幕，依次按：完全同名、去掉语言标记后同名、集数相同。
+    多个字幕都匹配时按语言优先级选择；目录中只有一个视频时退回到任意一个字幕。
+    返回 {视频文件名: 字幕文件名}，找不到字幕的视频不出现在结果中。
+    """
+    subs = []
+    for name in subtitles:
+        stem = os.path.splitext(name)[0]
+        base, language = strip_language(stem)
+        subs.append((name, stem, base, language, episode_key(base)))
+
+    def best(candidates):
+        return min(candidates, key=lambda s: (_language_rank(s[3]), s[0]))[0] if candidates else None
+
+    pairs = {}
+    for video in videos:
+        stem = os.path.splitext(video)[0]
+        match = next((s[0] for s in subs if s[1] == stem), None)
+        match = match or best([s for s in subs if s[2] == stem])
+        if not match:
+            episode = episode_key(stem)
+            if episode:
+                # 有一方缺季号时只比较集数
+                match = best([
+                    s for s in subs if s[4] and s[4][1] == episode[1]
+                    and (s[4][0] is None or episode[0] is None or s[4][0] == episode[0])
+                ])
+        if match:
+            pairs[video] = match
+    if len(videos) == 1 and videos[0] not in pairs and subs:
+        pairs[videos[0]] = best(subs)
+    return pairs
+
+
+def _dir_signature(entries):
+    data = json.dumps(sorted(entries), ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class LibraryScanner:
+    """
+    递归扫描目录树，生成 LibraryJob 列表。每个目录的文件 (名称, 大小, 修改时间) 与
+    上次扫描的索引相同时直接复用上次的配对结果，只有变化的目录重新配对。
+    """
+
+    def __init__(self, root, index_path=None):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path or os.path.join(self.root, INDEX_NAME)
+        self.index = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION and data.get('root') == self.root:
+                self.index = data.get('dirs', {})
+        except (OSError, ValueError):
+            pass
+        self.rescanned = 0
+
+    def scan(self):
+        jobs = []
+        seen = {}
+        # 每个目录可用的尾巴：自身目录中的 tail 文件，否则沿用上级目录的
+        tails = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if d not in OUTPUT_DIRS and not d.startswith('.')
+                                 and not d.endswith(OUTPUT_DIR_SUFFIX))
+            parent_tail = tails.get(os.path.dirname(dirpath))
+            entries = []
+            for name in filenames:
+                if is_output_file(name) or not name.lower().endswith(VIDEO_EXTS + SUB_EXTS):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                entries.append((name, stat.st_size, stat.st_mtime_ns))
+
+            local_tail = sorted(name for name, _, _ in entries if is_tail_file(name))
+            tails[dirpath] = os.path.join(dirpath, local_tail[0]) if local_tail else parent_tail
+
+            rel = os.path.relpath(dirpath, self.root)
+            signature = _dir_signature(entries)
+            cached = self.index.get(rel)
+            if cached and cached['signature'] == signature:
+                pairs = cached['pairs']
+            else:
+                names = [name for name, _, _ in entries]
+                videos = sorted(n for n in names if n.lower().endswith(VIDEO_EXTS) and not is_tail_file(n))
+                subtitles = sorted(n for n in names if n.lower().endswith(SUB_EXTS))
+                pairs = pair_subtitles(videos, subtitles)
+                self.rescanned += 1
+            seen[rel] = {'signature': signature, 'pairs': pairs}
+
+            for video, subtitle in sorted(pairs.items()):
+                stem = os.path.splitext(video)[0]
+                episode = episode_key(stem)
+                jobs.append(LibraryJob(
+                    video=os.path.join(dirpath, video),
+                    subtitle=os.path.join(dirpath, subtitle),
+                    tail=tails[dirpath],
+                    # 一个目录只有一个标题时与原来一样输出到该目录，否则每个标题单独一个输出目录
+                    output_dir=dirpath if len(pairs) == 1 else os.path.join(dirpath, f"{stem}{OUTPUT_DIR_SUFFIX}"),
+                    episode=f"S{episode[0] or 1:02}E{episode[1]:02}" if episode else None,
+                ))
+
+        self.index = seen
+        self.save()
+        return jobs
+
+    def save(self):
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'root': self.root, 'dirs': self.index}, f,
+                          ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            pass
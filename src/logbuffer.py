@@ -0,0 +1,111 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+
+DEFAULT_LOG_FILE = os.path.join(os.path.expanduser("~"), ".videoprocessor", "videoprocessor.log")
+LOG_FILE_MAX_BYTES = 10 * 1024 ** 2
+LOG_FILE_BACKUPS = 3
+# FFmpeg 不带 -progress 运行时每秒输出多次的统计行
+STATS_PREFIXES = ('frame=', 'size=')
+
+
+class LogBuffer:
+    """
+    固定容量的环形缓冲区，工作线程写入、界面线程批量取出。
+    界面来不及取时丢弃最旧的条目，并记录丢弃了多少条。
+    """
+
+    def __init__(self, maxlen=2000):
+        self._items = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def append(self, item):
+        with self._lock:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+
+    def drain(self):
+        """取出全部条目，返回 (条目列表, 上次取出以来丢弃的条数)。"""
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+            dropped, self.dropped = self.dropped, 0
+        return items, dropped
+
+
+class RateLimiter:
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last < self.interval:
+                return False
+            self._last = now
+            return True
+
+
+class ConsoleLog:
+    """
+    没有界面时（命令行、队列工作进程、基准测试）的日志输出。处理日志原样写到标准输出；
+    FFmpeg 的原始输出每秒最多 max_lines 行，超出的只计数，下一秒输出时提示省略了多少行，完整内容在日志文件中。
+    """
+
+    def __init__(self, max_lines=20, stream=None):
+        self.max_lines = max_lines
+        # 未指定时每次写入都取当前的 sys.stdout，重定向（如 contextlib.redirect_stdout）后仍然有效
+        self.stream = stream
+        self._window = 0
+        self._count = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def _write(self, text):
+        stream = self.stream or sys.stdout
+        stream.write(text + "\n")
+        stream.flush()
+
+    def log(self, message, error=False):
+        with self._lock:
+            self._write(message)
+
+    def output(self, line):
+        window = int(time.monotonic())
+        with self._lock:
+            if window != self._window:
+                self._window, self._count = window, 0
+                if self.dropped:
+                    self._write(f"（省略了 {self.dropped} 行 FFmpeg 输出，完整内容见日志文件）")
+                    self.dropped = 0
+            if self._count >= self.max_lines:
+                self.dropped += 1
+                return
+            self._count += 1
+            self._write(line)
+
+
+def is_stats_line(line):
+    return line.startswith(STATS_PREFIXES)
+
+
+def open_log_file(path=DEFAULT_LOG_FILE, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS):
+    """完整日志写入按大小轮转的文件，内存中只保留界面显示的部分。"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    logger = logging.getLogger(f"videoprocessor.{os.path.abspath(path)}")
+    if not logger.handlers:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+
+MANIFEST_NAME = ".videoprocessor_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_fingerprint(path):
+    """用大小和修改时间代替内容哈希标识文件，对几十 GB 的视频也是瞬间完成。"""
+    if not path or not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class JobManifest:
+    """
+    记录每个阶段的输入（文件指纹与参数）和输出文件。重跑时输入未变且输出完好的阶段直接跳过，
+    阶段完成后立即落盘，进程被杀掉后也能从最后一个完成的阶段继续。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.stages = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.stages = data.get('stages', {})
+        except (OSError, ValueError):
+            pass
+
+    def is_fresh(self, stage, inputs):
+        with self._lock:
+            record = self.stages.get(stage)
+        if not record or record.get('inputs') != inputs:
+            return False
+        # 输出被删除或被修改过都视为需要重做
+        return all(file_fingerprint(out['path']) == out for out in record.get('outputs', []))
+
+    def outputs(self, stage):
+        with self._lock:
+            return [out['path'] for out in self.stages.get(stage, {}).get('outputs', [])]
+
+    def record(self, stage, inputs, outputs):
+        with self._lock:
+            self.stages[stage] = {
+                'inputs': inputs,
+                'outputs': [fp for fp in map(file_fingerprint, outputs) if fp],
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            self._save()
+
+    def invalidate(self, stage):
+        with self._lock:
+            if self.stages.pop(stage, None) is not None:
+                self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'stages': self.stages}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
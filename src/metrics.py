@@ -0,0 +1,251 @@
+import cProfile
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+
+REPORT_NAME = ".videoprocessor_metrics.json"
+METRIC_PREFIX = "videoprocessor"
+# 写入 Prometheus 文本文件的阶段指标：(字段, 指标名, 说明)
+STAGE_METRICS = (
+    ('wall_seconds', 'stage_wall_seconds', '上一个任务各阶段的墙钟时间（秒），包含其中嵌套阶段的时间'),
+    ('python_cpu_seconds', 'stage_python_cpu_seconds', '上一个任务各阶段本进程（Python 侧）消耗的 CPU 时间（秒）'),
+    ('child_user_seconds', 'stage_child_user_cpu_seconds', '上一个任务各阶段子进程的用户态 CPU 时间（秒）'),
+    ('child_system_seconds', 'stage_child_system_cpu_seconds', '上一个任务各阶段子进程的内核态 CPU 时间（秒）'),
+    ('read_bytes', 'stage_read_bytes', '上一个任务各阶段子进程的块设备读取字节数'),
+    ('write_bytes', 'stage_write_bytes', '上一个任务各阶段子进程的块设备写入字节数'),
+    ('peak_rss_bytes', 'stage_peak_rss_bytes', '上一个任务各阶段子进程的最大常驻内存（字节）'),
+    ('fps', 'stage_fps', '上一个任务各阶段 FFmpeg 报告的帧率（按进程运行时间加权平均）'),
+    ('speed', 'stage_speed', '上一个任务各阶段 FFmpeg 报告的实时倍速（按进程运行时间加权平均）'),
+    ('processes', 'stage_processes', '上一个任务各阶段启动的子进程数'),
+)
+
+
+@dataclass
+class StageMetrics:
+    """一个阶段的耗时与资源统计。子进程的资源来自各进程退出时的 rusage，Windows 上为 0。"""
+    name: str
+    parent: str = None
+    skipped: bool = False
+    wall_seconds: float = 0.0
+    python_cpu_seconds: float = 0.0
+    child_user_seconds: float = 0.0
+    child_system_seconds: float = 0.0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    peak_rss_bytes: int = 0
+    processes: int = 0
+    fps: float = None
+    speed: float = None
+    # 计算 fps/speed 加权平均用的 (加权和, 总时长)
+    _rates: dict = field(default_factory=dict, repr=False)
+
+    def add_process(self, stats):
+        self.processes += 1
+        self.child_user_seconds = round(self.child_user_seconds + (stats.user_cpu or 0.0), 3)
+        self.child_system_seconds = round(self.child_system_seconds + (stats.system_cpu or 0.0), 3)
+        self.read_bytes += stats.read_bytes or 0
+        self.write_bytes += stats.write_bytes or 0
+        self.peak_rss_bytes = max(self.peak_rss_bytes, stats.max_rss_bytes or 0)
+        for key in ('fps', 'speed'):
+            value = getattr(stats, key)
+            if value is None or stats.seconds <= 0:
+                continue
+            total, seconds = self._rates.get(key, (0.0, 0.0))
+            total, seconds = total + value * stats.seconds, seconds + stats.seconds
+            self._rates[key] = (total, seconds)
+            setattr(self, key, round(total / seconds, 3))
+
+    def to_dict(self):
+        data = asdict(self)
+        del data['_rates']
+        return data
+
+
+class JobMetrics:
+    """一个任务按开始顺序排列的各阶段统计；阶段可以嵌套，子进程计入最内层的阶段。"""
+
+    def __init__(self, video, folder):
+        self.video = video
+        self.folder = folder
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.success = None
+        self.error = None
+        self.stages = []
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, skipped=False):
+        with self._lock:
+            metrics = StageMetrics(name, parent=self._stack[-1].name if self._stack else None, skipped=skipped)
+            self.stages.append(metrics)
+            self._stack.append(metrics)
+        started, cpu_started = time.monotonic(), time.process_time()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_seconds = round(time.monotonic() - started, 3)
+            metrics.python_cpu_seconds = round(time.process_time() - cpu_started, 3)
+            with self._lock:
+                self._stack.remove(metrics)
+
+    def add_process(self, stats):
+        with self._lock:
+            if self._stack:
+                self._stack[-1].add_process(stats)
+
+    def totals(self):
+        """按阶段名汇总（同名阶段可能出现多次，如每段的拼接）。"""
+        totals = {}
+        for stage in self.stages:
+            total = totals.setdefault(stage.name, StageMetrics(stage.name, parent=stage.parent))
+            for key in ('wall_seconds', 'python_cpu_seconds', 'child_user_seconds', 'child_system_seconds',
+                        'read_bytes', 'write_bytes', 'processes'):
+                setattr(total, key, round(getattr(total, key) + getattr(stage, key), 3))
+            total.peak_rss_bytes = max(total.peak_rss_bytes, stage.peak_rss_bytes)
+            for key, (weighted, seconds) in stage._rates.items():
+                old_weighted, old_seconds = total._rates.get(key, (0.0, 0.0))
+                total._rates[key] = (old_weighted + weighted, old_seconds + seconds)
+                setattr(total, key, round(total._rates[key][0] / total._rates[key][1], 3))
+        return totals
+
+    def to_dict(self):
+        return {
+            'video': self.video,
+            'folder': self.folder,
+            'host': socket.gethostname(),
+            'started_at': self.started_at,
+            'wall_seconds': self.wall_seconds,
+            'success': self.success,
+            'error': self.error,
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+
+    def summary(self):
+        """日志中的一行汇总：各阶段墙钟时间与子进程 CPU 时间。"""
+        parts = []
+        for name, total in self.totals().items():
+            cpu = total.child_user_seconds + total.child_system_seconds
+            speed = f" {total.speed:.2f}x" if total.speed else ""
+            parts.append(f"{name} {total.wall_seconds:.1f}s（CPU {cpu:.1f}s{speed}）")
+        return "，".join(parts)
+
+
+def _write_atomic(path, text):
+    # node exporter 可能随时读取，先写临时文件再改名
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(job):
+    """把一个任务的统计转为 Prometheus 文本格式，供 node exporter 的 textfile 收集器读取。"""
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                         else f"{METRIC_PREFIX}_{name} {value}")
+
+    totals = job.totals()
+    for key, name, help_text in STAGE_METRICS:
+        samples = [({'stage': stage}, getattr(total, key)) for stage, total in totals.items()
+                   if getattr(total, key) is not None]
+        if samples:
+            metric(name, help_text, samples)
+    metric('last_job_wall_seconds', '上一个任务的总耗时（秒）', [({}, round(job.wall_seconds, 3))])
+    metric('last_job_success', '上一个任务是否成功（1 成功，0 失败或取消）', [({}, int(bool(job.success)))])
+    metric('last_job_timestamp_seconds', '上一个任务结束的时间（Unix 时间戳）', [({}, round(time.time(), 3))])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRecorder:
+    """
+    记录每个任务各阶段的耗时与资源消耗。report 为 True 时把 JSON 报告写入任务的输出文件夹；
+    textfile 为 Prometheus 文本文件路径（如 node exporter textfile 收集器目录中的 .prom 文件）；
+    profile_dir 不为空时用 cProfile 分析调用 process_video 的线程，每个任务写出一个 .prof 文件。
+    """
+
+    def __init__(self, report=False, textfile=None, profile_dir=None):
+        self.report = report
+        self.textfile = textfile
+        self.profile_dir = profile_dir
+        self.current = None
+
+    def on_process(self, stats):
+        job = self.current
+        if job is not None:
+            job.add_process(stats)
+
+    def stage(self, name, skipped=False):
+        """记录一个阶段；不在任务中（如基准测试直接调用烧录）时不记录。"""
+        if self.current is None:
+            return _null_stage()
+        return self.current.stage(name, skipped)
+
+    @contextmanager
+    def job(self, processor, video, folder):
+        job = JobMetrics(video, folder)
+        self.current = job
+        profiler = None
+        if self.profile_dir:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 已有其他分析器在运行（如 python -m cProfile）
+                processor.log("已有其他 Python 分析器在运行，本任务不做 cProfile 分析", error=True)
+                profiler = None
+        started = time.monotonic()
+        try:
+            yield job
+            job.success = True
+        except BaseException as e:
+            job.success = False
+            job.error = str(e) or type(e).__name__
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            job.wall_seconds = round(time.monotonic() - started, 3)
+            self.current = None
+            if job.stages:
+                processor.log(f"各阶段耗时: {job.summary()}")
+            self.write(processor, job, profiler)
+
+    def write(self, processor, job, profiler=None):
+        try:
+            if self.report and os.path.isdir(job.folder):
+                path = os.path.join(job.folder, REPORT_NAME)
+                _write_atomic(path, json.dumps(job.to_dict(), ensure_ascii=False, indent=2))
+                processor.log(f"性能报告已写入: {path}")
+            if self.textfile:
+                os.makedirs(os.path.dirname(os.path.abspath(self.textfile)), exist_ok=True)
+                _write_atomic(self.textfile, prometheus_text(job))
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                stem = os.path.splitext(os.path.basename(job.video or job.folder))[0]
+                path = os.path.join(self.profile_dir, f"{stem}_{int(job.started_at)}.prof")
+                profiler.dump_stats(path)
+                processor.log(f"cProfile 结果已写入: {path}（可用 python -m pstats 查看）")
+        except OSError as e:
+            processor.log(f"写入性能统计失败: {str(e)}", error=True)
+
+
+@contextmanager
+def _null_stage():
+    yield None
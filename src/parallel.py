@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_plan import AudioTrack
+from split_planner import load_packet_index, seek_arg
+
+
+STATS_FILE = os.path.join(os.path.expanduser("~"), ".videoprocessor_stats.json")
+# 分块过短时 x264 的前瞻和启动开销会抵消并行收益
+MIN_CHUNK_SECONDS = 30
+
+
+def plan_chunks(keyframes, start_time, duration, workers):
+    """
+    把 [start_time, start_time + duration) 切成最多 workers 段，
+    每个切点吸附到离理想位置最近的关键帧，返回 (开始, 结束) 列表。
+    """
+    end_time = start_time + duration
+    count = max(1, min(workers, int(duration // MIN_CHUNK_SECONDS)))
+    candidates = [k for k in keyframes if start_time < k < end_time]
+    cuts = []
+    for i in range(1, count):
+        target = start_time + duration * i / count
+        if not candidates:
+            break
+        best = min(candidates, key=lambda k: abs(k - target))
+        if not cuts or best > cuts[-1]:
+            cuts.append(best)
+    bounds = [start_time] + cuts + [end_time]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def load_burn_stats():
+    try:
+        with open(STATS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_burn_speed(key, kind, speed):
+    """记录某种模式/分辨率下单进程或并行烧录的实时倍速，用于计算加速比。"""
+    stats = load_burn_stats()
+    stats.setdefault(key, {})[kind] = round(speed, 3)
+    try:
+        with open(STATS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+    except OSError:
+        pass
+
+
+def chunk_command(processor, input_file, start_time, chunk_start, chunk_end, vf, mode, chunk_path):
+    """chunk_start/chunk_end 为源文件时间轴上的绝对时间（关键帧 pts），start_time 为源文件的起始时间。"""
+    return [
+        'ffmpeg', '-hide_banner', '-y',
+        '-ss', seek_arg(chunk_start, start_time), '-t', f"{chunk_end - chunk_start:.6f}",
+        '-copyts', '-i', input_file,
+        '-vf', vf, '-an', '-sn',
+        *processor.video_encode_args(mode),
+        chunk_path
+    ]
+
+
+def burn_subtitles_parallel(processor, input_file, subtitle_file, output_file, mode, workers):
+    """
+    按关键帧把源视频切成多块，每块由独立的 FFmpeg 进程烧录字幕，最后无损拼接视频并混入音频。
+    每块使用 -copyts 保留原始时间轴（含源文件的起始时间），先减去起始时间让字幕滤镜按整片的时间渲染，再用 setpts 归零。
+    """
+    started = time.monotonic()
+    info = processor.probe(input_file)
+    start_time, duration = info.start_time, info.duration
+    keyframes = load_packet_index(input_file, processor.media_probe.cache_dir, processor.supervisor).keyframes
+    chunks = plan_chunks(keyframes, start_time, duration, workers)
+    if len(chunks) < 2:
+        processor.log("视频过短或关键帧不足，改用单进程烧录")
+        processor.burn_subtitles(input_file, subtitle_file, output_file, mode)
+        return
+
+    chunk_folder = os.path.join(os.path.dirname(output_file), "chunks")
+    os.makedirs(chunk_folder, exist_ok=True)
+    threads = processor.governor.share(min(workers, len(chunks)))
+    processor.log(f"并行烧录: {len(chunks)} 块，{workers} 个进程，每进程 {threads} 线程")
+
+    subs_filter = processor.subtitle_filter(subtitle_file)
+    # 字幕按从 0 开始的时间轴制作，先减去源文件的起始时间
+    vf = f"setpts=PTS-{start_time}/TB,{subs_filter},setpts=PTS-STARTPTS"
+
+    def encode_chunk(index):
+        chunk_path = os.path.join(chunk_folder, f"chunk_{index:03d}.mp4")
+        cmd = chunk_command(processor, input_file, start_time, *chunks[index], vf, mode, chunk_path)
+        processor.run_command(cmd, progress_task=('burn', index), threads=threads)
+        return chunk_path
+
+    try:
+        # 需要转码的音频在各块编码的同时由单独的进程编码，拼接时只做流复制
+        with AudioTrack(processor, input_file, processor.audio_plan_for(input_file), chunk_folder) as audio:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                chunk_paths = list(pool.map(encode_chunk, range(len(chunks))))
+
+            list_file = os.path.join(chunk_folder, "chunks.txt")
+            with open(list_file, 'w', encoding='utf-8') as f:
+                for path in chunk_paths:
+                    f.write(f"file '{os.path.normpath(path).replace(chr(92), '/')}'\n")
+
+            cmd = [
+                'ffmpeg', '-hide_banner', '-y',
+                '-f', 'concat', '-safe', '0', '-i', list_file,
+                *audio.mux_input(),
+                '-map', '0:v:0', '-c:v', 'copy',
+                *audio.mux_map(),
+                output_file
+            ]
+            processor.run_command(cmd)
+    finally:
+        shutil.rmtree(chunk_folder, ignore_errors=True)
+
+    elapsed = time.monotonic() - started
+    speed = duration / elapsed if elapsed > 0 else 0.0
+    key = f"{processor.mode_key(mode)}:{processor.get_video_params(input_file)['height']}p"
+    record_burn_speed(key, 'parallel', speed)
+    record_burn_speed(key, f"alloc:{min(workers, len(chunks))}x{threads}", speed)
+    serial_speed = load_burn_stats().get(key, {}).get('serial')
+    if serial_speed:
+        processor.log(f"并行烧录耗时 {elapsed:.1f} 秒（{speed:.2f}x 实时），"
+                      f"相对单进程 ({serial_speed:.2f}x 实时) 加速 {speed / serial_speed:.2f} 倍")
+    else:
+        processor.log(f"并行烧录耗时 {elapsed:.1f} 秒（{speed:.2f}x 实时），"
+                      f"尚无同模式同分辨率的单进程记录可对比")
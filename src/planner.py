@@ -0,0 +1,453 @@
+import json
+import os
+import shlex
+import shutil
+import socket
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+from audio_plan import AUDIO_FILE, TS_AUDIO_CODECS, audio_encode_command
+from concat import concat_command, segment_ts_command, ts_audio_args
+from fonts import JOB_FONTS_DIR, dump_attachments_command, font_attachments, referenced_fonts
+from parallel import chunk_command, load_burn_stats, plan_chunks
+from probe import ffprobe_command
+from progress import format_eta
+from quality import (CRF_MAX, CRF_MIN, PRESETS, SAMPLE_WINDOWS, WINDOW_SECONDS, measure_command, reference_command,
+                     sample_windows, trial_command)
+from scratch import estimate_output_bytes
+from smartrender import (MAX_RENDER_WORKERS, copy_pass_command, plan_smart_render, read_header_fields, render_command,
+                         sps_encode_args)
+from split_planner import load_packet_index, packet_index_command
+from subtitles import SubtitleFile
+
+
+CALIBRATION_FILE = os.path.join(os.path.expanduser("~"), ".videoprocessor_calibration.json")
+CALIBRATION_WINDOWS = 2
+CALIBRATION_SECONDS = 5
+# 分割、转 TS、拼接尾巴都只做流复制，耗时按磁盘顺序读写的速度估算
+COPY_BYTES_PER_SECOND = 200 * 1024 ** 2
+# quality 模式每个预设大约要试编码的次数：CRF_MIN 一次加上二分查找
+QUALITY_TRIALS_PER_PRESET = 1 + (CRF_MAX - CRF_MIN).bit_length()
+
+
+@dataclass
+class PlannedStage:
+    name: str
+    commands: list = field(default_factory=list)
+    output_bytes: int = 0
+    seconds: float = None
+    notes: list = field(default_factory=list)
+
+
+@dataclass
+class JobPlan:
+    video: str
+    subtitle: str
+    tail: str = None
+    stages: list = field(default_factory=list)
+    # [(目录, 需要的字节数, 可用字节数)]
+    disk: list = field(default_factory=list)
+    notes: list = field(default_factory=list)
+
+    @property
+    def total_seconds(self):
+        """各阶段耗时之和，有阶段无法估算时为 None。"""
+        seconds = [stage.seconds for stage in self.stages]
+        return None if any(s is None for s in seconds) else sum(seconds)
+
+
+def calibration_key(height, mode_key):
+    return f"{socket.gethostname()}:{height}p:{mode_key}"
+
+
+def load_calibration():
+    try:
+        with open(CALIBRATION_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_calibration(key, result):
+    calibration = load_calibration()
+    calibration[key] = result
+    try:
+        with open(CALIBRATION_FILE, 'w', encoding='utf-8') as f:
+            json.dump(calibration, f, ensure_ascii=False, indent=2)
+    except OSError:
+        pass
+
+
+def calibrate(processor, video_path, subtitle_path, mode, run=True):
+    """
+    按当前模式试编码源视频的几个采样窗口（带字幕滤镜），测出实时倍速和输出码率相对源视频码率的比例。
+    结果按 (主机, 分辨率, 模式) 缓存，之后的预演直接使用；码率比例随内容变化，只作粗略估算。
+    返回 (结果, 是否来自缓存)，run 为 False 且没有缓存时返回 (None, False)。
+    """
+    info = processor.probe(video_path)
+    video = info.video
+    key = calibration_key(video.height if video else 0, processor.mode_key(mode))
+    cached = load_calibration().get(key)
+    if cached:
+        return cached, True
+    if not run or video is None:
+        return None, False
+
+    length = min(CALIBRATION_SECONDS, info.duration)
+    encoded_seconds = elapsed = 0.0
+    encoded_bytes = 0
+    workdir = tempfile.mkdtemp(prefix="calibrate_")
+    try:
+        for i, start in enumerate(sample_windows(info.duration, CALIBRATION_WINDOWS, CALIBRATION_SECONDS)):
+            output = os.path.join(workdir, f"sample_{i}.mp4")
+            started = time.monotonic()
+            processor.supervisor.capture([
+                'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                '-ss', str(start), '-t', str(length), '-i', video_path,
+                '-map', '0:v:0', '-vf', processor.subtitle_filter(subtitle_path),
+                *processor.video_encode_args(mode), '-an', '-sn', output
+            ], stage='calibrate')
+            elapsed += time.monotonic() - started
+            encoded_seconds += length
+            encoded_bytes += os.path.getsize(output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    source_bps = video.bit_rate or info.bit_rate
+    result = {
+        'speed': round(encoded_seconds / elapsed, 3) if elapsed > 0 else None,
+        'bitrate_ratio': round(encoded_bytes * 8 / encoded_seconds / source_bps, 3) if source_bps else None,
+        'measured_at': int(time.time()),
+    }
+    save_calibration(key, result)
+    return result, False
+
+
+def _copy_seconds(size):
+    return size / COPY_BYTES_PER_SECOND
+
+
+def _encode_seconds(media_seconds, speed):
+    return media_seconds / speed if speed else None
+
+
+def plan_job(processor, folder, mode, split_minutes, delay=0.0, tail_path=None, single_pass=False, workers=1,
+             resume=False, max_part_mb=None, quality_metric='ssim', quality_target=None, video_path=None,
+             subtitle_path=None, smart_render=False, calibrate_encode=True):
+    """
+    预演 process_video：参数与之相同，只探测源文件（和可选的校准试编码），不写输出。
+    返回 JobPlan，包含各阶段将执行的命令、输出大小、耗时估算与磁盘需求。
+    """
+    video_path, subtitle_path, tail_path = processor.resolve_inputs(folder, tail_path, video_path, subtitle_path)
+    plan = JobPlan(video=video_path, subtitle=subtitle_path, tail=tail_path or None)
+    segment_folder = os.path.join(folder, "segments")
+    work_dir = processor.scratch.work_dir(folder, create=False)
+    output_path = os.path.join(work_dir, "burned.mp4")
+    adjusted = os.path.join(work_dir, f"adjusted_subtitles{os.path.splitext(subtitle_path)[1].lower()}")
+
+    probe = PlannedStage('probe', commands=[ffprobe_command(video_path)])
+    if tail_path:
+        probe.commands.append(ffprobe_command(tail_path))
+    if split_minutes or max_part_mb or workers > 1 or smart_render:
+        probe.commands.append(packet_index_command(video_path))
+    probe.notes.append("探测结果有缓存，规划时已执行")
+    probe.seconds = 0.0
+    plan.stages.append(probe)
+
+    plan.stages.append(PlannedStage('subtitle', output_bytes=os.path.getsize(subtitle_path), seconds=0.0,
+                                    notes=[f"调整字幕时间 {delay:+.2f} 秒后写入 {adjusted}"]))
+
+    fonts_stage = _fonts_stage(processor, video_path, subtitle_path, work_dir)
+    if fonts_stage:
+        plan.stages.append(fonts_stage)
+
+    duration, tail_duration, audio_bps = processor.prepare_encode_settings(
+        video_path, tail_path, mode, split_minutes, single_pass, max_part_mb, quality_metric, quality_target,
+        search_quality=False
+    )
+    info = processor.probe(video_path)
+    height = info.video.height if info.video else 0
+
+    calibration, cached = calibrate(processor, video_path, subtitle_path, mode, run=calibrate_encode)
+    stats = load_burn_stats().get(f"{processor.mode_key(mode)}:{height}p", {})
+    speed = (calibration or {}).get('speed') or stats.get('serial')
+    if calibration and calibration.get('speed'):
+        plan.notes.append(f"{'使用缓存的' if cached else '本次'}校准结果: {calibration['speed']:.2f}x 实时"
+                          f"（{socket.gethostname()}，{height}p，{processor.mode_key(mode)}）")
+    elif speed:
+        plan.notes.append(f"未校准，按此前记录的单进程烧录速度 {speed:.2f}x 实时估算")
+    else:
+        plan.notes.append("没有校准结果或烧录记录，无法估算编码耗时")
+
+    if mode == 'quality' and not processor.quality_settings:
+        plan.stages.append(_quality_stage(video_path, info.duration, speed))
+
+    # 成品大小：有校准结果时按码率比例估算，size 模式不超过码率上限
+    source_bps = (info.video.bit_rate if info.video else 0) or info.bit_rate
+    if calibration and calibration.get('bitrate_ratio') and source_bps:
+        video_bps = calibration['bitrate_ratio'] * source_bps
+        if processor.size_settings:
+            video_bps = min(video_bps, processor.size_settings['maxrate'])
+        burned_bytes = int((video_bps + audio_bps) * duration / 8)
+    else:
+        burned_bytes = estimate_output_bytes(os.path.getsize(video_path), mode, duration, processor.size_settings,
+                                             audio_bps)
+    burned_bps = burned_bytes * 8 / duration if duration else 0
+    tail_bytes = int(tail_duration * burned_bps / 8)
+    audio_plan = processor.audio_plan
+    plan.notes.append(f"音频: {audio_plan.reason}")
+
+    if split_minutes:
+        part_count = max(1, int(duration // (split_minutes * 60)) + 1)
+    elif max_part_mb and burned_bytes:
+        part_count = int(burned_bytes // (max_part_mb * 1024 ** 2)) + 1
+    else:
+        part_count = 1
+
+    # 烧录命令中的 fontsdir 与实际运行一致；校准试编码在此之前，仍只用系统字体
+    processor.fonts_dir = os.path.join(work_dir, JOB_FONTS_DIR) if fonts_stage else None
+    if single_pass:
+        stage = PlannedStage('single_pass', output_bytes=burned_bytes)
+        tail_seconds = 0.0
+        if tail_path:
+            params = processor.planned_output_params(processor.get_video_params(video_path), audio_plan)
+            cache_hit = processor.tail_cache and processor.tail_cache.get(
+                processor.tail_cache.make_key(tail_path, params, processor.mode_key(mode)))
+            if cache_hit:
+                stage.notes.append(f"尾巴转码命中缓存: {cache_hit}")
+                tail_seconds = 0.0
+            else:
+                stage.commands += _tail_transcode_commands(processor, tail_path, segment_folder, params, mode)
+                tail_seconds = _encode_seconds(tail_duration, speed)
+        stage.commands.append(processor.single_pass_command(
+            video_path, adjusted, segment_folder, split_minutes, mode, audio_plan, bool(tail_path)))
+        stage.seconds = _encode_seconds(duration, speed)
+        if stage.seconds is not None and tail_seconds is not None:
+            stage.seconds += tail_seconds
+        plan.stages.append(stage)
+        if tail_path:
+            plan.stages.append(_tail_concat_stage(segment_folder, part_count, burned_bytes, tail_bytes, ts=True))
+    else:
+        plan.stages.append(_burn_stage(processor, video_path, subtitle_path, adjusted, output_path, work_dir, mode,
+                                       delay, workers, smart_render, duration, burned_bytes, speed, stats))
+        plan.stages.append(_split_stage(processor, output_path, segment_folder, split_minutes, max_part_mb, duration,
+                                        part_count, burned_bytes, info.start_time))
+        if tail_path:
+            # 烧录结果尚未生成，按计划的输出参数列出尾巴的两种处理方式
+            params = processor.planned_output_params(processor.get_video_params(video_path), audio_plan)
+            tail_ts = os.path.join(segment_folder, "tail.ts")
+            prepare = [processor.copy_tail_command(tail_path, tail_ts)]
+            cache_hit = processor.tail_cache and processor.tail_cache.get(
+                processor.tail_cache.make_key(tail_path, params, processor.mode_key(mode)))
+            if not cache_hit:
+                prepare += _tail_transcode_commands(processor, tail_path, segment_folder, params, mode)
+            tail_stage = _tail_concat_stage(segment_folder, part_count, burned_bytes, tail_bytes, ts=False,
+                                            audio_args=ts_audio_args(params, TS_AUDIO_CODECS))
+            tail_stage.commands[:0] = prepare
+            tail_stage.notes.insert(0, "尾巴与烧录结果兼容时只执行第一条流复制命令，否则按成品参数转码再转为 TS"
+                                    + (f"（命中缓存: {cache_hit}）" if cache_hit else ""))
+            tail_encode = _encode_seconds(tail_duration, speed)
+            tail_stage.seconds = None if tail_encode is None else tail_stage.seconds + tail_encode
+            plan.stages.append(tail_stage)
+
+    needs = processor.disk_needs(burned_bytes, segment_folder, work_dir, output_path, tail_path, single_pass)
+    for path, need in needs:
+        parent = path
+        while not os.path.exists(parent):
+            parent = os.path.dirname(parent)
+        plan.disk.append((path, need, shutil.disk_usage(parent).free))
+    try:
+        processor.scratch.preflight(needs)
+    except Exception as e:
+        plan.notes.append(str(e))
+    if resume:
+        plan.notes.append("启用 --resume：清单中输入未变化的阶段会被跳过，实际耗时可能更短")
+    processor.fonts_dir = None
+    return plan
+
+
+def _quality_stage(video_path, duration, speed):
+    trials = SAMPLE_WINDOWS * QUALITY_TRIALS_PER_PRESET
+    stage = PlannedStage('quality', seconds=_encode_seconds(trials * WINDOW_SECONDS, speed))
+    stage.notes.append(f"尚未试编码，将对 {SAMPLE_WINDOWS} 个 {WINDOW_SECONDS} 秒窗口搜索预设与 CRF"
+                       f"（每个预设约 {trials} 次试编码），以下按 balanced 参数估算")
+    stage.notes.append(f"列出的是第一轮试编码（{PRESETS[0]} / CRF {CRF_MIN}），之后按二分查找换 CRF 或预设重复试编码与比较")
+    workdir = "<临时目录>"
+    references = []
+    for i, start in enumerate(sample_windows(duration)):
+        reference = os.path.join(workdir, f"ref_{i}.mkv")
+        stage.commands.append(reference_command(video_path, start, WINDOW_SECONDS, reference))
+        references.append(reference)
+    for i, reference in enumerate(references):
+        encoded = os.path.join(workdir, f"trial_{i}.mkv")
+        stage.commands.append(trial_command(reference, PRESETS[0], CRF_MIN, encoded))
+        stage.commands.append(measure_command(reference, encoded, 'ssim'))
+    return stage
+
+
+def _tail_transcode_commands(processor, tail_path, segment_folder, params, mode):
+    # 与 VideoProcessor.prepare_tail_ts 一致：先按成品参数转码为 MP4，再无损转为 TS
+    transcoded = os.path.join(segment_folder, "transcoded_tail.mp4")
+    return [
+        processor.transcode_tail_command(tail_path, transcoded, params, mode),
+        processor.ts_remux_command(transcoded, os.path.join(segment_folder, "tail.ts")),
+    ]
+
+
+def _fonts_stage(processor, video_path, subtitle_path, work_dir):
+    # 字幕没有引用字体（如 SRT）时不会建立字体目录
+    wanted = referenced_fonts(subtitle_path)
+    if not wanted:
+        return None
+    stage = PlannedStage('fonts', seconds=0.0)
+    streams = font_attachments(processor.probe(video_path))
+    if streams and processor.font_cache.index['sources'].get(processor.font_cache.source_key(video_path)) is None:
+        stage.commands.append(dump_attachments_command(video_path, streams, "<临时目录>"))
+    stage.notes.append(f"字幕引用 {len(wanted)} 个字体，视频带 {len(streams)} 个字体附件；"
+                       f"用到的字体放入 {os.path.join(work_dir, JOB_FONTS_DIR)} 作为 fontsdir")
+    return stage
+
+
+def _burn_stage(processor, video_path, subtitle_path, adjusted, output_path, work_dir, mode, delay, workers,
+                smart_render, duration, burned_bytes, speed, stats):
+    stage = PlannedStage('burn', output_bytes=burned_bytes)
+    audio_plan = processor.audio_plan
+    audio_file = os.path.join(work_dir, AUDIO_FILE)
+    separate_audio = bool(audio_plan.codec) and not audio_plan.copy
+    if separate_audio:
+        stage.commands.append(audio_encode_command(video_path, audio_plan, audio_file))
+        stage.notes.append("音频由单独的进程与视频同时编码")
+    audio_input = ['-i', audio_file if separate_audio else video_path] if audio_plan.codec else []
+    audio_map = ['-map', '1:a:0', '-c:a', 'copy'] if audio_plan.codec else ['-an']
+    info = processor.probe(video_path)
+    start_time = info.start_time
+
+    if smart_render:
+        subtitles = SubtitleFile.load(subtitle_path).shift(delay * 1000)
+        spans, reason = plan_smart_render(processor, video_path, subtitles, mode)
+        if reason:
+            stage.notes.append(f"{reason}，改用完整烧录")
+        else:
+            piece_folder = os.path.join(work_dir, "smart_pieces")
+            vf = f"setpts=PTS-{start_time}/TB,{processor.subtitle_filter(adjusted)},setpts=PTS-STARTPTS"
+            encode_args = sps_encode_args(info.video, processor.video_encode_args(mode),
+                                          read_header_fields(processor, video_path))
+            stage.commands.append(copy_pass_command(video_path, spans, start_time, piece_folder))
+            rendered = 0.0
+            for index, (span_start, span_end, render) in enumerate(spans):
+                if render:
+                    rendered += span_end - span_start
+                    stage.commands.append(render_command(
+                        video_path, start_time, span_start, span_end, vf, encode_args,
+                        os.path.join(piece_folder, f"render_{index:05d}.ts")))
+            stage.commands.append([
+                'ffmpeg', '-hide_banner', '-y', '-f', 'concat', '-safe', '0',
+                '-i', os.path.join(piece_folder, "pieces.txt"), *audio_input,
+                '-map', '0:v:0', '-c:v', 'copy', *audio_map, '-movflags', '+faststart', output_path
+            ])
+            stage.notes.append(f"智能渲染: {len(spans)} 段，重新编码 {rendered:.1f} 秒，"
+                               f"最多 {MAX_RENDER_WORKERS} 段并行")
+            if stats.get('smart'):
+                stage.seconds = duration / stats['smart']
+            else:
+                encode = _encode_seconds(rendered, speed)
+                stage.seconds = None if encode is None else encode + _copy_seconds(2 * os.path.getsize(video_path))
+            return stage
+
+    if workers > 1 and not smart_render:
+        keyframes = load_packet_index(video_path, processor.media_probe.cache_dir, processor.supervisor).keyframes
+        chunks = plan_chunks(keyframes, start_time, duration, workers)
+        if len(chunks) >= 2:
+            chunk_folder = os.path.join(work_dir, "chunks")
+            vf = f"setpts=PTS-{start_time}/TB,{processor.subtitle_filter(adjusted)},setpts=PTS-STARTPTS"
+            for index, (chunk_start, chunk_end) in enumerate(chunks):
+                stage.commands.append(chunk_command(
+                    processor, video_path, start_time, chunk_start, chunk_end, vf, mode,
+                    os.path.join(chunk_folder, f"chunk_{index:03d}.mp4")))
+            stage.commands.append([
+                'ffmpeg', '-hide_banner', '-y', '-f', 'concat', '-safe', '0',
+                '-i', os.path.join(chunk_folder, "chunks.txt"), *audio_input,
+                '-map', '0:v:0', '-c:v', 'copy', *audio_map, output_path
+            ])
+            stage.notes.append(f"并行烧录: {len(chunks)} 块，{workers} 个进程")
+            parallel_speed = stats.get('parallel')
+            if not parallel_speed and speed:
+                stage.notes.append("未记录并行烧录速度，按单进程速度估算")
+            stage.seconds = _encode_seconds(duration, parallel_speed or speed)
+            return stage
+        stage.notes.append("视频过短或关键帧不足，改用单进程烧录")
+
+    if separate_audio:
+        base, ext = os.path.splitext(output_path)
+        video_only = f"{base}_video{ext}"
+        stage.commands.append(processor.burn_command(video_path, adjusted, video_only, mode, ["-an"]))
+        stage.commands.append(processor.mux_command(video_only, ['-i', audio_file], audio_map, output_path))
+    else:
+        stage.commands.append(processor.burn_command(video_path, adjusted, output_path, mode,
+                                                     audio_plan.encode_args()))
+    stage.seconds = _encode_seconds(duration, speed)
+    return stage
+
+
+def _split_stage(processor, output_path, segment_folder, split_minutes, max_part_mb, duration, part_count,
+                 burned_bytes, start_time):
+    stage = PlannedStage('split', output_bytes=burned_bytes)
+    if split_minutes == 0 and not max_part_mb:
+        stage.notes.append(f"不分割: 硬链接（跨磁盘时复制）为 {os.path.join(segment_folder, 'full_video.mp4')}")
+        stage.seconds = 0.0
+        return stage
+    # 实际切点在烧录完成后按关键帧、大小上限和字幕事件确定，这里按均分估算
+    part_seconds = duration / part_count
+    cuts = [start_time + part_seconds * i for i in range(1, part_count)]
+    stage.commands.append(processor.split_command(output_path, segment_folder, cuts, start_time))
+    stage.notes.append(f"约 {part_count} 段，每段约 {part_seconds / 60:.1f} 分钟、"
+                       f"{burned_bytes / part_count / 1024 ** 2:.0f} MB（切点在烧录后确定）")
+    stage.seconds = _copy_seconds(burned_bytes)
+    return stage
+
+
+def _tail_concat_stage(segment_folder, part_count, burned_bytes, tail_bytes, ts, audio_args=None):
+    """ts 为 False 时各段是 MP4，与 concat.concat_segments_with_tail 一样先转为 TS（POSIX 上经管道）再拼接。"""
+    stage = PlannedStage('tail', output_bytes=burned_bytes + tail_bytes * part_count)
+    use_pipe = os.name == 'posix'
+    for i in range(part_count):
+        name = f"part_{i:03d}"
+        list_file = os.path.join(segment_folder, f"final_{name}_concat.txt")
+        output = os.path.join(segment_folder, f"final_{name}.mp4")
+        if ts:
+            stage.commands.append(concat_command(list_file, output))
+            continue
+        segment = os.path.join(segment_folder, f"{name}.mp4")
+        if use_pipe:
+            stage.commands.append(segment_ts_command(segment, audio_args, 'pipe:1'))
+            stage.commands.append(concat_command(list_file, output, protocols='file,pipe'))
+        else:
+            stage.commands.append(segment_ts_command(segment, audio_args, f"{os.path.splitext(list_file)[0]}.ts"))
+            stage.commands.append(concat_command(list_file, output))
+    if not ts and use_pipe:
+        stage.notes.append("各段转 TS 的输出经管道交给拼接进程（concat 列表中的 pipe:N），两条命令同时运行")
+    stage.seconds = _copy_seconds(burned_bytes + tail_bytes * part_count)
+    return stage
+
+
+def _size(size):
+    return f"{size / 1024 ** 3:.2f} GB" if size >= 1024 ** 3 else f"{size / 1024 ** 2:.1f} MB"
+
+
+def format_plan(plan):
+    lines = [f"视频: {plan.video}", f"字幕: {plan.subtitle}", f"尾巴: {plan.tail or '无'}"]
+    for stage in plan.stages:
+        estimate = format_eta(stage.seconds)
+        lines.append(f"[{stage.name}] 预计 {estimate}" + (f"，输出约 {_size(stage.output_bytes)}"
+                                                          if stage.output_bytes else ""))
+        for note in stage.notes:
+            lines.append(f"    {note}")
+        for cmd in stage.commands:
+            lines.append(f"    $ {shlex.join(cmd)}")
+    for path, need, free in plan.disk:
+        lines.append(f"磁盘: {path} 需要约 {_size(need)}，可用 {_size(free)}")
+    for note in plan.notes:
+        lines.append(note)
+    lines.append(f"预计总耗时: {format_eta(plan.total_seconds)}")
+    return "\n".join(lines)
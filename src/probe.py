@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from dataclasses import dataclass, field
+
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_rate(rate_str):
+    """把 ffprobe 的 '24000/1001' 形式的帧率/时间基转为浮点数，无法解析时返回 0。"""
+    if not rate_str:
+        return 0.0
+    if '/' in rate_str:
+        num, den = rate_str.split('/', 1)
+        den = _float(den)
+        return _float(num) / den if den else 0.0
+    return _float(rate_str)
+
+
+def ffprobe_command(path):
+    return [
+        'ffprobe', '-v', 'error',
+        '-show_streams', '-show_format',
+        '-of', 'json', path
+    ]
+
+
+@dataclass
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: str = ''
+    codec_long_name: str = ''
+    codec_tag_string: str = ''
+    profile: str = ''
+    level: int = 0
+    time_base: str = ''
+    bit_rate: int = 0
+    # 视频
+    width: int = 0
+    height: int = 0
+    pix_fmt: str = ''
+    r_frame_rate: str = ''
+    avg_frame_rate: str = ''
+    # 音频
+    sample_rate: int = 0
+    channels: int = 0
+    channel_layout: str = ''
+    tags: dict = field(default_factory=dict)
+    raw: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def frame_rate(self):
+        return parse_rate(self.r_frame_rate) or parse_rate(self.avg_frame_rate)
+
+    @classmethod
+    def from_ffprobe(cls, data):
+        return cls(
+            index=_int(data.get('index')),
+            codec_type=data.get('codec_type', ''),
+            codec_name=(data.get('codec_name') or '').lower(),
+            codec_long_name=data.get('codec_long_name') or '',
+            codec_tag_string=data.get('codec_tag_string') or '',
+            profile=data.get('profile') or '',
+            level=_int(data.get('level')),
+            time_base=data.get('time_base') or '',
+            bit_rate=_int(data.get('bit_rate')),
+            width=_int(data.get('width')),
+            height=_int(data.get('height')),
+            pix_fmt=data.get('pix_fmt') or '',
+            r_frame_rate=data.get('r_frame_rate') or '',
+            avg_frame_rate=data.get('avg_frame_rate') or '',
+            sample_rate=_int(data.get('sample_rate')),
+            channels=_int(data.get('channels')),
+            channel_layout=data.get('channel_layout') or '',
+            tags=data.get('tags') or {},
+            raw=data,
+        )
+
+
+@dataclass
+class MediaInfo:
+    path: str
+    format_name: str = ''
+    duration: float = 0.0
+    start_time: float = 0.0
+    size: int = 0
+    bit_rate: int = 0
+    streams: list = field(default_factory=list)
+
+    def streams_of(self, codec_type):
+        return [s for s in self.streams if s.codec_type == codec_type]
+
+    @property
+    def video(self):
+        """第一路视频流（忽略封面图），没有时为 None。"""
+        for stream in self.streams_of('video'):
+            if stream.raw.get('disposition', {}).get('attached_pic'):
+                continue
+            return stream
+        return None
+
+    @property
+    def audio(self):
+        streams = self.streams_of('audio')
+        return streams[0] if streams else None
+
+    @property
+    def attachments(self):
+        return self.streams_of('attachment')
+
+    @classmethod
+    def from_ffprobe(cls, path, data):
+        fmt = data.get('format', {})
+        return cls(
+            path=path,
+            format_name=fmt.get('format_name', ''),
+            duration=_float(fmt.get('duration')),
+            start_time=_float(fmt.get('start_time')),
+            size=_int(fmt.get('size')),
+            bit_rate=_int(fmt.get('bit_rate')),
+            streams=[StreamInfo.from_ffprobe(s) for s in data.get('streams', [])],
+        )
+
+
+class MediaProbe:
+    """
+    每个文件只调用一次 ffprobe（-show_streams -show_format -of json），
+    结果按 (路径, 大小, 修改时间) 缓存在内存中，可选同时缓存到磁盘目录。
+    """
+
+    def __init__(self, cache_dir=None, supervisor=None):
+        self.cache_dir = cache_dir
+        # 给出 supervisor.ProcessSupervisor 时 ffprobe 也受其超时与取消控制
+        self.supervisor = supervisor
+        self._cache = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def file_key(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_disk(self, key, data):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+
+    def run_ffprobe(self, path):
+        if self.supervisor:
+            stdout, _ = self.supervisor.capture(ffprobe_command(path), stage='probe')
+            return json.loads(stdout or '{}')
+        result = subprocess.run(ffprobe_command(path), capture_output=True, text=True, encoding='utf-8',
+                                errors='replace', check=True)
+        return json.loads(result.stdout or '{}')
+
+    def probe(self, path):
+        key = self.file_key(path)
+        with self._lock:
+            info = self._cache.get(key)
+        if info is not None:
+            return info
+
+        data = self._load_disk(key)
+        if data is None:
+            data = self.run_ffprobe(path)
+            self._save_disk(key, data)
+        info = MediaInfo.from_ffprobe(key[0], data)
+        with self._lock:
+            self._cache[key] = info
+        return info
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,160 @@
+import threading
+import time
+from dataclasses import dataclass
+
+
+# ffmpeg -progress 输出的字段，其余行视为普通日志
+PROGRESS_KEYS = {
+    'frame', 'fps', 'stream_0_0_q', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms',
+    'out_time', 'dup_frames', 'drop_frames', 'speed', 'progress',
+}
+
+
+STAGE_LABELS = {
+    'burn': '烧录',
+    'split': '分割',
+    'tail': '拼接尾巴',
+}
+
+
+def parse_progress_line(line):
+    """解析 ffmpeg -progress 输出的 key=value 行，不是进度行时返回 None。"""
+    key, sep, value = line.partition('=')
+    key = key.strip()
+    if not sep or key not in PROGRESS_KEYS and not key.startswith('stream_'):
+        return None
+    return key, value.strip()
+
+
+def progress_args():
+    # 进度以 key=value 形式写到标准输出，同时关闭刷屏的统计行
+    return ['-progress', 'pipe:1', '-nostats']
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '--:--:--'
+    seconds = int(seconds)
+    return f"{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+
+@dataclass
+class ProgressEvent:
+    stage: str
+    stage_percent: float
+    overall_percent: float
+    out_time: float = 0.0
+    fps: float = 0.0
+    speed: float = 0.0
+    total_size: int = 0
+    eta: float = None
+    overall_eta: float = None
+    done: bool = False
+
+    def describe(self):
+        text = f"{STAGE_LABELS.get(self.stage, self.stage)} {self.stage_percent:5.1f}% 总进度 {self.overall_percent:5.1f}%"
+        if self.speed:
+            text += f" 速度 {self.speed:.2f}x"
+        if self.fps:
+            text += f" {self.fps:.1f}fps"
+        return text + f" 阶段剩余 {format_eta(self.eta)} 总剩余 {format_eta(self.overall_eta)}"
+
+
+class ProgressTracker:
+    """
+    汇总各阶段 ffmpeg 的 -progress 输出，按阶段权重换算总进度，并根据编码速度估算剩余时间。
+    同一阶段可以有多个并行任务（如分块烧录），按各任务已输出的时长求和。
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset([])
+
+    def reset(self, stages):
+        """stages 为 [(阶段名, 权重), ...]，权重之和不要求为 100。"""
+        with self._lock:
+            total = sum(weight for _, weight in stages) or 1
+            self.weights = {name: weight / total for name, weight in stages}
+            self.order = [name for name, _ in stages]
+            self.durations = {}
+            self.tasks = {}
+            self.finished = set()
+            self.started_at = time.monotonic()
+
+    def start_stage(self, stage, duration):
+        with self._lock:
+            self.durations[stage] = max(duration, 0.0)
+            self.tasks[stage] = {}
+
+    def _stage_fraction(self, stage):
+        if stage in self.finished:
+            return 1.0
+        duration = self.durations.get(stage)
+        if not duration:
+            return 0.0
+        done = sum(task.get('out_time', 0.0) for task in self.tasks.get(stage, {}).values())
+        return min(done / duration, 1.0)
+
+    def _overall(self):
+        return 100.0 * sum(self.weights[name] * self._stage_fraction(name) for name in self.order)
+
+    def _overall_eta(self, overall):
+        # 按已用时间和总进度线性外推
+        if overall <= 0:
+            return None
+        elapsed = time.monotonic() - self.started_at
+        return elapsed * (100.0 - overall) / overall
+
+    def update(self, stage, task, fields):
+        with self._lock:
+            state = self.tasks.setdefault(stage, {}).setdefault(task, {})
+            if 'out_time_us' in fields or 'out_time_ms' in fields:
+                # 两个字段的单位实际都是微秒
+                raw = fields.get('out_time_us', fields.get('out_time_ms'))
+                try:
+                    state['out_time'] = max(int(raw), 0) / 1_000_000
+                except ValueError:
+                    pass
+            for key in ('fps', 'speed'):
+                if key in fields:
+                    try:
+                        state[key] = float(fields[key].rstrip('x'))
+                    except ValueError:
+                        pass
+            if 'total_size' in fields and fields['total_size'].isdigit():
+                state['total_size'] = int(fields['total_size'])
+
+            tasks = self.tasks[stage].values()
+            out_time = sum(t.get('out_time', 0.0) for t in tasks)
+            speed = sum(t.get('speed', 0.0) for t in tasks)
+            eta = None
+            duration = self.durations.get(stage)
+            if duration and speed > 0:
+                eta = max(duration - out_time, 0.0) / speed
+            overall = self._overall()
+            event = ProgressEvent(
+                stage=stage,
+                stage_percent=100.0 * self._stage_fraction(stage),
+                overall_percent=overall,
+                out_time=out_time,
+                fps=sum(t.get('fps', 0.0) for t in tasks),
+                speed=speed,
+                total_size=sum(t.get('total_size', 0) for t in tasks),
+                eta=eta,
+                overall_eta=self._overall_eta(overall),
+            )
+        self.emit(event)
+
+    def finish_stage(self, stage):
+        with self._lock:
+            self.finished.add(stage)
+            overall = self._overall()
+            done = all(name in self.finished for name in self.order)
+            overall_eta = 0.0 if done else self._overall_eta(overall)
+        self.emit(ProgressEvent(stage=stage, stage_percent=100.0, overall_percent=overall,
+                                eta=0.0, overall_eta=overall_eta, done=done))
+
+    def emit(self, event):
+        if self.callback:
+            self.callback(event)
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+
+QUALITY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".videoprocessor_quality.json")
+# 从快到慢依次尝试，第一个能达到目标的预设即为结果
+PRESETS = ("veryfast", "faster", "fast", "medium", "slow")
+# CRF 搜索范围，低于下限时文件体积已接近无损，不再继续降低
+CRF_MIN, CRF_MAX = 14, 32
+DEFAULT_TARGETS = {'ssim': 0.98, 'psnr': 42.0}
+SAMPLE_WINDOWS = 3
+WINDOW_SECONDS = 5
+
+SSIM_RESULT = re.compile(r'SSIM .*All:([\d.]+)')
+PSNR_RESULT = re.compile(r'PSNR .*average:([\d.]+|inf)')
+
+
+def sample_windows(duration, count=SAMPLE_WINDOWS, length=WINDOW_SECONDS):
+    """在片中均匀取 count 个窗口的开始时间，避开片头片尾。"""
+    if duration <= length:
+        return [0.0]
+    return [round(duration * (i + 1) / (count + 1) - length / 2, 3) for i in range(count)]
+
+
+def _cache_key(video_path, metric, target):
+    stat = os.stat(video_path)
+    key = [os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns, metric, target, PRESETS, CRF_MIN, CRF_MAX]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+def load_quality_cache():
+    try:
+        with open(QUALITY_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_quality_choice(key, choice):
+    cache = load_quality_cache()
+    cache[key] = choice
+    try:
+        with open(QUALITY_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except OSError:
+        pass
+
+
+def reference_command(video_path, start, length, output):
+    # 参考片段以无损编码保存，后续每次试编码都从它读取，不必反复在源文件中定位和解码
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', str(start), '-t', str(length), '-i', video_path,
+        '-map', '0:v:0', '-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0', '-an', '-sn', output
+    ]
+
+
+def trial_command(reference, preset, crf, output):
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', reference,
+        '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), output
+    ]
+
+
+def measure_command(reference, encoded, metric):
+    return [
+        'ffmpeg', '-hide_banner', '-i', encoded, '-i', reference,
+        '-lavfi', f"[0:v][1:v]{metric}", '-f', 'null', '-'
+    ]
+
+
+def extract_reference(supervisor, video_path, start, length, output):
+    supervisor.capture(reference_command(video_path, start, length, output), stage='quality')
+
+
+def measure(supervisor, reference, encoded, metric):
+    """用 FFmpeg 内置的 ssim/psnr 滤镜比较试编码与参考片段，返回整体得分。"""
+    # 汇总结果在标准错误的最后几行
+    _, stderr = supervisor.capture(measure_command(reference, encoded, metric), stage='quality')
+    match = (SSIM_RESULT if metric == 'ssim' else PSNR_RESULT).search(stderr)
+    if not match:
+        raise Exception(f"无法解析 {metric} 结果")
+    return float('inf') if match.group(1) == 'inf' else float(match.group(1))
+
+
+def trial_score(supervisor, references, workdir, preset, crf, metric):
+    """按给定预设和 CRF 编码所有采样窗口，返回最差窗口的得分。"""
+    scores = []
+    for i, reference in enumerate(references):
+        encoded = os.path.join(workdir, f"trial_{i}.mkv")
+        supervisor.capture(trial_command(reference, preset, crf, encoded), stage='quality')
+        scores.append(measure(supervisor, reference, encoded, metric))
+    return min(scores)
+
+
+def search_preset(supervisor, references, workdir, preset, metric, target):
+    """二分查找该预设下仍能达到目标的最大 CRF，连 CRF_MIN 都达不到时返回 None。"""
+    score = trial_score(supervisor, references, workdir, preset, CRF_MIN, metric)
+    if score < target:
+        return None
+    best = (CRF_MIN, score)
+    lo, hi = CRF_MIN + 1, CRF_MAX
+    while lo <= hi:
+        crf = (lo + hi) // 2
+        score = trial_score(supervisor, references, workdir, preset, crf, metric)
+        if score >= target:
+            best = (crf, score)
+            lo = crf + 1
+        else:
+            hi = crf - 1
+    return best
+
+
+def cached_encode_settings(video_path, metric='ssim', target=None):
+    """只查缓存，源视频尚未试编码过时返回 None。"""
+    target = DEFAULT_TARGETS.get(metric) if target is None else target
+    return load_quality_cache().get(_cache_key(video_path, metric, target))
+
+
+def choose_encode_settings(processor, video_path, metric='ssim', target=None):
+    """
+    对源视频的几个采样窗口试编码，选出达到目标质量的最快预设及其最大 CRF。
+    结果按 (路径, 大小, 修改时间, 指标, 目标) 缓存，同一源视频不再重复搜索。
+    """
+    if metric not in DEFAULT_TARGETS:
+        raise Exception(f"不支持的质量指标: {metric}")
+    target = DEFAULT_TARGETS[metric] if target is None else target
+    key = _cache_key(video_path, metric, target)
+    cached = load_quality_cache().get(key)
+    if cached:
+        processor.log(f"使用缓存的编码设置: preset={cached['preset']} crf={cached['crf']}")
+        return cached
+
+    duration = processor.probe(video_path).duration
+    workdir = tempfile.mkdtemp(prefix="quality_")
+    try:
+        references = []
+        for i, start in enumerate(sample_windows(duration)):
+            reference = os.path.join(workdir, f"ref_{i}.mkv")
+            extract_reference(processor.supervisor, video_path, start, WINDOW_SECONDS, reference)
+            references.append(reference)
+
+        for preset in PRESETS:
+            processor.log(f"试编码: preset={preset}，目标 {metric} >= {target}")
+            found = search_preset(processor.supervisor, references, workdir, preset, metric, target)
+            if found:
+                crf, score = found
+                choice = {'preset': preset, 'crf': crf, 'metric': metric, 'target': target, 'score': score}
+                break
+        else:
+            # 所有预设都达不到目标时使用最慢预设和最小 CRF
+            choice = {'preset': PRESETS[-1], 'crf': CRF_MIN, 'metric': metric, 'target': target, 'score': None}
+            processor.log(f"所有预设都无法达到目标 {metric} {target}，使用 {PRESETS[-1]} / CRF {CRF_MIN}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    processor.log(f"选定编码设置: preset={choice['preset']} crf={choice['crf']}")
+    save_quality_choice(key, choice)
+    return choice
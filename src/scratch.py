@@ -0,0 +1,111 @@
+import glob
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+
+
+# 烧录结果相对源文件大小的粗略倍数，用于开始前检查磁盘空间
+OUTPUT_SIZE_RATIO = {'lossless': 4.0, 'balanced': 1.5, 'quality': 1.5, 'fast': 0.6}
+# 可用空间至少要比估算值多出的比例
+FREE_SPACE_MARGIN = 1.1
+
+
+def estimate_output_bytes(source_bytes, mode, duration=0.0, size_settings=None, audio_bps=0):
+    """估算烧录结果的大小；size 模式下按码率上限计算，其余按经验倍数。"""
+    if mode == 'size' and size_settings:
+        return int((size_settings['maxrate'] + audio_bps) * duration / 8)
+    return int(source_bytes * OUTPUT_SIZE_RATIO.get(mode, 1.5))
+
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _snapshot(paths):
+    # 通配符只出现在文件名中，目录部分按字面匹配（源文件夹名可能含有 [ ] 等字符）
+    files = {}
+    for path in paths:
+        pattern = os.path.join(glob.escape(os.path.dirname(path)), os.path.basename(path))
+        for match in glob.glob(pattern):
+            if os.path.isfile(match):
+                files[match] = os.stat(match).st_mtime_ns
+    return files
+
+
+class ScratchManager:
+    """
+    管理中间文件的存放位置。指定 root 时 burned.mp4、调整后的字幕等中间文件写到 root 下
+    （如 SSD 或 tmpfs）按源文件夹区分的固定子目录，否则写在源文件夹中。
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def work_dir(self, folder, create=True):
+        if not self.root:
+            return folder
+        folder = os.path.abspath(folder)
+        # 同一源文件夹每次得到同一个目录，断点续跑时能找到上次的中间文件
+        digest = hashlib.sha1(folder.encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(self.root, f"{os.path.basename(folder)}_{digest}")
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def release(self, work_dir):
+        """删除 scratch 中的工作目录，中间文件写在源文件夹时什么也不做。"""
+        if self.root and os.path.abspath(work_dir).startswith(os.path.abspath(self.root) + os.sep):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def preflight(self, needs):
+        """
+        needs 为 [(目录, 需要的字节数)]，位于同一文件系统的需求合并后与可用空间比较，
+        空间不足时在开始编码前报错。
+        """
+        by_device = {}
+        for path, size in needs:
+            parent = _existing_parent(path)
+            device = os.stat(parent).st_dev
+            total, first = by_device.get(device, (0, parent))
+            by_device[device] = (total + size, first)
+        for total, path in by_device.values():
+            free = shutil.disk_usage(path).free
+            if total * FREE_SPACE_MARGIN > free:
+                raise Exception(
+                    f"磁盘空间不足: {path} 需要约 {total * FREE_SPACE_MARGIN / 1024 ** 3:.1f} GB，"
+                    f"可用 {free / 1024 ** 3:.1f} GB"
+                )
+
+    def link_or_copy(self, src, dst):
+        """内容完全相同时不经过 FFmpeg：同一文件系统内建硬链接，否则直接复制文件。"""
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            shutil.copyfile(src, dst)
+            return 'copy'
+
+    @contextmanager
+    def guard(self, *paths):
+        """
+        执行期间出错时删除 paths 中新建或被改写的文件，不留下写了一半的输出。
+        paths 为阶段自己的输出或临时文件路径，文件名中可以使用通配符；不要传入整个目录，
+        未配置 scratch 时工作目录就是用户的源文件夹，其中可能有用户自己或其他任务的文件。
+        """
+        before = _snapshot(paths)
+        try:
+            yield
+        except BaseException:
+            for path, mtime in _snapshot(paths).items():
+                if before.get(path) != mtime:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            raise
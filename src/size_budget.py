@@ -0,0 +1,61 @@
+from split_planner import DURATION_TOLERANCE
+
+
+# MP4/TS 封装、索引等开销占的比例
+CONTAINER_OVERHEAD = 0.03
+# VBV 缓冲区对应的秒数，任意时长 T 的片段码流不超过 maxrate * T + bufsize
+VBV_BUFFER_SECONDS = 2
+# 一段成品最多包含的 VBV 缓冲区个数：并行烧录的分块边界一个、主视频一个、尾巴一个
+VBV_BUFFERS_PER_PART = 3
+# 低于这个码率时画质已不可用，提示用户放宽大小上限
+MIN_VIDEO_BITRATE = 200_000
+# 无损或无法得知码率的音频按较高的码率估算
+LOSSLESS_AUDIO_CODECS = {'flac', 'alac', 'truehd', 'mlp'}
+DEFAULT_AUDIO_BITRATE = 320_000
+LOSSLESS_AUDIO_BITRATE = 1_500_000
+HIGH_END_AUDIO_BITRATE = 1_920_000
+
+
+def audio_bitrate(audio, high_end_audio=False):
+    """成品中音频的码率（bit/s）。高端音轨会转码为 1920k AAC，其余原样复制。"""
+    if audio is None:
+        return 0
+    if high_end_audio:
+        return HIGH_END_AUDIO_BITRATE
+    if audio.bit_rate:
+        return audio.bit_rate
+    # MKV 的音轨码率通常只写在 BPS 标签里
+    for key in ('BPS', 'BPS-eng'):
+        try:
+            return int(audio.tags[key])
+        except (KeyError, ValueError):
+            continue
+    if audio.codec_name in LOSSLESS_AUDIO_CODECS or audio.codec_name.startswith('pcm_'):
+        return LOSSLESS_AUDIO_BITRATE
+    return DEFAULT_AUDIO_BITRATE
+
+
+def longest_part_seconds(duration, split_minutes, exact_cuts=False):
+    """分割后最长一段的时长。按包索引分割时切点可能比目标晚 DURATION_TOLERANCE。"""
+    if not split_minutes:
+        return duration
+    split_seconds = split_minutes * 60
+    if not exact_cuts:
+        split_seconds *= 1 + DURATION_TOLERANCE
+    return min(duration, split_seconds)
+
+
+def plan_size_budget(max_part_bytes, part_seconds, tail_seconds, audio_bps):
+    """
+    计算每段（含尾巴）不超过 max_part_bytes 时视频允许的最大码率，返回
+    {'maxrate', 'bufsize'}（bit/s、bit）。主视频与尾巴都以同样的 VBV 上限编码，
+    一段成品的体积不超过 (maxrate + 音频码率) * 总时长 + 若干个缓冲区。
+    """
+    total_seconds = part_seconds + tail_seconds
+    budget_bits = max_part_bytes * 8 * (1 - CONTAINER_OVERHEAD) - audio_bps * total_seconds
+    maxrate = int(budget_bits / (total_seconds + VBV_BUFFER_SECONDS * VBV_BUFFERS_PER_PART))
+    if maxrate < MIN_VIDEO_BITRATE:
+        raise Exception(
+            f"每段大小上限过小：{part_seconds:.0f} 秒的分段加尾巴只能分到 {maxrate // 1000} kbps 的视频码率"
+        )
+    return {'maxrate': maxrate, 'bufsize': maxrate * VBV_BUFFER_SECONDS}
@@ -0,0 +1,341 @@
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_plan import AudioTrack
+from compat import VIDEO_FIELDS, check_video_compat
+from parallel import load_burn_stats, record_burn_speed
+from split_planner import load_packet_index, seek_arg, segment_times_arg
+from subtitles import SubtitleFile
+from supervisor import JobCancelled
+
+
+# 字幕事件前后多留的秒数，避免淡入淡出等效果落在复制的 GOP 中
+EVENT_MARGIN = 0.1
+# 需要重新编码的时长超过这个比例时智能渲染已无收益，改为完整烧录
+MAX_RENDER_FRACTION = 0.8
+MAX_RENDER_WORKERS = 4
+# 检查开放 GOP 时抽查的复制段数，以及每个关键帧之后读取的包数（足以覆盖紧随其后的前导 B 帧）
+GOP_PROBE_SPANS = 8
+GOP_PROBE_PACKETS = 16
+# ffprobe 的 profile 名称与 x264 -profile:v 参数的对应关系
+X264_PROFILES = {
+    'constrained baseline': 'baseline', 'baseline': 'baseline', 'main': 'main', 'high': 'high',
+}
+# 拼接处需要一致的 SPS 字段；TS 与 MP4 的时间基不同，不比较
+SPS_FIELDS = tuple(f for f in VIDEO_FIELDS if f != 'time_base')
+COLOR_OPTIONS = {
+    'color_primaries': '-color_primaries', 'color_transfer': '-color_trc',
+    'color_space': '-colorspace', 'color_range': '-color_range',
+}
+# 拼接处还需要一致的 PPS/SPS 码流字段（熵编码、8x8 变换、加权预测、参考帧数），ffprobe 不输出，从 trace_headers 读取
+HEADER_FIELDS = (
+    'entropy_coding_mode_flag', 'transform_8x8_mode_flag', 'weighted_pred_flag', 'weighted_bipred_idc',
+    'max_num_ref_frames',
+)
+# trace_headers 的字段行，例如 "[trace_headers @ 0x..] 1234      entropy_coding_mode_flag         1 = 1"
+TRACE_FIELD = re.compile(r'\]\s+\d+\s+(\w+)\s+[01]+\s+=\s+(-?\d+)\s*$')
+
+
+def plan_spans(keyframes, start_time, end_time, events):
+    """
+    把 [start_time, end_time) 按关键帧分成 GOP，与任一字幕事件（源时间轴上的秒数）重叠的 GOP
+    需要重新编码。相邻且处理方式相同的 GOP 合并，返回 [(开始, 结束, 是否重新编码)]。
+    """
+    bounds = [k for k in keyframes if start_time < k < end_time]
+    gops = list(zip([start_time] + bounds, bounds + [end_time]))
+    events = sorted(events)
+    spans = []
+    i = 0
+    for gop_start, gop_end in gops:
+        # 事件按开始时间排序，跳过已经结束的事件
+        while i < len(events) and events[i][1] + EVENT_MARGIN <= gop_start:
+            i += 1
+        render = False
+        for start, end in events[i:]:
+            if start - EVENT_MARGIN >= gop_end:
+                break
+            if end + EVENT_MARGIN > gop_start:
+                render = True
+                break
+        if spans and spans[-1][2] == render:
+            spans[-1] = (spans[-1][0], gop_end, render)
+        else:
+            spans.append((gop_start, gop_end, render))
+    return spans
+
+
+def sps_encode_args(video, base_args, header=None):
+    """
+    在模式的编码参数上加入与源视频一致的档次、级别、像素格式与色彩信息；
+    给出 header（read_header_fields 的结果）时，熵编码、8x8 变换、加权预测与 B 帧金字塔也与源视频一致。
+    """
+    args = list(base_args)
+    profile = X264_PROFILES.get(video.profile.lower())
+    if profile:
+        args += ['-profile:v', profile]
+    if video.level:
+        args += ['-level', f"{video.level / 10:.1f}"]
+    if video.pix_fmt:
+        args += ['-pix_fmt', video.pix_fmt]
+    for field, option in COLOR_OPTIONS.items():
+        value = video.raw.get(field)
+        if value and value != 'unknown':
+            args += [option, value]
+    if video.raw.get('refs'):
+        args += ['-refs', str(video.raw['refs'])]
+    params = x264_header_params(video, header or {})
+    if params:
+        args = with_x264_params(args, params)
+    return args
+
+
+def x264_header_params(video, header):
+    """把源视频的 PPS 字段与解码延迟换算成 x264 参数。"""
+    params = []
+    if 'entropy_coding_mode_flag' in header:
+        params.append(f"cabac={header['entropy_coding_mode_flag']}")
+    if 'transform_8x8_mode_flag' in header:
+        params.append(f"8x8dct={header['transform_8x8_mode_flag']}")
+    if 'weighted_pred_flag' in header:
+        params.append(f"weightp={2 if header['weighted_pred_flag'] else 0}")
+    if 'weighted_bipred_idc' in header:
+        params.append(f"weightb={1 if header['weighted_bipred_idc'] else 0}")
+    # has_b_frames 是解码需要的重排序深度：0 表示没有 B 帧，1 为普通 B 帧，2 及以上为 B 帧金字塔
+    reorder = video.raw.get('has_b_frames')
+    if reorder is not None:
+        reorder = int(reorder)
+        if reorder == 0:
+            params.append('bframes=0')
+        else:
+            params.append(f"b-pyramid={'normal' if reorder >= 2 else 'none'}")
+    return params
+
+
+def with_x264_params(args, params):
+    """把 x264 参数并入已有的 -x264-params，没有时新增。"""
+    args = list(args)
+    if '-x264-params' in args:
+        i = args.index('-x264-params') + 1
+        args[i] = ':'.join([args[i], *params])
+    else:
+        args += ['-x264-params', ':'.join(params)]
+    return args
+
+
+def header_trace_command(path):
+    # 只复制第一帧视频，trace_headers 会打印扩展数据和首帧中的 SPS/PPS
+    return [
+        'ffmpeg', '-hide_banner', '-i', path, '-map', '0:v:0', '-c', 'copy',
+        '-bsf:v', 'trace_headers', '-frames:v', '1', '-f', 'null', '-'
+    ]
+
+
+def parse_header_fields(lines):
+    """从 trace_headers 的输出中取出 HEADER_FIELDS 各字段第一次出现的值。"""
+    fields = {}
+    for line in lines:
+        match = TRACE_FIELD.search(line)
+        if match and match.group(1) in HEADER_FIELDS:
+            fields.setdefault(match.group(1), int(match.group(2)))
+    return fields
+
+
+def read_header_fields(processor, path):
+    lines = []
+    processor.supervisor.run(header_trace_command(path), lines.append, stage='probe')
+    return parse_header_fields(lines)
+
+
+def check_rendered_piece(copied, copied_header, rendered, rendered_header):
+    """比较重新编码的段与复制的段（VideoInfo 与 read_header_fields 的结果），不一致时返回原因，否则返回 None。"""
+    reason = check_video_compat(copied, rendered, SPS_FIELDS)
+    if reason:
+        return reason
+    if copied.raw.get('has_b_frames') != rendered.raw.get('has_b_frames'):
+        return f"has_b_frames 不同 ({copied.raw.get('has_b_frames')} vs {rendered.raw.get('has_b_frames')})"
+    for field in HEADER_FIELDS:
+        if copied_header.get(field) != rendered_header.get(field):
+            return f"{field} 不同 ({copied_header.get(field)} vs {rendered_header.get(field)})"
+    return None
+
+
+def gop_probe_command(input_file, keyframes):
+    # 从每个关键帧开始按解码顺序读取若干个视频包
+    intervals = ','.join(f"{k:.6f}%+#{GOP_PROBE_PACKETS}" for k in keyframes)
+    return [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0', '-read_intervals', intervals,
+        '-show_entries', 'packet=pts_time,dts_time,flags', '-of', 'csv=p=0', input_file
+    ]
+
+
+def leading_pictures(stdout):
+    """
+    按解码顺序的包列表（gop_probe_command 的输出）统计前导图像：解码顺序在关键帧之后、显示时间却在它之前的帧。
+    有前导图像说明是开放 GOP，这些帧会参考上一个 GOP，复制时与重新编码的段拼在一起无法正确解码。
+    """
+    count = 0
+    key_pts = None
+    for line in stdout.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 3:
+            continue
+        try:
+            pts = float(fields[0])
+        except ValueError:
+            continue
+        if 'K' in fields[2]:
+            key_pts = pts
+        elif key_pts is not None and pts < key_pts:
+            count += 1
+    return count
+
+
+def check_closed_gop(processor, input_file, spans):
+    """抽查复制段开头的关键帧，是开放 GOP 时返回原因，否则返回 None。"""
+    keyframes = [start for i, (start, _, render) in enumerate(spans) if i > 0 and not render][:GOP_PROBE_SPANS]
+    if not keyframes:
+        return None
+    stdout, _ = processor.supervisor.capture(gop_probe_command(input_file, keyframes), stage='probe')
+    if leading_pictures(stdout):
+        return "源视频为开放 GOP（关键帧后有参考上一 GOP 的前导帧），无法在关键帧处拼接"
+    return None
+
+
+def plan_smart_render(processor, input_file, subtitles, mode):
+    """
+    按已调整时间的字幕（subtitles.SubtitleFile）规划智能渲染，返回 (spans, 原因)。
+    原因不为 None 时不适合智能渲染，应改用完整烧录。
+    """
+    info = processor.probe(input_file)
+    video = info.video
+    if video is None or video.codec_name != 'h264' or mode == 'lossless' or \
+            video.profile.lower() not in X264_PROFILES:
+        return [], "智能渲染需要 8 位 H.264 源视频且不能是无损模式"
+
+    start_time, duration = info.start_time, info.duration
+    # 字幕按从 0 开始的时间轴制作，换算到源文件的时间轴
+    events = [(start_time + s / 1000, start_time + e / 1000) for s, e in zip(subtitles.starts, subtitles.ends)]
+    keyframes = load_packet_index(input_file, processor.media_probe.cache_dir, processor.supervisor).keyframes
+    spans = plan_spans(keyframes, start_time, start_time + duration, events)
+    rendered = sum(end - start for start, end, render in spans if render)
+    if rendered == 0 or rendered > duration * MAX_RENDER_FRACTION:
+        return spans, f"需要重新编码的部分占 {rendered / max(duration, 1e-6):.0%}，智能渲染无收益"
+    return spans, check_closed_gop(processor, input_file, spans)
+
+
+def copy_pass_command(input_file, spans, start_time, piece_folder):
+    # 一次流复制按所有分界点（都是关键帧）切出各段
+    cuts = [start for start, _, _ in spans[1:]]
+    return [
+        'ffmpeg', '-hide_banner', '-y', '-i', input_file,
+        '-map', '0:v:0', '-c', 'copy', '-bsf:v', 'h264_mp4toannexb',
+        '-f', 'segment', '-segment_format', 'mpegts',
+        '-segment_times', segment_times_arg(cuts, start_time),
+        os.path.join(piece_folder, 'piece_%05d.ts')
+    ]
+
+
+def render_command(input_file, start_time, span_start, span_end, vf, encode_args, output):
+    # 与复制的段一样按从文件起点算起的位置切分，span_start/span_end 为源文件时间轴上的绝对时间
+    return [
+        'ffmpeg', '-hide_banner', '-y',
+        '-ss', seek_arg(span_start, start_time), '-t', f"{span_end - span_start:.6f}",
+        '-copyts', '-i', input_file,
+        '-map', '0:v:0', '-vf', vf, '-an', '-sn',
+        *encode_args,
+        '-f', 'mpegts', output
+    ]
+
+
+def burn_subtitles_smart(processor, input_file, subtitle_file, output_file, mode):
+    """
+    只重新编码与字幕重叠的 GOP，其余 GOP 直接流复制，按顺序拼回完整视频再混入音频。
+    要求源视频为 H.264 且为闭合 GOP；不满足条件或收益不大时改用完整烧录。
+    """
+    started = time.monotonic()
+    info = processor.probe(input_file)
+    video = info.video
+    start_time, duration = info.start_time, info.duration
+    spans, reason = plan_smart_render(processor, input_file, SubtitleFile.load(subtitle_file), mode)
+    if reason:
+        processor.log(f"{reason}，改用完整烧录")
+        processor.burn_subtitles(input_file, subtitle_file, output_file, mode)
+        return
+    rendered = sum(end - start for start, end, render in spans if render)
+    processor.log(f"智能渲染: {len(spans)} 段，其中 {sum(1 for s in spans if s[2])} 段共 {rendered:.1f} 秒需要重新编码，"
+                  f"其余 {duration - rendered:.1f} 秒直接复制")
+
+    piece_folder = os.path.join(os.path.dirname(output_file), "smart_pieces")
+    os.makedirs(piece_folder, exist_ok=True)
+    try:
+        # 需要转码的音频在重新编码各段的同时由单独的进程编码，拼接时只做流复制
+        with AudioTrack(processor, input_file, processor.audio_plan_for(input_file), piece_folder) as audio:
+            processor.run_command(copy_pass_command(input_file, spans, start_time, piece_folder))
+            pieces = sorted(f for f in os.listdir(piece_folder) if f.startswith('piece_'))
+            if len(pieces) != len(spans):
+                raise Exception(f"流复制切出 {len(pieces)} 段，与计划的 {len(spans)} 段不一致")
+            pieces = [os.path.join(piece_folder, f) for f in pieces]
+
+            subs_filter = processor.subtitle_filter(subtitle_file)
+            vf = f"setpts=PTS-{start_time}/TB,{subs_filter},setpts=PTS-STARTPTS"
+            source_header = read_header_fields(processor, input_file)
+            encode_args = sps_encode_args(video, processor.video_encode_args(mode), source_header)
+            render_indexes = [i for i, (_, _, render) in enumerate(spans) if render]
+            workers = min(MAX_RENDER_WORKERS, len(render_indexes))
+            threads = processor.governor.share(workers)
+            processor.progress.start_stage('burn', rendered)
+
+            def render_span(index):
+                span_start, span_end, _ = spans[index]
+                output = os.path.join(piece_folder, f"render_{index:05d}.ts")
+                cmd = render_command(input_file, start_time, span_start, span_end, vf, encode_args, output)
+                processor.run_command(cmd, progress_task=('burn', index), threads=threads)
+                return index, output
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for index, output in pool.map(render_span, render_indexes):
+                    pieces[index] = output
+
+            # 每个重新编码的段都必须与复制的段 SPS/PPS 一致，否则拼接后无法正常解码
+            copied = next(pieces[i] for i, (_, _, render) in enumerate(spans) if not render)
+            copied_video, copied_header = processor.probe(copied).video, read_header_fields(processor, copied)
+            for index in render_indexes:
+                reason = check_rendered_piece(copied_video, copied_header, processor.probe(pieces[index]).video,
+                                              read_header_fields(processor, pieces[index]))
+                if reason:
+                    raise Exception(f"重新编码的第 {index + 1} 段与源视频参数不一致: {reason}")
+
+            list_file = os.path.join(piece_folder, "pieces.txt")
+            with open(list_file, 'w', encoding='utf-8') as f:
+                for path in pieces:
+                    f.write(f"file '{os.path.normpath(path).replace(chr(92), '/')}'\n")
+            processor.run_command([
+                'ffmpeg', '-hide_banner', '-y',
+                '-f', 'concat', '-safe', '0', '-i', list_file,
+                *audio.mux_input(),
+                '-map', '0:v:0', '-c:v', 'copy',
+                *audio.mux_map(),
+                '-movflags', '+faststart',
+                output_file
+            ])
+    except JobCancelled:
+        raise
+    except Exception as e:
+        processor.log(f"智能渲染失败（{str(e)}），改用完整烧录", error=True)
+        shutil.rmtree(piece_folder, ignore_errors=True)
+        processor.progress.start_stage('burn', duration)
+        processor.burn_subtitles(input_file, subtitle_file, output_file, mode)
+        return
+    finally:
+        shutil.rmtree(piece_folder, ignore_errors=True)
+
+    elapsed = time.monotonic() - started
+    speed = duration / elapsed if elapsed > 0 else 0.0
+    key = f"{processor.mode_key(mode)}:{video.height}p"
+    record_burn_speed(key, 'smart', speed)
+    serial_speed = load_burn_stats().get(key, {}).get('serial')
+    comparison = f"，相对完整烧录 ({serial_speed:.2f}x 实时) 加速 {speed / serial_speed:.2f} 倍" if serial_speed else ""
+    processor.log(f"智能渲染耗时 {elapsed:.1f} 秒（{speed:.2f}x 实时）{comparison}")
@@ -0,0 +1,216 @@
+import bisect
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from array import array
+
+
+# 允许切点偏离目标时长的比例，在这个范围内优先选择不落在字幕中间的关键帧
+DURATION_TOLERANCE = 0.1
+# 最后一段短于目标时长的这个比例时，与前一段合并后重新平分
+MIN_LAST_PART_RATIO = 0.3
+# 传给 segment 复用器的切点提前的秒数，远小于一帧的时长
+SEGMENT_TIME_EPSILON = 0.001
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+class PacketIndex:
+    """
+    一次 ffprobe 读出的包索引：视频关键帧的时间，以及到每个关键帧为止所有流累计的字节数。
+    """
+
+    def __init__(self, keyframes, keyframe_bytes, total_bytes, start_time=0.0):
+        self.keyframes = keyframes
+        self.keyframe_bytes = keyframe_bytes
+        self.total_bytes = total_bytes
+        self.start_time = start_time
+
+    def to_dict(self):
+        return {
+            'keyframes': list(self.keyframes),
+            'keyframe_bytes': list(self.keyframe_bytes),
+            'total_bytes': self.total_bytes,
+            'start_time': self.start_time,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(array('d', data['keyframes']), array('q', data['keyframe_bytes']),
+                   data['total_bytes'], data.get('start_time', 0.0))
+
+    def bytes_at(self, time):
+        """到 time 为止（按最近的不晚于它的关键帧）累计的字节数。"""
+        i = bisect.bisect_right(self.keyframes, time) - 1
+        return self.keyframe_bytes[i] if i >= 0 else 0
+
+
+def packet_index_command(video_path):
+    return [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'packet=codec_type,pts_time,dts_time,size,flags',
+        '-of', 'csv=p=0', video_path
+    ]
+
+
+def read_packet_index(video_path, supervisor=None):
+    if supervisor:
+        stdout, _ = supervisor.capture(packet_index_command(video_path), stage='probe')
+    else:
+        stdout = subprocess.run(packet_index_command(video_path), capture_output=True, text=True, check=True).stdout
+    packets = []
+    for line in stdout.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 5:
+            continue
+        codec_type, pts, dts, size, flags = fields[:5]
+        try:
+            time = float(pts if pts not in ('', 'N/A') else dts)
+            size = int(size)
+        except ValueError:
+            continue
+        packets.append((time, size, codec_type == 'video' and 'K' in flags))
+
+    # 按时间排序后累计字节数，包文件顺序与显示时间并不一致
+    packets.sort(key=lambda p: p[0])
+    keyframes, keyframe_bytes = array('d'), array('q')
+    total = 0
+    for time, size, is_key in packets:
+        if is_key:
+            keyframes.append(time)
+            keyframe_bytes.append(total)
+        total += size
+    start_time = packets[0][0] if packets else 0.0
+    return PacketIndex(keyframes, keyframe_bytes, total, start_time)
+
+
+def load_packet_index(video_path, cache_dir=None, supervisor=None):
+    """
+    读取包索引，按 (路径, 大小, 修改时间) 缓存在内存中，指定目录时同时缓存到磁盘。
+    给出 supervisor 时 ffprobe 受其超时与取消控制。
+    """
+    stat = os.stat(video_path)
+    key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns)
+    with _index_lock:
+        index = _index_cache.get(key)
+    if index is not None:
+        return index
+
+    disk_path = None
+    if cache_dir:
+        digest = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+        disk_path = os.path.join(cache_dir, f"{digest}.packets.json")
+        try:
+            with open(disk_path, 'r', encoding='utf-8') as f:
+                index = PacketIndex.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        index = read_packet_index(video_path, supervisor)
+        if disk_path:
+            # 先写临时文件再替换，并发的任务或中途退出不会留下写了一半的索引
+            temp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(index.to_dict(), f)
+                os.replace(temp_path, disk_path)
+            except OSError:
+                pass
+
+    with _index_lock:
+        _index_cache[key] = index
+    return index
+
+
+def inside_event(time, events):
+    """events 为按开始时间排序的 (开始秒, 结束秒) 列表。"""
+    i = bisect.bisect_right(events, (time, float('inf'))) - 1
+    while i >= 0:
+        start, end = events[i]
+        if start < time < end:
+            return True
+        # 事件可能互相重叠，向前检查到足够早为止
+        if end < time - 60:
+            break
+        i -= 1
+    return False
+
+
+def _choose_cut(index, start, target_seconds, max_bytes, events):
+    start_bytes = index.bytes_at(start)
+    low = start + target_seconds * (1 - DURATION_TOLERANCE) if target_seconds else start
+    high = start + target_seconds * (1 + DURATION_TOLERANCE) if target_seconds else float('inf')
+    ideal = start + target_seconds if target_seconds else None
+
+    lo = bisect.bisect_right(index.keyframes, start)
+    candidates = []
+    for i in range(lo, len(index.keyframes)):
+        time = index.keyframes[i]
+        if time > high:
+            break
+        if max_bytes and index.keyframe_bytes[i] - start_bytes > max_bytes:
+            break
+        candidates.append(time)
+    if not candidates:
+        # 窗口内没有关键帧，只能用之后最近的一个
+        return index.keyframes[lo] if lo < len(index.keyframes) else None
+
+    in_window = [t for t in candidates if t >= low] or candidates[-1:]
+    if ideal is None:
+        # 只有大小限制时尽量靠近上限
+        ideal = in_window[-1]
+    clean = [t for t in in_window if not inside_event(t, events)]
+    return min(clean or in_window, key=lambda t: abs(t - ideal))
+
+
+def plan_split(index, duration, target_seconds=None, max_bytes=None, subtitle_events=None):
+    """
+    计算分割点（源时间轴上的秒数）。每段尽量接近目标时长且不超过字节上限，
+    优先选择不落在字幕事件中间的关键帧，过短的最后一段与前一段合并后平分。
+    """
+    events = sorted(subtitle_events or [])
+    end = index.start_time + duration
+    cuts = []
+    start = index.start_time
+    while True:
+        remaining_bytes = index.total_bytes - index.bytes_at(start)
+        fits_time = not target_seconds or end - start <= target_seconds * (1 + DURATION_TOLERANCE)
+        fits_size = not max_bytes or remaining_bytes <= max_bytes
+        if fits_time and fits_size:
+            break
+        cut = _choose_cut(index, start, target_seconds, max_bytes, events)
+        if cut is None or cut >= end:
+            break
+        cuts.append(cut)
+        start = cut
+
+    if cuts and target_seconds and end - cuts[-1] < target_seconds * MIN_LAST_PART_RATIO:
+        previous = cuts[-2] if len(cuts) > 1 else index.start_time
+        middle = (previous + end) / 2
+        lo = bisect.bisect_right(index.keyframes, previous)
+        hi = bisect.bisect_left(index.keyframes, end)
+        options = [
+            t for t in index.keyframes[lo:hi]
+            if not max_bytes or (index.bytes_at(t) - index.bytes_at(previous) <= max_bytes
+                                 and index.total_bytes - index.bytes_at(t) <= max_bytes)
+        ]
+        if options:
+            clean = [t for t in options if not inside_event(t, events)]
+            cuts[-1] = min(clean or options, key=lambda t: abs(t - middle))
+    return cuts
+
+
+def seek_arg(position, start_time):
+    # 输入端的 -ss 按从文件起点（start_time）算起的位置定位，与 -copyts 无关
+    return f"{max(position - start_time, 0):.6f}"
+
+
+def segment_times_arg(cuts, start_time):
+    # segment 复用器按输出时间轴（从 0 开始）比较切点，在第一个不早于切点的关键帧处切分；
+    # 切点按 6 位小数输出可能向上取整（如 2/3 秒）而错过该关键帧，因此稍微提前一点
+    return ','.join(f"{max(cut - start_time - SEGMENT_TIME_EPSILON, 0):.6f}" for cut in cuts)
@@ -0,0 +1,191 @@
+import codecs
+import os
+import re
+from array import array
+
+
+SUBTITLE_ENCODINGS = ('utf-8', 'gbk', 'big5', 'utf-16')
+SRT_TIMING = re.compile(
+    r'^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})(.*)$'
+)
+ASS_TIME = re.compile(r'^\s*(\d+):(\d{1,2}):(\d{1,2})(?:[.,](\d{1,3}))?\s*$')
+ASS_EVENT_KINDS = ('Dialogue', 'Comment')
+DEFAULT_ASS_FORMAT = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+
+
+def detect_encoding(raw):
+    """根据 BOM 判断编码，没有 BOM 时在内存中依次尝试常见编码，不重复读取文件。"""
+    if raw.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if raw.startswith(codecs.BOM_UTF16_LE) or raw.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    for encoding in SUBTITLE_ENCODINGS:
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def _fraction_ms(digits):
+    # '5' -> 500, '50' -> 500, '500' -> 500
+    return int(digits.ljust(3, '0')[:3]) if digits else 0
+
+
+def parse_ass_time(text):
+    match = ASS_TIME.match(text)
+    if not match:
+        raise ValueError(f"无法解析的时间: {text}")
+    h, m, s, frac = match.groups()
+    return ((int(h) * 60 + int(m)) * 60 + int(s)) * 1000 + _fraction_ms(frac)
+
+
+def format_ass_time(ms):
+    # ASS 时间精度为百分之一秒
+    cs = (ms + 5) // 10
+    return f"{cs // 360000}:{cs // 6000 % 60:02}:{cs // 100 % 60:02}.{cs % 100:02}"
+
+
+def format_srt_time(ms):
+    return f"{ms // 3600000:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02},{ms % 1000:03}"
+
+
+class SubtitleFile:
+    """
+    解析一次 ASS/SSA/SRT 字幕，事件的开始/结束时间以整数毫秒保存在紧凑数组中，
+    平移与截取都在数组上一次完成，其余内容原样保留以便写回。
+    """
+
+    def __init__(self, fmt, lines=None, events=None, starts=None, ends=None):
+        self.format = fmt
+        # ASS: 非事件行原样保存为 str，事件行保存为事件下标 int；SRT 不使用
+        self.lines = lines if lines is not None else []
+        # ASS: (类型, 字段列表, 开始字段下标, 结束字段下标)；SRT: (时间行尾部, 文本行列表)
+        self.events = events if events is not None else []
+        self.starts = starts if starts is not None else array('q')
+        self.ends = ends if ends is not None else array('q')
+
+    def __len__(self):
+        return len(self.events)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        encoding = detect_encoding(raw)
+        if encoding is None:
+            raise Exception("无法解码字幕文件，请检查文件编码格式")
+        text = raw.decode(encoding)
+        ext = os.path.splitext(path)[1].lower()
+        if ext in ('.ass', '.ssa'):
+            return cls.parse_ass(text, ext[1:])
+        if ext == '.srt':
+            return cls.parse_srt(text)
+        raise Exception(f"不支持的字幕格式: {ext}")
+
+    @classmethod
+    def parse_ass(cls, text, fmt='ass'):
+        sub = cls(fmt)
+        columns = DEFAULT_ASS_FORMAT
+        in_events = False
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                in_events = stripped.lower() == '[events]'
+            elif in_events and stripped.lower().startswith('format:'):
+                columns = [c.strip() for c in stripped.split(':', 1)[1].split(',')]
+            else:
+                kind, sep, value = line.partition(':')
+                if in_events and sep and kind.strip() in ASS_EVENT_KINDS:
+                    # 只按 Format 中的字段数分割，Text 字段中的逗号保持不动
+                    fields = value.lstrip().split(',', len(columns) - 1)
+                    start_idx = columns.index('Start') if 'Start' in columns else 1
+                    end_idx = columns.index('End') if 'End' in columns else 2
+                    if len(fields) > max(start_idx, end_idx):
+                        try:
+                            start, end = parse_ass_time(fields[start_idx]), parse_ass_time(fields[end_idx])
+                        except ValueError:
+                            sub.lines.append(line)
+                            continue
+                        sub.lines.append(len(sub.events))
+                        sub.events.append((kind.strip(), fields, start_idx, end_idx))
+                        sub.starts.append(start)
+                        sub.ends.append(end)
+                        continue
+            sub.lines.append(line)
+        return sub
+
+    @classmethod
+    def parse_srt(cls, text):
+        sub = cls('srt')
+        for block in re.split(r'\n\s*\n', text.replace('\r\n', '\n').replace('\r', '\n')):
+            lines = block.strip('\n').split('\n')
+            for i, line in enumerate(lines):
+                match = SRT_TIMING.match(line)
+                if not match:
+                    continue
+                g = match.groups()
+                start = ((int(g[0]) * 60 + int(g[1])) * 60 + int(g[2])) * 1000 + _fraction_ms(g[3])
+                end = ((int(g[4]) * 60 + int(g[5])) * 60 + int(g[6])) * 1000 + _fraction_ms(g[7])
+                sub.events.append((g[8], lines[i + 1:]))
+                sub.starts.append(start)
+                sub.ends.append(end)
+                break
+        return sub
+
+    def shift(self, delay_ms):
+        """所有事件整体平移 delay_ms 毫秒，早于 0 的时间截断为 0。"""
+        delay_ms = int(round(delay_ms))
+        self.starts = array('q', [t + delay_ms if t + delay_ms > 0 else 0 for t in self.starts])
+        self.ends = array('q', [t + delay_ms if t + delay_ms > 0 else 0 for t in self.ends])
+        return self
+
+    def events_in_window(self, start_ms, end_ms):
+        """与 [start_ms, end_ms) 有重叠的事件下标。"""
+        return [i for i, (s, e) in enumerate(zip(self.starts, self.ends)) if s < end_ms and e > start_ms]
+
+    def slice(self, start_ms, end_ms):
+        """
+        截取与时间窗口重叠的事件，时间轴以窗口开头为 0，并截断到窗口范围内。
+        ASS 的样式等头部信息全部保留。
+        """
+        keep = self.events_in_window(start_ms, end_ms)
+        length = end_ms - start_ms
+        sub = SubtitleFile(self.format)
+        sub.events = [self.events[i] for i in keep]
+        sub.starts = array('q', [min(max(self.starts[i] - start_ms, 0), length) for i in keep])
+        sub.ends = array('q', [min(max(self.ends[i] - start_ms, 0), length) for i in keep])
+        if self.format != 'srt':
+            remap = {old: new for new, old in enumerate(keep)}
+            sub.lines = [
+                remap[item] if isinstance(item, int) else item
+                for item in self.lines
+                if not isinstance(item, int) or item in remap
+            ]
+        return sub
+
+    def serialize(self):
+        if self.format == 'srt':
+            blocks = []
+            for n, ((suffix, text_lines), start, end) in enumerate(zip(self.events, self.starts, self.ends), 1):
+                timing = f"{format_srt_time(start)} --> {format_srt_time(end)}{suffix}"
+                blocks.append('\n'.join([str(n), timing, *text_lines]))
+            return '\n\n'.join(blocks) + '\n'
+
+        out = []
+        for item in self.lines:
+            if not isinstance(item, int):
+                out.append(item)
+                continue
+            kind, fields, start_idx, end_idx = self.events[item]
+            fields = list(fields)
+            fields[start_idx] = format_ass_time(self.starts[item])
+            fields[end_idx] = format_ass_time(self.ends[item])
+            out.append(f"{kind}: {','.join(fields)}")
+        return '\n'.join(out) + '\n'
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.serialize())
+        return path
@@ -0,0 +1,346 @@
+import collections
+import os
+import queue
+import re
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from progress import parse_progress_line
+
+
+# 失败时随错误一起报告的最后若干行输出
+STDERR_TAIL_LINES = 40
+# 子进程既没有输出、进度也不前进超过这个秒数时判定为卡死，None 表示不检测
+DEFAULT_STALL_SECONDS = 600
+# 终止进程组后等待它自行退出（FFmpeg 会写完文件尾）的秒数，超时后强制结束
+KILL_GRACE_SECONDS = 5
+POLL_INTERVAL = 0.5
+READ_SIZE = 64 * 1024
+# FFmpeg 的统计行以 \r 结尾，与 \n 一样作为行尾
+LINE_BREAK = re.compile(rb'[\r\n]')
+# 进度块中这些字段变化才算进展；卡住的 FFmpeg 仍会定期输出数值不变的进度块
+PROGRESS_FIELDS = ('out_time_us', 'out_time_ms', 'frame', 'total_size')
+# rusage 中块 I/O 的计数单位
+BLOCK_BYTES = 512
+# ru_maxrss 在 macOS 上以字节计，在 Linux 上以 KB 计
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+class JobCancelled(Exception):
+    """任务被取消（界面的停止按钮、队列中取消任务或 Ctrl+C）。"""
+
+
+class ProcessTimeout(Exception):
+    """子进程超过阶段时限或长时间没有进展，已被终止。"""
+
+
+@dataclass
+class ProcessStats:
+    """一个正常退出（含返回码非 0）的子进程的资源消耗；拿不到 rusage 的平台（Windows）上资源字段为 None。"""
+    cmd: list
+    stage: str
+    seconds: float
+    returncode: int
+    user_cpu: float = None
+    system_cpu: float = None
+    max_rss_bytes: int = None
+    # 实际发生的块设备读写（rusage 的 inblock/oublock），命中页缓存的读取不计入
+    read_bytes: int = None
+    write_bytes: int = None
+    # FFmpeg -progress 最后报告的 fps 与倍速
+    fps: float = None
+    speed: float = None
+
+
+def _progress_number(value):
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None
+
+
+class _LineSplitter:
+    def __init__(self):
+        self.buffer = b''
+
+    def feed(self, data):
+        """data 为 None 表示读到末尾，返回已完整的行。"""
+        if data is None:
+            rest, self.buffer = self.buffer, b''
+            return [rest.decode('utf-8', 'replace')] if rest.strip() else []
+        parts = LINE_BREAK.split(self.buffer + data)
+        self.buffer = parts.pop()
+        return [p.decode('utf-8', 'replace') for p in parts if p.strip()]
+
+
+class ProcessSupervisor:
+    """
+    统一启动和监督所有外部进程：不经过 shell 直接启动，每个进程单独一个进程组，
+    以非阻塞方式读取输出，只保留最后若干行用于报错，按阶段限时并检测卡死；
+    cancel() 终止当前所有进程组，之后启动的进程立即失败，直到 reset()。
+    """
+
+    def __init__(self, stage_timeouts=None, stall_seconds=DEFAULT_STALL_SECONDS):
+        # {阶段: 秒数}，该阶段中单个进程的最长运行时间
+        self.stage_timeouts = dict(stage_timeouts or {})
+        self.stall_seconds = stall_seconds
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        # 每个进程结束后以 ProcessStats 调用，如 metrics.MetricsRecorder.on_process
+        self.listeners = []
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def reset(self):
+        """清除取消状态；由发起取消的一方在被取消的任务结束后调用，任务开始时不调用，以免丢失任务之间的取消。"""
+        self._cancel.clear()
+
+    def wait_cancelled(self, timeout):
+        """最多等待 timeout 秒，期间被取消时立即返回 True。"""
+        return self._cancel.wait(timeout)
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled("任务已取消")
+
+    def cancel(self):
+        """可在任意线程调用，不等待进程退出；强制结束由各进程的监督循环完成。"""
+        self._cancel.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            self._signal(process, kill=False)
+
+    def spawn(self, cmd, **kwargs):
+        """启动并登记一个进程，调用方结束后需调用 release()。"""
+        self.check()
+        if os.name == 'nt':
+            kwargs['creationflags'] = kwargs.get('creationflags', 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # 单独的会话，终止时连同它的子进程一起结束，Ctrl+C 也不会绕过监督直接送达
+            kwargs['start_new_session'] = True
+        process = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._processes.add(process)
+        # cancel() 可能发生在启动的同时，此时它还不在登记表中
+        if self._cancel.is_set():
+            self.stop(process)
+            self.release(process)
+            raise JobCancelled("任务已取消")
+        return process
+
+    def release(self, process):
+        with self._lock:
+            self._processes.discard(process)
+        for stream in (process.stdout, process.stderr):
+            if stream:
+                stream.close()
+
+    def stop(self, process):
+        """终止进程组，等待片刻后仍未退出则强制结束。"""
+        if process.poll() is not None:
+            return
+        self._signal(process, kill=False)
+        try:
+            process.wait(KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            self._signal(process, kill=True)
+            process.wait()
+
+    @staticmethod
+    def _signal(process, kill):
+        if process.poll() is not None:
+            return
+        try:
+            if os.name == 'nt':
+                if kill:
+                    subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                else:
+                    process.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+
+    def run(self, cmd, on_line=None, stage=None, pass_fds=()):
+        """
+        运行命令，标准输出与标准错误合并后按行交给 on_line。
+        失败时抛出 CalledProcessError，output 为最后若干行（不含进度行）输出。
+        """
+        tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+        splitter = _LineSplitter()
+        last_progress = {}
+        rates = {}
+
+        def handle(_, data):
+            active = False
+            for line in splitter.feed(data):
+                line = line.strip()
+                parsed = parse_progress_line(line)
+                if parsed:
+                    key, value = parsed
+                    if key in ('fps', 'speed'):
+                        rates[key] = _progress_number(value)
+                    if key in PROGRESS_FIELDS and last_progress.get(key) != value:
+                        last_progress[key] = value
+                        active = True
+                else:
+                    tail.append(line)
+                    active = True
+                if on_line:
+                    on_line(line)
+            return active
+
+        process = self.spawn(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                             pass_fds=pass_fds)
+        try:
+            stats = self._supervise(process, [process.stdout], handle, stage)
+        finally:
+            self.release(process)
+        stats.fps, stats.speed = rates.get('fps'), rates.get('speed')
+        self._report(stats)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, output='\n'.join(tail))
+
+    def capture(self, cmd, stage=None):
+        """运行命令并返回 (完整的标准输出, 标准错误最后若干行)，用于 ffprobe 等需要解析输出的命令。"""
+        stdout = bytearray()
+        tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+        splitter = _LineSplitter()
+
+        def handle(stream, data):
+            if stream is process.stdout:
+                stdout.extend(data or b'')
+            else:
+                tail.extend(line.strip() for line in splitter.feed(data))
+            return bool(data)
+
+        process = self.spawn(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+        try:
+            stats = self._supervise(process, [process.stdout, process.stderr], handle, stage)
+        finally:
+            self.release(process)
+        self._report(stats)
+        stderr = '\n'.join(tail)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, output=stdout.decode('utf-8', 'replace'),
+                                                stderr=stderr)
+        return stdout.decode('utf-8', 'replace'), stderr
+
+    def _supervise(self, process, streams, handle, stage):
+        timeout = self.stage_timeouts.get(stage)
+        started = last_active = time.monotonic()
+
+        def check(now):
+            reason = None
+            if self._cancel.is_set():
+                self.stop(process)
+                raise JobCancelled("任务已取消")
+            if timeout and now - started > timeout:
+                reason = f"超过阶段 {stage} 的时限 {timeout} 秒"
+            elif self.stall_seconds and now - last_active > self.stall_seconds:
+                reason = f"{self.stall_seconds} 秒没有进展，判定为卡死"
+            if reason:
+                self.stop(process)
+                raise ProcessTimeout(f"{os.path.basename(process.args[0])} {reason}，已终止")
+
+        for stream, data in self._read(streams):
+            now = time.monotonic()
+            if stream is not None and handle(stream, data):
+                last_active = now
+            check(now)
+        # 输出已关闭但进程可能仍在运行（或关闭了管道后卡住），等待退出时同样检查取消、时限与卡死
+        stats = ProcessStats(cmd=list(process.args), stage=stage, seconds=0.0, returncode=0)
+        while not self._reap(process, stats):
+            self._cancel.wait(POLL_INTERVAL)
+            check(time.monotonic())
+        stats.seconds = time.monotonic() - started
+        stats.returncode = process.returncode
+        return stats
+
+    @staticmethod
+    def _reap(process, stats):
+        """
+        不阻塞地检查进程是否已退出，已退出时回收并返回 True；
+        POSIX 上用 wait4 同时取得该进程自己的 rusage。
+        """
+        if not hasattr(os, 'wait4'):
+            try:
+                process.wait(POLL_INTERVAL)
+            except subprocess.TimeoutExpired:
+                return False
+            return True
+        try:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        except ChildProcessError:
+            process.wait()
+            return True
+        if pid == 0:
+            return False
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stats.user_cpu = usage.ru_utime
+        stats.system_cpu = usage.ru_stime
+        stats.max_rss_bytes = usage.ru_maxrss * MAXRSS_UNIT
+        stats.read_bytes = usage.ru_inblock * BLOCK_BYTES
+        stats.write_bytes = usage.ru_oublock * BLOCK_BYTES
+        return True
+
+    def _report(self, stats):
+        for listener in list(self.listeners):
+            listener(stats)
+
+    @staticmethod
+    def _read(streams):
+        """
+        逐块产生 (流, 数据)，读到末尾时数据为 None；每 POLL_INTERVAL 秒至少产生一次 (None, None)，
+        让调用方检查取消与超时。POSIX 上用 selectors 多路复用，Windows 的管道不支持 select，改用读取线程。
+        """
+        if os.name == 'nt':
+            chunks = queue.Queue()
+
+            def reader(stream):
+                for block in iter(lambda: stream.read1(READ_SIZE), b''):
+                    chunks.put((stream, block))
+                chunks.put((stream, None))
+
+            for stream in streams:
+                threading.Thread(target=reader, args=(stream,), daemon=True).start()
+            remaining = len(streams)
+            while remaining:
+                try:
+                    stream, data = chunks.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    yield None, None
+                    continue
+                remaining -= data is None
+                yield stream, data
+            return
+
+        with selectors.DefaultSelector() as selector:
+            for stream in streams:
+                os.set_blocking(stream.fileno(), False)
+                selector.register(stream, selectors.EVENT_READ)
+            while selector.get_map():
+                events = selector.select(POLL_INTERVAL)
+                if not events:
+                    yield None, None
+                    continue
+                for key, _ in events:
+                    try:
+                        data = os.read(key.fd, READ_SIZE)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        yield key.fileobj, None
+                    else:
+                        yield key.fileobj, data
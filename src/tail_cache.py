@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoprocessor", "tails")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TailCache:
+    """
+    转码后尾巴 TS 的磁盘缓存，按尾巴文件内容哈希 + 目标参数 + 烧录模式寻址。
+    命中时更新文件修改时间，超过容量上限时按最近最少使用的顺序淘汰。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, tail_path, params, burn_mode):
+        payload = json.dumps(
+            {'tail': file_digest(tail_path), 'params': params, 'mode': burn_mode},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.ts")
+
+    def get(self, key):
+        path = self.path_for(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, ts_path):
+        """把转码好的 TS 移入缓存并返回缓存中的路径。"""
+        path = self.path_for(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.replace(ts_path, temp_path)
+        except OSError:
+            # 跨文件系统时无法直接改名，退回复制
+            with open(ts_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                for block in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(block)
+            os.remove(ts_path)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.ts'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
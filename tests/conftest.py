@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 源码以脚本方式运行（python src/cli.py），模块之间按顶层模块名相互导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from concat import concat_segments_with_tail
+
+
+class FakeProcessor:
+    """按 concat 命令写出成品；失败名单中的成品写到一半后报错。"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def run_command(self, cmd, **kwargs):
+        output_file = cmd[-1]
+        with open(output_file, 'wb') as f:
+            f.write(b'partial')
+        if os.path.basename(output_file) in self.failing:
+            raise RuntimeError(f"拼接失败: {output_file}")
+
+    def log(self, message, error=False):
+        pass
+
+
+def make_jobs(folder, count):
+    jobs = []
+    for i in range(count):
+        segment = folder / f"part{i}.ts"
+        segment.write_bytes(b'segment')
+        jobs.append((str(segment), str(folder / f"final_part{i}.ts")))
+    return jobs
+
+
+def test_on_done_called_per_segment(tmp_path):
+    jobs = make_jobs(tmp_path, 3)
+    done = []
+    concat_segments_with_tail(FakeProcessor(), jobs, str(tmp_path / "tail.ts"), {'has_audio': False}, (),
+                              workers=2, keep_segments=True, on_done=lambda seg, out: done.append((seg, out)))
+    assert sorted(done) == sorted(jobs)
+
+
+def test_on_done_skips_failed_segment(tmp_path):
+    jobs = make_jobs(tmp_path, 3)
+    done = []
+    with pytest.raises(RuntimeError):
+        concat_segments_with_tail(FakeProcessor(failing={'final_part1.ts'}), jobs, str(tmp_path / "tail.ts"),
+                                  {'has_audio': False}, (), workers=1, keep_segments=True,
+                                  on_done=lambda seg, out: done.append(out))
+    assert [os.path.basename(out) for out in done] == ['final_part0.ts', 'final_part2.ts']
+
+
+def test_failed_segment_removes_only_its_own_output(tmp_path):
+    jobs = make_jobs(tmp_path, 3)
+    with pytest.raises(RuntimeError):
+        concat_segments_with_tail(FakeProcessor(failing={'final_part1.ts'}), jobs, str(tmp_path / "tail.ts"),
+                                  {'has_audio': False}, (), workers=2, keep_segments=True)
+    assert os.path.exists(jobs[0][1])
+    assert not os.path.exists(jobs[1][1])
+    assert os.path.exists(jobs[2][1])
@@ -0,0 +1,19 @@
+from governor import ResourceGovernor
+
+
+def test_wrap_prefixes_taskset_and_nice():
+    governor = ResourceGovernor(cpu_set=[0, 1, 2, 3], pin=True, nice=5)
+    governor.taskset, governor.nice_cmd = 'taskset', 'nice'
+    cmd = governor.wrap(['ffmpeg', '-i', 'in.mp4', 'out.mp4'], [2, 3])
+    assert cmd == ['taskset', '-c', '2,3', 'nice', '-n', '5', 'ffmpeg', '-i', 'in.mp4', 'out.mp4']
+
+
+def test_wrap_without_pin_or_nice_keeps_command():
+    governor = ResourceGovernor(cpu_set=[0, 1])
+    assert governor.wrap(['ffmpeg', 'out.mp4'], [0, 1]) == ['ffmpeg', 'out.mp4']
+
+
+def test_wrap_without_lease_skips_taskset():
+    governor = ResourceGovernor(cpu_set=[0, 1], pin=True)
+    governor.taskset = 'taskset'
+    assert governor.wrap(['ffmpeg', 'out.mp4'], []) == ['ffmpeg', 'out.mp4']
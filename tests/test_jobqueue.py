@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from jobqueue import JobQueue, run_worker
+from supervisor import JobCancelled, ProcessSupervisor
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.supervisor = ProcessSupervisor()
+        self.processed = []
+
+    def process_video(self, folder, **kwargs):
+        self.processed.append(folder)
+        return []
+
+    def cancel(self):
+        self.supervisor.cancel()
+
+    def log(self, message, error=False):
+        pass
+
+
+def test_cancel_between_jobs_stops_before_next_lease(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(str(tmp_path / "a"), {})
+    processor = FakeProcessor()
+    processor.cancel()
+    with pytest.raises(JobCancelled):
+        run_worker(queue, processor, once=True)
+    assert processor.processed == []
+    assert queue.status()[0]['state'] == 'queued'
+
+
+def test_cancel_while_idle_wakes_worker(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    processor = FakeProcessor()
+    threading.Timer(0.1, processor.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        run_worker(queue, processor, poll_interval=30)
+    assert time.monotonic() - started < 5
+
+
+class InterruptedProcessor(FakeProcessor):
+    def process_video(self, folder, **kwargs):
+        # 模拟处理中途收到 Ctrl+C
+        self.cancel()
+        raise JobCancelled("任务已取消")
+
+
+def test_interrupt_requeues_without_using_an_attempt(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(str(tmp_path / "a"), {})
+    for _ in range(5):
+        with pytest.raises(JobCancelled):
+            run_worker(queue, InterruptedProcessor(), once=True)
+    job = queue.status()[0]
+    assert job['state'] == 'queued'
+    assert job['attempts'] == 0
+    assert job['lease_owner'] is None
@@ -0,0 +1,76 @@
+import os
+
+from library import LibraryScanner, pair_subtitles
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x')
+
+
+def test_exact_stem_wins_over_language_variants():
+    pairs = pair_subtitles(['Show.S01E01.mkv'], ['Show.S01E01.srt', 'Show.S01E01.chs.ass'])
+    assert pairs == {'Show.S01E01.mkv': 'Show.S01E01.srt'}
+
+
+def test_stem_without_language_prefers_language_order():
+    videos = ['Show.S01E01.mkv', 'Show.S01E02.mkv']
+    subtitles = ['Show.S01E01.eng.srt', 'Show.S01E01.chs.ass', 'Show.S01E02.cht.ass']
+    assert pair_subtitles(videos, subtitles) == {
+        'Show.S01E01.mkv': 'Show.S01E01.chs.ass',
+        'Show.S01E02.mkv': 'Show.S01E02.cht.ass',
+    }
+
+
+def test_episode_number_pairs_different_names():
+    videos = ['[Group] Title - 01 [1080p].mkv', '[Group] Title - 02 [1080p].mkv', 'Other 第3集.mp4']
+    subtitles = ['Title.E01.sc.ass', 'Title.E02.sc.ass', 'Title.S01E03.chs.srt', 'Title.E04.sc.ass']
+    assert pair_subtitles(videos, subtitles) == {
+        '[Group] Title - 01 [1080p].mkv': 'Title.E01.sc.ass',
+        '[Group] Title - 02 [1080p].mkv': 'Title.E02.sc.ass',
+        # 视频缺季号时只比较集数
+        'Other 第3集.mp4': 'Title.S01E03.chs.srt',
+    }
+
+
+def test_episode_season_mismatch_is_not_paired():
+    pairs = pair_subtitles(['Show.S01E01.mkv', 'Show.S01E02.mkv'], ['Show.S02E01.srt'])
+    assert pairs == {}
+
+
+def test_single_video_falls_back_to_any_subtitle():
+    assert pair_subtitles(['movie.mp4'], ['subs.eng.srt', 'subs.chs.srt']) == {'movie.mp4': 'subs.chs.srt'}
+
+
+def test_scan_inherits_tail_from_parent(tmp_path):
+    root = tmp_path / 'library'
+    touch(str(root / 'tail.mp4'))
+    touch(str(root / 'Season 1' / 'Show.S01E01.mkv'))
+    touch(str(root / 'Season 1' / 'Show.S01E01.srt'))
+    touch(str(root / 'Season 2' / 'tail_s2.mp4'))
+    touch(str(root / 'Season 2' / 'Show.S02E01.mkv'))
+    touch(str(root / 'Season 2' / 'Show.S02E01.srt'))
+
+    jobs = {os.path.basename(job.video): job for job in LibraryScanner(str(root)).scan()}
+    assert jobs['Show.S01E01.mkv'].tail == str(root / 'tail.mp4')
+    assert jobs['Show.S02E01.mkv'].tail == str(root / 'Season 2' / 'tail_s2.mp4')
+    assert jobs['Show.S01E01.mkv'].episode == 'S01E01'
+    # 尾巴不会被当成待处理的视频
+    assert 'tail_s2.mp4' not in jobs
+
+
+def test_rescan_reuses_unchanged_directories(tmp_path):
+    root = tmp_path / 'library'
+    touch(str(root / 'a' / 'Show.S01E01.mkv'))
+    touch(str(root / 'a' / 'Show.S01E01.srt'))
+    touch(str(root / 'b' / 'Show.S01E02.mkv'))
+    touch(str(root / 'b' / 'Show.S01E02.srt'))
+    LibraryScanner(str(root)).scan()
+
+    touch(str(root / 'b' / 'Show.S01E02.chs.srt'))
+    scanner = LibraryScanner(str(root))
+    jobs = scanner.scan()
+    # 只有 b 目录内容变化，根目录与 a 目录沿用上次的配对
+    assert scanner.rescanned == 1
+    assert len(jobs) == 2
@@ -0,0 +1,24 @@
+import io
+
+from logbuffer import ConsoleLog, LogBuffer
+
+
+def test_log_buffer_drops_oldest():
+    buffer = LogBuffer(maxlen=3)
+    for i in range(5):
+        buffer.append(i)
+    assert buffer.drain() == ([2, 3, 4], 2)
+    assert buffer.drain() == ([], 0)
+
+
+def test_console_log_bounds_ffmpeg_output():
+    stream = io.StringIO()
+    console = ConsoleLog(max_lines=5, stream=stream)
+    console.log("[12:00:00] 开始烧录字幕")
+    for i in range(1000):
+        console.output(f"warning {i}")
+    lines = stream.getvalue().splitlines()
+    # 同一秒内的大量输出最多写出 max_lines 行（跨秒时再多一个窗口）
+    assert lines[0] == "[12:00:00] 开始烧录字幕"
+    assert len(lines) <= 1 + 2 * 5 + 1
+    assert console.dropped + len(lines) - 1 >= 1000 - 5
@@ -0,0 +1,60 @@
+import os
+
+from manifest import JobManifest, file_fingerprint
+
+
+def write(path, data=b'data'):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_record_is_fresh_invalidate_round_trip(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    source = write(tmp_path / 'video.mp4')
+    output = write(tmp_path / 'burned.mp4')
+    inputs = {'video': file_fingerprint(source), 'mode': 'standard'}
+
+    manifest = JobManifest(path)
+    assert not manifest.is_fresh('burn', inputs)
+    manifest.record('burn', inputs, [output])
+    assert manifest.is_fresh('burn', inputs)
+    assert manifest.outputs('burn') == [os.path.abspath(output)]
+
+    # 重新打开时从磁盘读回
+    reopened = JobManifest(path)
+    assert reopened.is_fresh('burn', inputs)
+    reopened.invalidate('burn')
+    assert not reopened.is_fresh('burn', inputs)
+    assert not JobManifest(path).is_fresh('burn', inputs)
+
+
+def test_changed_input_fingerprint_invalidates(tmp_path):
+    manifest = JobManifest(str(tmp_path / 'manifest.json'))
+    source = write(tmp_path / 'video.mp4')
+    output = write(tmp_path / 'burned.mp4')
+    manifest.record('burn', {'video': file_fingerprint(source)}, [output])
+
+    write(source, b'longer data')
+    assert not manifest.is_fresh('burn', {'video': file_fingerprint(source)})
+    # 参数变化同样需要重做
+    assert not manifest.is_fresh('burn', {'video': file_fingerprint(source), 'mode': 'lossless'})
+
+
+def test_modified_or_missing_output_invalidates(tmp_path):
+    manifest = JobManifest(str(tmp_path / 'manifest.json'))
+    inputs = {'mode': 'standard'}
+    output = write(tmp_path / 'burned.mp4')
+    manifest.record('burn', inputs, [output])
+
+    write(output, b'truncated')
+    assert not manifest.is_fresh('burn', inputs)
+    manifest.record('burn', inputs, [output])
+    os.remove(output)
+    assert not manifest.is_fresh('burn', inputs)
+
+
+def test_ignores_other_manifest_versions(tmp_path):
+    path = tmp_path / 'manifest.json'
+    path.write_text('{"version": 0, "stages": {"burn": {"inputs": {}, "outputs": []}}}', encoding='utf-8')
+    assert not JobManifest(str(path)).is_fresh('burn', {})
@@ -0,0 +1,22 @@
+from parallel import chunk_command
+
+
+class FakeProcessor:
+    def video_encode_args(self, mode):
+        return ['-c:v', 'libx264', '-crf', '23']
+
+
+def test_chunk_command_seeks_relative_to_start_time():
+    # MPEG-TS 等源文件的时间轴常从非 0 开始，关键帧 pts 为绝对时间
+    start_time = 1.4
+    cmd = chunk_command(FakeProcessor(), 'in.ts', start_time, 61.4, 121.4,
+                        f"setpts=PTS-{start_time}/TB,subtitles=s.ass,setpts=PTS-STARTPTS", 'h264', 'chunk.mp4')
+    assert cmd[cmd.index('-ss') + 1] == '60.000000'
+    assert cmd[cmd.index('-t') + 1] == '60.000000'
+    assert cmd.index('-copyts') < cmd.index('-i')
+    assert cmd[-1] == 'chunk.mp4'
+
+
+def test_chunk_command_first_chunk_starts_at_file_start():
+    cmd = chunk_command(FakeProcessor(), 'in.ts', 1.4, 1.4, 61.4, 'null', 'h264', 'chunk.mp4')
+    assert cmd[cmd.index('-ss') + 1] == '0.000000'
@@ -0,0 +1,27 @@
+import os
+
+from concat import segment_ts_command
+from planner import _quality_stage, _tail_concat_stage
+from quality import SAMPLE_WINDOWS
+
+
+def test_tail_stage_lists_segment_to_ts_producer(tmp_path):
+    folder = str(tmp_path)
+    stage = _tail_concat_stage(folder, 2, 1000, 100, ts=False, audio_args=['-c:a', 'copy'])
+    segment = os.path.join(folder, "part_000.mp4")
+    if os.name == 'posix':
+        assert segment_ts_command(segment, ['-c:a', 'copy'], 'pipe:1') in stage.commands
+    assert len(stage.commands) == 4
+    assert stage.commands[-1][-1] == os.path.join(folder, "final_part_001.mp4")
+
+
+def test_tail_stage_ts_segments_concat_directly(tmp_path):
+    stage = _tail_concat_stage(str(tmp_path), 3, 1000, 100, ts=True)
+    assert len(stage.commands) == 3
+
+
+def test_quality_stage_lists_trial_encodes():
+    stage = _quality_stage('in.mkv', 600.0, 2.0)
+    # 每个窗口一条参考片段，第一轮每个窗口一次试编码和一次比较
+    assert len(stage.commands) == SAMPLE_WINDOWS * 3
+    assert any('-crf' in cmd for cmd in stage.commands)
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from scratch import ScratchManager
+
+
+def test_guard_removes_only_declared_outputs(tmp_path):
+    folder = tmp_path / "show [1080p]"
+    folder.mkdir()
+    (folder / "old_part.mp4").write_bytes(b'old')
+    with pytest.raises(RuntimeError):
+        with ScratchManager().guard(str(folder / "part_*.mp4"), str(folder / "burned.mp4")):
+            (folder / "part_000.mp4").write_bytes(b'half')
+            (folder / "burned.mp4").write_bytes(b'half')
+            # 同一文件夹中用户或其他任务同时写入的文件
+            (folder / "notes.txt").write_bytes(b'user')
+            raise RuntimeError("阶段失败")
+    assert sorted(os.listdir(folder)) == ['notes.txt', 'old_part.mp4']
+
+
+def test_guard_keeps_unchanged_outputs(tmp_path):
+    existing = tmp_path / "part_000.mp4"
+    existing.write_bytes(b'done')
+    with pytest.raises(KeyboardInterrupt):
+        with ScratchManager().guard(str(tmp_path / "part_*.mp4")):
+            (tmp_path / "part_001.mp4").write_bytes(b'half')
+            raise KeyboardInterrupt
+    assert os.listdir(tmp_path) == ['part_000.mp4']
@@ -0,0 +1,53 @@
+import pytest
+
+from probe import StreamInfo
+from size_budget import (CONTAINER_OVERHEAD, HIGH_END_AUDIO_BITRATE, LOSSLESS_AUDIO_BITRATE, VBV_BUFFERS_PER_PART,
+                         audio_bitrate, longest_part_seconds, plan_size_budget)
+
+MB = 1000 * 1000
+
+
+def test_maxrate_and_bufsize():
+    budget = plan_size_budget(100 * MB, 600, 10, 128_000)
+    # (800e6 * 0.97 - 128k * 610) / (610 + 2 * 3)
+    assert budget['maxrate'] == 1_132_987
+    assert budget['bufsize'] == budget['maxrate'] * 2
+
+
+def test_worst_case_part_fits_after_container_overhead():
+    max_bytes, part_seconds, tail_seconds, audio_bps = 200 * MB, 1200, 15, 192_000
+    budget = plan_size_budget(max_bytes, part_seconds, tail_seconds, audio_bps)
+    worst_bits = ((budget['maxrate'] + audio_bps) * (part_seconds + tail_seconds)
+                  + budget['bufsize'] * VBV_BUFFERS_PER_PART)
+    assert worst_bits <= max_bytes * 8 * (1 - CONTAINER_OVERHEAD)
+    # 除封装开销外预算几乎用满
+    assert worst_bits > max_bytes * 8 * (1 - 2 * CONTAINER_OVERHEAD)
+
+
+def test_audio_exceeding_budget_raises():
+    # 1920k 音频 10 分钟就超过 100MB，视频码率为负
+    with pytest.raises(Exception, match="每段大小上限过小"):
+        plan_size_budget(100 * MB, 600, 0, HIGH_END_AUDIO_BITRATE)
+
+
+def test_too_small_video_bitrate_raises():
+    with pytest.raises(Exception, match="每段大小上限过小"):
+        plan_size_budget(10 * MB, 600, 0, 0)
+
+
+def test_audio_bitrate_sources():
+    audio = StreamInfo(index=1, codec_type='audio', codec_name='aac', bit_rate=256_000)
+    assert audio_bitrate(None) == 0
+    assert audio_bitrate(audio) == 256_000
+    assert audio_bitrate(audio, high_end_audio=True) == HIGH_END_AUDIO_BITRATE
+    mkv = StreamInfo(index=1, codec_type='audio', codec_name='aac', tags={'BPS-eng': '160000'})
+    assert audio_bitrate(mkv) == 160_000
+    flac = StreamInfo(index=1, codec_type='audio', codec_name='flac')
+    assert audio_bitrate(flac) == LOSSLESS_AUDIO_BITRATE
+
+
+def test_longest_part_allows_cut_tolerance():
+    assert longest_part_seconds(3600, None) == 3600
+    assert longest_part_seconds(3600, 10, exact_cuts=True) == 600
+    assert longest_part_seconds(3600, 10) == pytest.approx(660)
+    assert longest_part_seconds(300, 10) == 300
@@ -0,0 +1,66 @@
+from probe import StreamInfo
+from smartrender import (check_rendered_piece, copy_pass_command, leading_pictures, parse_header_fields, render_command,
+                         sps_encode_args)
+
+TRACE = [
+    "[trace_headers @ 0x5581] Picture Parameter Set",
+    "[trace_headers @ 0x5581] 0           pic_parameter_set_id                                        1 = 0",
+    "[trace_headers @ 0x5581] 7           entropy_coding_mode_flag                                    0 = 0",
+    "[trace_headers @ 0x5581] 19          weighted_pred_flag                                          1 = 1",
+    "[trace_headers @ 0x5581] 20          weighted_bipred_idc                                        00 = 0",
+    "[trace_headers @ 0x5581] 34          transform_8x8_mode_flag                                     1 = 1",
+    "[trace_headers @ 0x5581] 60          entropy_coding_mode_flag                                    1 = 1",
+]
+
+
+def video(has_b_frames=2):
+    return StreamInfo(index=0, codec_type='video', codec_name='h264', profile='High', level=40,
+                      width=1920, height=1080, pix_fmt='yuv420p', r_frame_rate='24000/1001',
+                      raw={'refs': 4, 'has_b_frames': has_b_frames})
+
+
+def test_render_command_uses_copy_pass_timeline():
+    start_time = 1.4
+    spans = [(1.4, 11.4, False), (11.4, 21.4, True), (21.4, 31.4, False)]
+    render = render_command('in.ts', start_time, 11.4, 21.4, 'null', [], 'render.ts')
+    copy = copy_pass_command('in.ts', spans, start_time, 'pieces')
+    seek = float(render[render.index('-ss') + 1])
+    first_cut = float(copy[copy.index('-segment_times') + 1].split(',')[0])
+    # 两次切分都以文件起点为 0，重新编码的段与复制切出的段起点一致
+    assert abs(seek - first_cut) < 0.01
+    assert seek == 10.0
+
+
+def test_leading_pictures_closed_gop():
+    # 解码顺序：I P B B，B 帧显示时间都在关键帧之后
+    stdout = "10.000,9.920,K__\n10.120,9.960,___\n10.040,10.000,___\n10.080,10.040,___\n"
+    assert leading_pictures(stdout) == 0
+
+
+def test_leading_pictures_open_gop():
+    # 开放 GOP：关键帧之后解码的 B 帧显示在关键帧之前
+    stdout = "10.080,10.000,K__\n9.960,10.040,___\n10.000,10.080,___\n10.200,10.120,___\n"
+    assert leading_pictures(stdout) == 2
+
+
+def test_parse_header_fields_keeps_first_value():
+    fields = parse_header_fields(TRACE)
+    assert fields == {'entropy_coding_mode_flag': 0, 'weighted_pred_flag': 1, 'weighted_bipred_idc': 0,
+                      'transform_8x8_mode_flag': 1}
+
+
+def test_sps_encode_args_matches_source_headers():
+    args = sps_encode_args(video(has_b_frames=1), ['-c:v', 'libx264', '-x264-params', 'aq-mode=3'],
+                           parse_header_fields(TRACE))
+    params = args[args.index('-x264-params') + 1].split(':')
+    assert args.count('-x264-params') == 1
+    assert params == ['aq-mode=3', 'cabac=0', '8x8dct=1', 'weightp=2', 'weightb=0', 'b-pyramid=none']
+    assert args[args.index('-refs') + 1] == '4'
+
+
+def test_check_rendered_piece_compares_pps_and_reorder_depth():
+    header = parse_header_fields(TRACE)
+    assert check_rendered_piece(video(), header, video(), dict(header)) is None
+    assert 'entropy_coding_mode_flag' in check_rendered_piece(
+        video(), header, video(), dict(header, entropy_coding_mode_flag=1))
+    assert 'has_b_frames' in check_rendered_piece(video(), header, video(has_b_frames=1), header)
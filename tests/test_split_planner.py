@@ -0,0 +1,21 @@
+from fractions import Fraction
+
+from split_planner import segment_times_arg
+
+
+def test_segment_times_never_round_past_keyframe():
+    # 1/3 秒倍数的关键帧 pts 无法用 6 位小数精确表示，2/3 会被向上取整
+    keyframes = [Fraction(n, 3) for n in range(1, 30)]
+    values = segment_times_arg([float(k) for k in keyframes], 0.0).split(',')
+    for keyframe, value in zip(keyframes, values):
+        cut = Fraction(value)
+        assert cut <= keyframe
+        # 仍在上一帧（60 fps）之后，不会提前到上一个关键帧
+        assert cut > keyframe - Fraction(1, 60)
+
+
+def test_segment_times_relative_to_start_time():
+    start_time = 1.4
+    values = segment_times_arg([start_time + 10 / 3, start_time + 20 / 3], start_time).split(',')
+    for value, offset in zip(values, (10 / 3, 20 / 3)):
+        assert offset - 0.002 < float(value) < offset
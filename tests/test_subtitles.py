@@ -0,0 +1,86 @@
+import codecs
+
+from subtitles import SubtitleFile, detect_encoding
+
+ASS = """[Script Info]
+Title: test
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize
+Style: Default,Arial,20
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:01.00,0:00:03.50,Default,,0,0,0,,你好, 世界,再见
+Comment: 0,0:00:05.00,0:00:06.00,Default,,0,0,0,,注释
+Dialogue: 0,0:01:00.25,0:01:02.00,Default,,0,0,0,,{\\pos(10,20)}第三句
+"""
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+第一行, 带逗号
+第二行
+
+2
+00:00:10,5 --> 00:00:12,000 X1:0
+第二句
+"""
+
+
+def test_parse_ass_keeps_commas_in_text():
+    sub = SubtitleFile.parse_ass(ASS)
+    assert len(sub) == 3
+    assert list(sub.starts) == [1000, 5000, 60250]
+    assert list(sub.ends) == [3500, 6000, 62000]
+    kind, fields, _, _ = sub.events[0]
+    assert kind == 'Dialogue'
+    assert fields[-1] == '你好, 世界,再见'
+    assert sub.events[2][1][-1] == '{\\pos(10,20)}第三句'
+    # 未修改时写回的内容与原文一致
+    assert sub.serialize() == ASS
+
+
+def test_parse_srt():
+    sub = SubtitleFile.parse_srt(SRT)
+    assert len(sub) == 2
+    assert list(sub.starts) == [1000, 10500]
+    assert list(sub.ends) == [2500, 12000]
+    assert sub.events[0] == ('', ['第一行, 带逗号', '第二行'])
+    assert sub.events[1] == (' X1:0', ['第二句'])
+
+
+def test_shift_clamps_at_zero():
+    sub = SubtitleFile.parse_ass(ASS).shift(-2000)
+    assert list(sub.starts) == [0, 3000, 58250]
+    assert list(sub.ends) == [1500, 4000, 60000]
+    assert 'Dialogue: 0,0:00:00.00,0:00:01.50,Default,,0,0,0,,你好, 世界,再见' in sub.serialize()
+
+
+def test_slice_rebases_and_clips_to_window():
+    sub = SubtitleFile.parse_ass(ASS).slice(2000, 5500)
+    assert list(sub.starts) == [0, 3000]
+    assert list(sub.ends) == [1500, 3500]
+    text = sub.serialize()
+    assert 'Style: Default,Arial,20' in text
+    assert '第三句' not in text
+
+    srt = SubtitleFile.parse_srt(SRT).slice(11000, 20000)
+    assert list(srt.starts) == [0]
+    assert list(srt.ends) == [1000]
+    assert srt.serialize().startswith('1\n00:00:00,000 --> 00:00:01,000 X1:0\n第二句')
+
+
+def test_detect_encoding():
+    text = '中文字幕'
+    assert detect_encoding(codecs.BOM_UTF8 + text.encode('utf-8')) == 'utf-8-sig'
+    assert detect_encoding(text.encode('utf-16')) == 'utf-16'
+    assert detect_encoding(text.encode('utf-8')) == 'utf-8'
+    assert detect_encoding(text.encode('gbk')) == 'gbk'
+
+
+def test_load_detects_encoding_and_format(tmp_path):
+    path = tmp_path / 'episode.srt'
+    path.write_bytes(SRT.encode('gbk'))
+    sub = SubtitleFile.load(str(path))
+    assert sub.format == 'srt'
+    assert sub.events[1][1] == ['第二句']
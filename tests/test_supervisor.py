@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from supervisor import JobCancelled, ProcessSupervisor, ProcessTimeout
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="用 sh 构造关闭输出后继续运行的子进程")
+
+# 关闭标准输出和标准错误后继续运行
+SILENT_SLEEP = ['sh', '-c', 'exec >/dev/null 2>&1; sleep 30']
+
+
+def test_run_reports_exit_code_and_output():
+    supervisor = ProcessSupervisor()
+    lines = []
+    supervisor.run(['sh', '-c', 'echo hello'], lines.append)
+    assert lines == ['hello']
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        supervisor.run(['sh', '-c', 'echo oops; exit 3'])
+    assert error.value.returncode == 3
+    assert 'oops' in error.value.output
+
+
+def test_cancel_after_output_closed():
+    supervisor = ProcessSupervisor()
+    threading.Timer(0.5, supervisor.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        supervisor.run(SILENT_SLEEP)
+    assert time.monotonic() - started < 10
+
+
+def test_timeout_after_output_closed():
+    supervisor = ProcessSupervisor(stage_timeouts={'burn': 1})
+    started = time.monotonic()
+    with pytest.raises(ProcessTimeout):
+        supervisor.run(SILENT_SLEEP, stage='burn')
+    assert time.monotonic() - started < 10
@@ -0,0 +1,60 @@
+import os
+
+from tail_cache import TailCache
+
+PARAMS = {'width': 1920, 'height': 1080, 'r_frame_rate': '24000/1001'}
+
+
+def write(path, size=100):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return str(path)
+
+
+def put(cache, tmp_path, name, size=100):
+    return cache.put(name, write(tmp_path / f"{name}.src.ts", size))
+
+
+def test_hit_after_put(tmp_path):
+    cache = TailCache(str(tmp_path / 'cache'))
+    tail = write(tmp_path / 'tail.mp4')
+    key = cache.make_key(tail, PARAMS, 'standard')
+    assert cache.get(key) is None
+    transcoded = write(tmp_path / 'transcoded.ts')
+    path = cache.put(key, transcoded)
+    assert not os.path.exists(transcoded)
+    # 同一尾巴、同样的参数再次计算出的键命中缓存
+    assert cache.get(cache.make_key(tail, PARAMS, 'standard')) == path
+
+
+def test_miss_when_parameters_change(tmp_path):
+    cache = TailCache(str(tmp_path / 'cache'))
+    tail = write(tmp_path / 'tail.mp4')
+    key = cache.make_key(tail, PARAMS, 'standard')
+    cache.put(key, write(tmp_path / 'transcoded.ts'))
+    assert cache.get(cache.make_key(tail, dict(PARAMS, height=720), 'standard')) is None
+    assert cache.get(cache.make_key(tail, PARAMS, 'lossless')) is None
+    # 尾巴内容变化时键也不同
+    write(tmp_path / 'tail.mp4', size=200)
+    assert cache.get(cache.make_key(tail, PARAMS, 'standard')) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TailCache(str(tmp_path / 'cache'), max_bytes=250)
+    for age, name in enumerate(['a', 'b']):
+        path = put(cache, tmp_path, name)
+        os.utime(path, (1000 + age, 1000 + age))
+    # 命中 a 后它变为最近使用，超出容量时先淘汰 b
+    assert cache.get('a')
+    newest = put(cache, tmp_path, 'c')
+    assert cache.get('b') is None
+    assert cache.get('a')
+    assert cache.get('c') == newest
+
+
+def test_keeps_new_entry_larger_than_limit(tmp_path):
+    cache = TailCache(str(tmp_path / 'cache'), max_bytes=150)
+    put(cache, tmp_path, 'a')
+    path = put(cache, tmp_path, 'big', size=300)
+    assert cache.get('a') is None
+    assert cache.get('big') == path